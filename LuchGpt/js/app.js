@@ -269,6 +269,7 @@ document.addEventListener('DOMContentLoaded', () => {
         messageListContainer.scrollTop = messageListContainer.scrollHeight;
       });
     }
+    return messageElement;
   }
 
   function renderAttachmentPreviews() {
@@ -417,7 +418,15 @@ document.addEventListener('DOMContentLoaded', () => {
     let endpoint;
     let requestBody;
     let isFormDataRequest = false;
-    let headers = {};
+    // один ключ на логическое сообщение: повтор после ошибки или двойной клик
+    // несут тот же ключ, и сервер не выполняет запрос дважды
+    const filesFingerprint = attachedFilesData
+      .map(f => f.fileObject instanceof File ? `${f.fileObject.name}:${f.fileObject.size}:${f.fileObject.lastModified}` : '')
+      .join('|');
+    const idempotencyKey = idempotencyKeyFor(
+      `${isAnalyzePhotoMode ? 'image' : 'text'}:${effectiveChatId}:${userInput}:${filesFingerprint}`
+    );
+    let headers = {'Idempotency-Key': idempotencyKey};
     if (isAnalyzePhotoMode && attachedFilesData.length > 0) {
       endpoint = `/api/chat/image`;
       if (isLoggedIn && effectiveChatId !== null) {
@@ -453,8 +462,14 @@ document.addEventListener('DOMContentLoaded', () => {
       appendMessage('bot-thinking', {label: "Мысли", content: "Хмм..."});
     }
     const requiresAuthForRequest = isLoggedIn || isGuestMode;
-    const result = await handleApiRequest(endpoint, 'POST', requestBody, headers, isFormDataRequest, requiresAuthForRequest);
+    const useSocket = !isFormDataRequest && isLoggedIn && !chatSocketPending
+      && chatSocket && chatSocket.readyState === WebSocket.OPEN;
+    const result = useSocket
+      ? await sendViaChatSocket(requestBody)
+      : await handleApiRequest(endpoint, 'POST', requestBody, headers, isFormDataRequest, requiresAuthForRequest);
     if (result.success && result.data) {
+      // сообщение доставлено — следующая такая же отправка уже новый запрос
+      if (lastSubmit && lastSubmit.key === idempotencyKey) lastSubmit = null;
       let botAnswer = result.data.answer;
       const newChatIdFromServer = result.data.chat_id;
       const thinkRegex = /<think>([\s\S]*?)<\/think>/;
@@ -1104,6 +1119,7 @@ document.addEventListener('DOMContentLoaded', () => {
       }
       loadUserChats();
       loadAndRenderUserProfile();
+      openChatSocket();
     } else if (isGuestMode) {
       if (!isAnyAuthScreenOpen && !isSubscriptionScreenOpen && !isPurchaseModalOpen && !isAuthActionModalOpen && !isAttachmentLimitModalOpen && !isGenericLimitModalOpen) {
         showAppLayout();
@@ -1155,6 +1171,96 @@ document.addEventListener('DOMContentLoaded', () => {
     updateAttachButtonVisibility();
   }
 
+  function newIdempotencyKey() {
+    if (window.crypto && typeof window.crypto.randomUUID === 'function') return window.crypto.randomUUID();
+    return Date.now().toString(36) + '-' + Math.random().toString(36).slice(2);
+  }
+
+  // последняя недоставленная отправка: {fingerprint, key}
+  let lastSubmit = null;
+
+  function idempotencyKeyFor(fingerprint) {
+    if (lastSubmit && lastSubmit.fingerprint === fingerprint) return lastSubmit.key;
+    lastSubmit = {fingerprint, key: newIdempotencyKey()};
+    return lastSubmit.key;
+  }
+
+  // ───── WebSocket-канал чата: одна авторизация на соединение, стрим ответа, push профиля ─────
+  let chatSocket = null;
+  let chatSocketPending = null;
+
+  function openChatSocket() {
+    if (!isLoggedIn || !authToken || typeof WebSocket === 'undefined') return;
+    if (chatSocket && (chatSocket.readyState === WebSocket.OPEN || chatSocket.readyState === WebSocket.CONNECTING)) return;
+    const url = API_BASE_URL.replace(/^http/, 'ws') + `/api/chat/ws?token=${encodeURIComponent(authToken)}`;
+    const socket = new WebSocket(url);
+    chatSocket = socket;
+    socket.onmessage = (event) => {
+      let msg;
+      try {
+        msg = JSON.parse(event.data);
+      } catch (e) {
+        return;
+      }
+      if (msg.type === 'ping') {
+        socket.send(JSON.stringify({type: 'pong'}));
+      } else if (msg.type === 'usage') {
+        renderUserProfile(msg.profile);
+      } else if (msg.type === 'token' && chatSocketPending) {
+        chatSocketPending.parts.push(msg.data);
+        renderStreamingAnswer(chatSocketPending);
+      } else if (msg.type === 'done' && chatSocketPending) {
+        const pending = chatSocketPending;
+        chatSocketPending = null;
+        finishStreamingAnswer(pending);
+        pending.resolve({success: true, data: {chat_id: msg.chat_id, answer: msg.answer}});
+      } else if (msg.type === 'error' && chatSocketPending) {
+        const pending = chatSocketPending;
+        chatSocketPending = null;
+        finishStreamingAnswer(pending);
+        pending.resolve({success: false, error: msg.detail, status: msg.status, details: msg.detail});
+      }
+    };
+    socket.onclose = () => {
+      if (chatSocket === socket) chatSocket = null;
+      if (chatSocketPending) {
+        const pending = chatSocketPending;
+        chatSocketPending = null;
+        finishStreamingAnswer(pending);
+        pending.resolve({success: false, error: 'Соединение с сервером прервано.'});
+      }
+    };
+  }
+
+  // ответ растёт по мере прихода токенов; <think>…</think> (в т.ч. незакрытый) не показываем
+  function renderStreamingAnswer(pending) {
+    const text = pending.parts.join('').replace(/<think>[\s\S]*?(<\/think>|$)/, '').trimStart();
+    if (!text) return;
+    if (!pending.element) {
+      pending.element = appendMessage('bot-response', {text});
+      return;
+    }
+    pending.element.textContent = text;
+    if (messageListContainer) messageListContainer.scrollTop = messageListContainer.scrollHeight;
+  }
+
+  // черновик убираем: итоговый ответ (с блоком «мыслей») рисует sendMessage, как для REST
+  function finishStreamingAnswer(pending) {
+    if (pending.element) pending.element.remove();
+  }
+
+  function closeChatSocket() {
+    if (chatSocket) chatSocket.close();
+    chatSocket = null;
+  }
+
+  function sendViaChatSocket(body) {
+    return new Promise((resolve) => {
+      chatSocketPending = {resolve, parts: []};
+      chatSocket.send(JSON.stringify({type: 'message', chat_id: body.chat_id, message: body.message}));
+    });
+  }
+
   async function handleApiRequest(url, method = 'POST', body = null, headers = {}, isFormData = false, requiresAuth = true) {
     const defaultHeaders = {'Accept': 'application/json',};
     let effectiveAuthToken = requiresAuth ? (isLoggedIn ? authToken : guestAuthToken) : null;
@@ -1309,6 +1415,7 @@ document.addEventListener('DOMContentLoaded', () => {
   }
 
   function handleLogout() {
+    closeChatSocket();
     isLoggedIn = false;
     isGuestMode = false;
     authToken = null;
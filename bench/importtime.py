@@ -0,0 +1,86 @@
+"""
+bench/importtime.py — бюджет времени холодного старта.
+
+Запускает `python -X importtime -c "import <module>"` в отдельном процессе,
+разбирает вывод и печатает самые дорогие пакеты верхнего уровня.
+С --budget-ms завершается с кодом 1, если суммарное время импорта модуля
+превысило бюджет (удобно для CI, чтобы ловить регрессии).
+
+Пример:
+    TESTING=1 python bench/importtime.py web.app --budget-ms 400 --top 15
+"""
+
+import argparse
+import os
+import re
+import subprocess
+import sys
+from collections import defaultdict
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+
+# import time:       self [us] |  cumulative | imported package
+_LINE_RE = re.compile(r"^import time:\s+(\d+)\s+\|\s+(\d+)\s+\|(\s*)(\S+)\s*$")
+
+
+def measure(module: str, runs: int) -> tuple[int, dict[str, int]]:
+    """
+    Возвращает (лучшее суммарное время импорта module в мкс,
+    self-время по пакетам верхнего уровня для этого прогона).
+    """
+    best_total = None
+    best_by_pkg: dict[str, int] = {}
+    env = {**os.environ, "PYTHONDONTWRITEBYTECODE": "1"}
+    for _ in range(runs):
+        proc = subprocess.run(
+            [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+            cwd=ROOT,
+            env=env,
+            capture_output=True,
+            text=True,
+        )
+        if proc.returncode != 0:
+            sys.stderr.write(proc.stderr[-2000:])
+            raise SystemExit(f"import {module} failed")
+
+        total = 0
+        by_pkg: dict[str, int] = defaultdict(int)
+        for line in proc.stderr.splitlines():
+            m = _LINE_RE.match(line)
+            if not m:
+                continue
+            self_us, cumulative_us, indent, name = m.groups()
+            by_pkg[name.split(".")[0]] += int(self_us)
+            # модуль верхнего уровня (без отступа) — итоговое время его импорта
+            if name == module and len(indent) <= 1:
+                total = int(cumulative_us)
+
+        if best_total is None or total < best_total:
+            best_total, best_by_pkg = total, dict(by_pkg)
+    return best_total or 0, best_by_pkg
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("module", nargs="?", default="web.app")
+    parser.add_argument("--runs", type=int, default=5, help="число прогонов, берётся лучший")
+    parser.add_argument("--top", type=int, default=20, help="сколько пакетов показать")
+    parser.add_argument("--budget-ms", type=float, default=None, help="бюджет на импорт, мс")
+    args = parser.parse_args()
+
+    total_us, by_pkg = measure(args.module, args.runs)
+
+    print(f"import {args.module}: {total_us / 1000:.1f} ms (best of {args.runs})")
+    print(f"{'self, ms':>10}  package")
+    for name, us in sorted(by_pkg.items(), key=lambda kv: kv[1], reverse=True)[: args.top]:
+        print(f"{us / 1000:>10.1f}  {name}")
+
+    if args.budget_ms is not None and total_us / 1000 > args.budget_ms:
+        print(f"FAIL: {total_us / 1000:.1f} ms > budget {args.budget_ms:.1f} ms")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
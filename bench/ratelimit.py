@@ -0,0 +1,114 @@
+"""
+bench/ratelimit.py — стоимость ограничения частоты.
+
+1) MemoryBackend.take на наборе из --keys ключей: попадание в существующую
+   корзину и создание новой с LRU-вытеснением.
+2) Путь через RateLimitMiddleware (ASGI, без сервера) против голого
+   приложения: запрос на неограниченный путь, разрешённый POST на
+   /api/login/email и отклонённый (429).
+
+Пример:
+    python bench/ratelimit.py --keys 100000 --number 1000000 --requests 100000
+"""
+
+import argparse
+import asyncio
+import sys
+import time
+import timeit
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from web import ratelimit  # noqa: E402
+from web.ratelimit import MemoryBackend, RATE_LIMIT_RULES, RateLimitMiddleware, Rule  # noqa: E402
+
+
+async def _inner_app(scope, receive, send) -> None:
+    await send({"type": "http.response.start", "status": 200, "headers": []})
+    await send({"type": "http.response.body", "body": b"{}"})
+
+
+async def _receive() -> dict:
+    return {"type": "http.request", "body": b"", "more_body": False}
+
+
+async def _send(message: dict) -> None:
+    pass
+
+
+def _scope(method: str, path: str, ip: str) -> dict:
+    return {
+        "type": "http", "method": method, "path": path, "query_string": b"",
+        "headers": [], "client": (ip, 50000), "server": ("bench", 80), "scheme": "http",
+    }
+
+
+async def _per_request(app, scopes: list[dict], n: int) -> float:
+    start = time.perf_counter()
+    for i in range(n):
+        await app(scopes[i % len(scopes)], _receive, _send)
+    return (time.perf_counter() - start) / n
+
+
+async def bench_middleware(n: int) -> None:
+    # щедрое правило — разрешённый путь; скупое — каждая проверка даёт 429
+    ratelimit.RATE_LIMIT_RULES = {
+        "/api/login/email": Rule(10**9, 1),
+        "/api/login/guest": Rule(1, 10**6),
+    }
+    ratelimit.limiter = ratelimit.RateLimiter()
+    wrapped = RateLimitMiddleware(_inner_app, enabled=True)
+
+    other = [_scope("GET", "/api/chat/list", "10.0.0.1")]
+    allowed = [_scope("POST", "/api/login/email", f"10.0.{i // 256}.{i % 256}") for i in range(4096)]
+    rejected = [_scope("POST", "/api/login/guest", "10.9.9.9")]
+
+    bare = await _per_request(_inner_app, other, n)
+    print(f"bare app          {bare * 1e6:6.2f} us/request")
+    for label, scopes in (("other path", other), ("allowed POST", allowed), ("rejected (429)", rejected)):
+        per = await _per_request(wrapped, scopes, n)
+        print(f"{label:<17} {per * 1e6:6.2f} us/request  (+{(per - bare) * 1e6:.2f})")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--keys", type=int, default=100_000)
+    parser.add_argument("--number", type=int, default=1_000_000)
+    parser.add_argument("--requests", type=int, default=100_000, help="запросов через middleware")
+    args = parser.parse_args()
+
+    rule = RATE_LIMIT_RULES["/api/login/email"]
+    keys = [f"ip:/api/login/email:10.0.{i // 256 % 256}.{i % 256}#{i}" for i in range(args.keys)]
+
+    backend = MemoryBackend(max_keys=args.keys)
+    for k in keys:
+        backend.take(k, rule, time.time())
+
+    i = 0
+
+    def hit():
+        nonlocal i
+        i += 1
+        backend.take(keys[i % args.keys], rule, time.time())
+
+    per_hit = min(timeit.repeat(hit, number=args.number, repeat=3)) / args.number
+
+    j = 0
+    evicting = MemoryBackend(max_keys=args.keys // 10)
+
+    def miss():
+        nonlocal j
+        j += 1
+        evicting.take(f"new#{j}", rule, time.time())
+
+    per_miss = min(timeit.repeat(miss, number=args.number, repeat=3)) / args.number
+
+    print(f"existing bucket   {per_hit * 1e6:6.2f} us/check")
+    print(f"new bucket + LRU  {per_miss * 1e6:6.2f} us/check")
+
+    asyncio.run(bench_middleware(args.requests))
+
+
+if __name__ == "__main__":
+    main()
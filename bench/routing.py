@@ -0,0 +1,110 @@
+"""
+bench/routing.py — hedging/fallback/circuit breaker против локального фейкового провайдера.
+
+FakeProvider имитирует бэкенды MODELS с настраиваемой задержкой, хвостом
+задержек и долей ошибок. Один и тот же поток запросов прогоняется напрямую
+в основную модель и через ModelRouter; печатаются p50/p95/p99, число ошибок
+и счётчики роутера.
+
+Пример (smart деградирует: 20% ошибок и хвост в 30 с, fast — быстрый):
+    python bench/routing.py --requests 400 --smart-error 0.2 --smart-tail 30 --hedge-after 3
+"""
+
+import argparse
+import asyncio
+import logging
+import random
+import statistics
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from web import metrics, model_router as router_module  # noqa: E402
+from web.model_router import ModelRouter  # noqa: E402
+
+
+class FakeProvider:
+    """Фейковый провайдер: задержка ~ base, с вероятностью tail_p — tail сек, ошибки с error_p."""
+
+    def __init__(self, profiles: dict[str, dict[str, float]], time_scale: float):
+        self.profiles = profiles
+        self.time_scale = time_scale
+        self.calls: dict[str, int] = {mk: 0 for mk in profiles}
+
+    async def complete(self, model_key: str) -> str:
+        p = self.profiles[model_key]
+        self.calls[model_key] += 1
+        delay = p["tail"] if random.random() < p["tail_p"] else random.uniform(0.5, 1.5) * p["base"]
+        await asyncio.sleep(delay * self.time_scale)
+        if random.random() < p["error_p"]:
+            raise RuntimeError(f"{model_key}: upstream 503")
+        return f"answer from {model_key}"
+
+
+async def run(label: str, n: int, concurrency: int, fn, time_scale: float) -> None:
+    latencies: list[float] = []
+    errors = 0
+    sem = asyncio.Semaphore(concurrency)
+
+    async def one() -> None:
+        nonlocal errors
+        async with sem:
+            start = time.monotonic()
+            try:
+                await fn()
+            except Exception:
+                errors += 1
+            latencies.append((time.monotonic() - start) / time_scale)
+
+    await asyncio.gather(*(one() for _ in range(n)))
+    q = statistics.quantiles(latencies, n=100)
+    print(f"{label:<8} p50 {q[49]:6.2f}s  p95 {q[94]:6.2f}s  p99 {q[98]:6.2f}s  errors {errors}/{n}")
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--requests", type=int, default=400)
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument("--smart-base", type=float, default=4.0)
+    parser.add_argument("--smart-tail", type=float, default=30.0)
+    parser.add_argument("--smart-tail-p", type=float, default=0.1)
+    parser.add_argument("--smart-error", type=float, default=0.2)
+    parser.add_argument("--fast-base", type=float, default=1.0)
+    parser.add_argument("--hedge-after", type=float, default=0, help="0 — по скользящему p95")
+    parser.add_argument("--time-scale", type=float, default=0.01, help="сжатие времени симуляции")
+    args = parser.parse_args()
+    logging.getLogger("web.model_router").setLevel(logging.ERROR)
+
+    provider = FakeProvider(
+        {
+            "smart": {"base": args.smart_base, "tail": args.smart_tail,
+                      "tail_p": args.smart_tail_p, "error_p": args.smart_error},
+            "fast": {"base": args.fast_base, "tail": 0, "tail_p": 0, "error_p": 0.01},
+        },
+        args.time_scale,
+    )
+
+    # настройки роутера в масштабе симуляции
+    router_module.MODEL_HEDGE_ENABLED = True
+    router_module.MODEL_HEDGE_AFTER_SEC = args.hedge_after * args.time_scale
+    router_module.HEDGE_MIN_SEC = 0
+    router_module.MODEL_BREAKER_COOLDOWN_SEC = 30 * args.time_scale
+    router = ModelRouter({"premium": {"smart": ["fast"]}})
+
+    await run("direct", args.requests, args.concurrency, lambda: provider.complete("smart"), args.time_scale)
+    await run(
+        "routed",
+        args.requests,
+        args.concurrency,
+        lambda: router.call("smart", "premium", provider.complete),
+        args.time_scale,
+    )
+    print("provider calls:", provider.calls)
+    print("router:", {k: v for k, v in metrics.snapshot().items() if k.startswith("router.")})
+    print("models:", router.snapshot())
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,261 @@
+"""
+bench/search.py — задержка поиска по истории одного пользователя при росте таблицы.
+
+Строит схему chats/messages/message_terms (migrations/002_message_terms.sql)
+и наполняет её синтетическими сообщениями: словарь --vocab слов с
+распределением Ципфа, как в живом тексте. Пользователь 1 получает
+--messages сообщений, затем таблица шагами (--steps) дополняется историей
+--users других пользователей по --other-messages сообщений. После каждого
+шага для пользователя 1 сравниваются:
+ - index — запрос db.search_user_messages по message_terms;
+ - scan  — наивный просмотр его истории LIKE '%слово%' (для сравнения).
+Запросы — два слова средней частоты, последнее — префиксом (поиск при наборе).
+
+По умолчанию — SQLite в памяти (стандартная библиотека, меряет план, а не
+сервер); --mysql — БД из config (DB_*), нужен pymysql, таблицы bench_*
+удаляются после прогона.
+
+Пример:
+    python bench/search.py --messages 100000 --users 4 --other-messages 100000 --steps 2
+"""
+
+import argparse
+import itertools
+import random
+import sqlite3
+import statistics
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from web.search import index_terms, parse_terms, prefix_range  # noqa: E402
+
+SYLLABLES = (
+    "ба ва га да жа за ка ла ма на па ра са та фа ха ча ша бе ве ге де же зе ке ле ме не "
+    "пе ре се те фе хе че ше би ви ги ди зи ки ли ми ни пи ри си ти фи хи чи ши бо во го "
+    "до жо зо ко ло мо но по ро со то фо хо чо шо бу ву гу ду жу зу ку лу му ну пу ру су"
+).split()
+
+SQLITE_SCHEMA = """
+CREATE TABLE bench_chats (id INTEGER PRIMARY KEY, user_id INT NOT NULL, title TEXT);
+CREATE INDEX ix_bench_chats_user ON bench_chats (user_id, id);
+CREATE TABLE bench_messages (
+    id INTEGER PRIMARY KEY, chat_id INT NOT NULL, role TEXT NOT NULL,
+    content TEXT NOT NULL, timestamp TEXT NOT NULL
+);
+CREATE INDEX ix_bench_messages_chat ON bench_messages (chat_id, id);
+CREATE TABLE bench_message_terms (
+    user_id INT NOT NULL, term TEXT NOT NULL, message_id INT NOT NULL,
+    chat_id INT NOT NULL, tf INT NOT NULL,
+    PRIMARY KEY (user_id, term, message_id)
+) WITHOUT ROWID;
+"""
+
+MYSQL_SCHEMA = """
+CREATE TABLE bench_chats (
+    id INT PRIMARY KEY AUTO_INCREMENT, user_id INT NOT NULL, title VARCHAR(64),
+    INDEX ix_bench_chats_user (user_id, id)
+) ENGINE = InnoDB;
+CREATE TABLE bench_messages (
+    id INT PRIMARY KEY AUTO_INCREMENT, chat_id INT NOT NULL, role VARCHAR(8) NOT NULL,
+    content TEXT NOT NULL, timestamp DATETIME NOT NULL,
+    INDEX ix_bench_messages_chat (chat_id, id)
+) ENGINE = InnoDB;
+CREATE TABLE bench_message_terms (
+    user_id INT NOT NULL,
+    term VARCHAR(64) CHARACTER SET utf8mb4 COLLATE utf8mb4_bin NOT NULL,
+    message_id INT NOT NULL, chat_id INT NOT NULL, tf SMALLINT NOT NULL,
+    PRIMARY KEY (user_id, term, message_id)
+) ENGINE = InnoDB;
+"""
+
+
+def index_sql(n_exact: int, least: str, ph: str) -> str:
+    """SQL db.search_user_messages из migrations/002 (ph — плейсхолдер драйвера)."""
+    branches = [
+        f"SELECT {i} AS qi, message_id, chat_id, tf FROM bench_message_terms "
+        f"WHERE user_id = {ph} AND term = {ph}"
+        for i in range(n_exact)
+    ]
+    branches.append(
+        f"SELECT {n_exact} AS qi, message_id, chat_id, tf FROM bench_message_terms "
+        f"WHERE user_id = {ph} AND term >= {ph} AND term < {ph}"
+    )
+    return f"""
+SELECT p.message_id, p.chat_id, c.title, m.role, m.content, m.timestamp, p.score
+FROM (
+    SELECT message_id, chat_id, COUNT(DISTINCT qi) + SUM({least}(tf, 5)) / 100.0 AS score
+    FROM ({" UNION ALL ".join(branches)}) hits
+    GROUP BY message_id, chat_id
+    ORDER BY score DESC, message_id DESC
+    LIMIT 21
+) p
+JOIN bench_chats c ON c.id = p.chat_id
+JOIN bench_messages m ON m.id = p.message_id
+ORDER BY p.score DESC, p.message_id DESC
+"""
+
+
+def scan_sql(n_terms: int, ph: str) -> str:
+    where = " OR ".join([f"m.content LIKE {ph}"] * n_terms)
+    return f"""
+SELECT m.id, m.chat_id, c.title, m.role, m.content, m.timestamp
+FROM bench_chats c JOIN bench_messages m ON m.chat_id = c.id
+WHERE c.user_id = {ph} AND ({where})
+ORDER BY m.id DESC LIMIT 21
+"""
+
+
+class Corpus:
+    """Синтетический словарь с частотами по Ципфу."""
+
+    def __init__(self, vocab: int, seed: int = 42):
+        self.rnd = random.Random(seed)
+        words: set[str] = set()
+        while len(words) < vocab:
+            words.add("".join(self.rnd.choice(SYLLABLES) for _ in range(self.rnd.randint(2, 4))))
+        self.words = sorted(words, key=lambda _: self.rnd.random())
+        self.cum_weights = list(itertools.accumulate(1 / rank for rank in range(1, vocab + 1)))
+
+    def message(self) -> str:
+        return " ".join(self.rnd.choices(self.words, cum_weights=self.cum_weights, k=self.rnd.randint(8, 80)))
+
+    def query(self, rnd: random.Random) -> str:
+        # слова средней частоты: не стоп-слова и не уникальные
+        a, b = rnd.sample(self.words[100:3000], 2)
+        return f"{a} {b[:4]}"
+
+
+class Bench:
+    def __init__(self, conn, backend: str):
+        self.conn = conn
+        self.backend = backend
+        self.ph = "?" if backend == "sqlite" else "%s"
+        self.least = "MIN" if backend == "sqlite" else "LEAST"
+
+    def execute(self, sql: str, params=()):
+        cur = self.conn.cursor()
+        cur.execute(sql, params)
+        return cur
+
+    def executemany(self, sql: str, rows) -> None:
+        self.conn.cursor().executemany(sql, rows)
+
+    def create(self) -> None:
+        self.drop()
+        schema = SQLITE_SCHEMA if self.backend == "sqlite" else MYSQL_SCHEMA
+        for stmt in filter(str.strip, schema.split(";")):
+            self.execute(stmt)
+
+    def drop(self) -> None:
+        for table in ("bench_message_terms", "bench_messages", "bench_chats"):
+            self.execute(f"DROP TABLE IF EXISTS {table}")
+
+    def seed_user(self, corpus: Corpus, user_id: int, messages: int, per_chat: int) -> None:
+        ph = self.ph
+        first_chat = self.execute("SELECT COALESCE(MAX(id), 0) FROM bench_chats").fetchone()[0] + 1
+        n_chats = max(1, -(-messages // per_chat))
+        self.executemany(
+            f"INSERT INTO bench_chats (id, user_id, title) VALUES ({ph}, {ph}, {ph})",
+            [(first_chat + i, user_id, f"Чат {i}") for i in range(n_chats)],
+        )
+        next_id = self.execute("SELECT COALESCE(MAX(id), 0) FROM bench_messages").fetchone()[0] + 1
+        for start in range(0, messages, 5000):
+            rows, postings = [], []
+            for i in range(start, min(messages, start + 5000)):
+                msg_id, chat_id, text = next_id + i, first_chat + i // per_chat, corpus.message()
+                rows.append((msg_id, chat_id, "user" if i % 2 else "bot", text, "2026-01-01 00:00:00"))
+                # как web.search_index.build_postings
+                postings.extend((user_id, term, msg_id, chat_id, tf) for term, tf in index_terms(text).items())
+            self.executemany(
+                f"INSERT INTO bench_messages (id, chat_id, role, content, timestamp) VALUES ({ph}, {ph}, {ph}, {ph}, {ph})",
+                rows,
+            )
+            self.executemany(
+                f"INSERT INTO bench_message_terms (user_id, term, message_id, chat_id, tf) "
+                f"VALUES ({ph}, {ph}, {ph}, {ph}, {ph})",
+                postings,
+            )
+        self.conn.commit()
+
+    def timed(self, sql: str, params: tuple) -> float:
+        start = time.perf_counter()
+        self.execute(sql, params).fetchall()
+        return time.perf_counter() - start
+
+    def measure(self, corpus: Corpus, queries: int, scan: bool) -> tuple[list[float], list[float]]:
+        rnd = random.Random(7)
+        index, naive = [], []
+        for _ in range(queries):
+            terms = parse_terms(corpus.query(rnd))
+            exact, lo_hi = terms[:-1], prefix_range(terms[-1])
+            params = tuple(p for t in exact for p in (1, t)) + (1, *lo_hi)
+            index.append(self.timed(index_sql(len(exact), self.least, self.ph), params))
+            if scan:
+                naive.append(self.timed(scan_sql(len(terms), self.ph), (1, *(f"%{t}%" for t in terms))))
+        return index, naive
+
+
+def p50_p95(samples: list[float]) -> str:
+    if not samples:
+        return "—"
+    q = statistics.quantiles(samples, n=100)
+    return f"{q[49] * 1000:7.1f} / {q[94] * 1000:7.1f} ms"
+
+
+def connect(use_mysql: bool):
+    if not use_mysql:
+        return Bench(sqlite3.connect(":memory:"), "sqlite")
+    import pymysql
+
+    from config import DB_HOST, DB_NAME, DB_PASSWORD, DB_PORT, DB_USER
+
+    conn = pymysql.connect(
+        host=DB_HOST, port=int(DB_PORT or 3306), user=DB_USER,
+        password=DB_PASSWORD, database=DB_NAME, charset="utf8mb4",
+    )
+    return Bench(conn, "mysql")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--messages", type=int, default=100_000, help="сообщений у пользователя 1")
+    parser.add_argument("--users", type=int, default=4, help="других пользователей")
+    parser.add_argument("--other-messages", type=int, default=100_000, help="сообщений у каждого другого")
+    parser.add_argument("--steps", type=int, default=2, help="на сколько шагов делить других")
+    parser.add_argument("--per-chat", type=int, default=400)
+    parser.add_argument("--vocab", type=int, default=30_000)
+    parser.add_argument("--queries", type=int, default=50)
+    parser.add_argument("--no-scan", action="store_true", help="не мерить наивный просмотр")
+    parser.add_argument("--mysql", action="store_true", help="БД из config вместо SQLite")
+    args = parser.parse_args()
+
+    bench = connect(args.mysql)
+    corpus = Corpus(args.vocab)
+    try:
+        bench.create()
+        seed_start = time.perf_counter()
+        bench.seed_user(corpus, 1, args.messages, args.per_chat)
+        print(f"{bench.backend}: user 1 — {args.messages} messages "
+              f"(seeded in {time.perf_counter() - seed_start:.0f}s); p50 / p95 per query")
+        print(f"{'messages':>10}  {'postings':>10}  {'index':>21}  {'scan':>21}")
+        next_user = 2
+        for step in range(args.steps + 1):
+            if step:
+                for _ in range(args.users // args.steps):
+                    bench.seed_user(corpus, next_user, args.other_messages, args.per_chat)
+                    next_user += 1
+            messages = bench.execute("SELECT COUNT(*) FROM bench_messages").fetchone()[0]
+            postings = bench.execute("SELECT COUNT(*) FROM bench_message_terms").fetchone()[0]
+            index, naive = bench.measure(corpus, args.queries, scan=not args.no_scan)
+            print(f"{messages:>10}  {postings:>10}  {p50_p95(index):>21}  {p50_p95(naive):>21}")
+    finally:
+        if args.mysql:
+            bench.drop()
+        bench.conn.close()
+
+
+if __name__ == "__main__":
+    main()
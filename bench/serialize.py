@@ -0,0 +1,114 @@
+"""
+bench/serialize.py — CPU на сериализацию самых тяжёлых ответов API.
+
+Сравнивает прежний путь FastAPI (валидация List[MessageOut] + jsonable_encoder
++ json.dumps) с FastJSONResponse для истории чата (240 длинных сообщений)
+и списка чатов (ORM-объекты через jsonable_encoder).
+
+Пример:
+    python bench/serialize.py --messages 240 --chats 200
+"""
+
+import argparse
+import gzip
+import json
+import sys
+import timeit
+from datetime import datetime, timedelta
+from enum import Enum
+from pathlib import Path
+from typing import List
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from fastapi.encoders import jsonable_encoder  # noqa: E402
+from pydantic import BaseModel, TypeAdapter  # noqa: E402
+
+from web.responses import FastJSONResponse, message_rows, orjson, row_to_dict  # noqa: E402
+
+
+class Role(Enum):
+    USER = "user"
+    BOT = "bot"
+
+
+class MessageOut(BaseModel):  # копия web.routes.MessageOut (без импорта db)
+    id: int
+    role: str
+    content: str
+    timestamp: datetime
+    prompt_tokens: int | None
+    completion_tokens: int | None
+
+
+class FakeMessage:
+    def __init__(self, i: int):
+        self.id = i
+        self.role = Role.USER if i % 2 else Role.BOT
+        self.content = ("Длинный ответ модели с формулами и кодом. " * 40)[: 1500 + i % 300]
+        self.timestamp = datetime(2026, 1, 1) + timedelta(seconds=i)
+        self.prompt_tokens = None if i % 2 else 120 + i
+        self.completion_tokens = None if i % 2 else 800 + i
+
+
+class FakeChat:
+    def __init__(self, i: int):
+        self._sa_instance_state = object()
+        self.id = i
+        self.user_id = 1
+        self.title = f"Чат {i}"
+        self.model_key = "fast"
+        self.is_active = i == 0
+        self.created_at = datetime(2026, 1, 1) + timedelta(hours=i)
+        self.last_interaction_at = self.created_at + timedelta(minutes=5)
+
+
+def _legacy_messages(messages) -> bytes:
+    rows = message_rows(messages)
+    validated = TypeAdapter(List[MessageOut]).validate_python(rows)
+    return json.dumps(jsonable_encoder(validated), ensure_ascii=False).encode("utf-8")
+
+
+def _legacy_chats(chats) -> bytes:
+    return json.dumps(jsonable_encoder(chats), ensure_ascii=False).encode("utf-8")
+
+
+def _fast_messages(messages) -> bytes:
+    return FastJSONResponse(message_rows(messages)).body
+
+
+def _fast_chats(chats) -> bytes:
+    return FastJSONResponse([row_to_dict(c) for c in chats]).body
+
+
+def _report(name: str, fn, arg, number: int) -> float:
+    per_call = min(timeit.repeat(lambda: fn(arg), number=number, repeat=5)) / number
+    body = fn(arg)
+    print(
+        f"{name:<22} {per_call * 1e6:>9.0f} us/req  "
+        f"{len(body) / 1024:>7.1f} KiB  gzip {len(gzip.compress(body)) / 1024:>6.1f} KiB"
+    )
+    return per_call
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--messages", type=int, default=240)
+    parser.add_argument("--chats", type=int, default=200)
+    parser.add_argument("--number", type=int, default=50)
+    args = parser.parse_args()
+
+    messages = [FakeMessage(i) for i in range(args.messages)]
+    chats = [FakeChat(i) for i in range(args.chats)]
+
+    print(f"encoder: {'orjson' if orjson is not None else 'stdlib json'}")
+    legacy = _report("history / legacy", _legacy_messages, messages, args.number)
+    fast = _report("history / fast", _fast_messages, messages, args.number)
+    print(f"{'':<22} x{legacy / fast:.1f}")
+    legacy = _report("chat list / legacy", _legacy_chats, chats, args.number)
+    fast = _report("chat list / fast", _fast_chats, chats, args.number)
+    print(f"{'':<22} x{legacy / fast:.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,132 @@
+"""
+bench/ws_vs_rest.py — сообщений в секунду: WebSocket-канал против POST /api/chat/message.
+
+БД и модель подменяются in-memory заглушками с настраиваемой задержкой,
+чтобы измерять именно накладные расходы веб-слоя: цепочку
+get_current_subject → get_or_create_user → set_active_chat → ... на каждый
+REST-запрос против однократной аутентификации на WebSocket-соединение.
+
+Пример:
+    python bench/ws_vs_rest.py --messages 300 --db-latency-ms 1
+"""
+
+import argparse
+import asyncio
+import os
+import sys
+import time
+import types
+from enum import Enum
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+os.environ.setdefault("TESTING", "1")
+os.environ.setdefault("JWT_SECRET_KEY", "bench-secret")
+
+DB_LATENCY = 0.0
+
+
+def _install_fakes() -> None:
+    """Заглушки db и bot.* (только для бенчмарка)."""
+
+    class SubscriptionStatus(Enum):
+        FREE = "free"
+        PREMIUM = "premium"
+
+    class Obj:
+        def __init__(self, **kw):
+            self.__dict__.update(kw)
+
+    user = Obj(
+        id=1,
+        email="bench@example.com",
+        default_model_key="fast",
+        subscription_status=SubscriptionStatus.PREMIUM,
+        subscription_expires_at=None,
+    )
+    chat = Obj(id=1, model_key="fast", title=None)
+
+    def query(result=None):
+        async def _fn(*_args, **_kwargs):
+            if DB_LATENCY:
+                await asyncio.sleep(DB_LATENCY)
+            return result
+        return _fn
+
+    db = types.ModuleType("db")
+    db.SubscriptionStatus = SubscriptionStatus
+    db.get_or_create_user = query(user)
+    db.get_user_by_email = query(user)
+    db.get_active_chat = query(chat)
+    db.create_chat = query(chat)
+    db.get_user_chats = query([chat])
+    db.get_user_message_count = query(0)
+    db.get_today_usage = query(0)
+    db.get_today_total_usage = query(0)
+    db.__getattr__ = lambda name: query(None)
+    sys.modules["db"] = db
+
+    class LimitExceededError(Exception):
+        pass
+
+    bot = types.ModuleType("bot")
+    bot_utils = types.ModuleType("bot.utils")
+    bot_utils.LimitExceededError = LimitExceededError
+    bot_utils.check_and_increment_usage = query(None)
+
+    class AIService:
+        async def chat_complete(self, user_id, message):
+            return "ok"
+
+    bot_ai = types.ModuleType("bot.ai_service")
+    bot_ai.AIService = AIService
+    sys.modules.update({"bot": bot, "bot.utils": bot_utils, "bot.ai_service": bot_ai})
+
+
+def bench_rest(client, token: str, n: int) -> float:
+    headers = {"Authorization": f"Bearer {token}"}
+    start = time.perf_counter()
+    for i in range(n):
+        r = client.post("/api/chat/message", json={"chat_id": 1, "message": f"q{i}"}, headers=headers)
+        r.raise_for_status()
+        client.get("/api/profile", headers=headers).raise_for_status()  # прежний опрос лимитов
+    return n / (time.perf_counter() - start)
+
+
+def bench_ws(client, token: str, n: int) -> float:
+    with client.websocket_connect(f"/api/chat/ws?token={token}") as ws:
+        assert ws.receive_json()["type"] == "ready"
+        start = time.perf_counter()
+        for i in range(n):
+            ws.send_json({"type": "message", "chat_id": 1, "message": f"q{i}"})
+            while ws.receive_json()["type"] != "usage":
+                pass
+        return n / (time.perf_counter() - start)
+
+
+def main() -> None:
+    global DB_LATENCY
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--messages", type=int, default=300)
+    parser.add_argument("--db-latency-ms", type=float, default=1.0)
+    args = parser.parse_args()
+    DB_LATENCY = args.db_latency_ms / 1000
+
+    _install_fakes()
+    from fastapi.testclient import TestClient
+    from web.app import app
+    from web.auth import create_access_token
+
+    token = create_access_token(sub="bench@example.com")
+    with TestClient(app) as client:
+        rest = bench_rest(client, token, args.messages)
+        ws = bench_ws(client, token, args.messages)
+
+    print(f"db latency {args.db_latency_ms} ms, {args.messages} messages")
+    print(f"REST      {rest:>8.1f} msg/s")
+    print(f"WebSocket {ws:>8.1f} msg/s  (x{ws / rest:.1f})")
+
+
+if __name__ == "__main__":
+    main()
@@ -3,13 +3,25 @@ from pathlib import Path
 import os
 import sys
 
-# ─────────── Load .env ───────────
+# ─────────── Load .env (один раз) ───────────
+# .env рядом с config.py; если его нет — ищем в текущем каталоге
 dotenv_path = Path(__file__).resolve().parent / ".env"
-load_dotenv(dotenv_path=dotenv_path)
+if dotenv_path.exists():
+    load_dotenv(dotenv_path=dotenv_path)
+else:
+    load_dotenv()
+
 
-# ─────────── Skip validation in testing mode ───────────
-if not os.getenv("TESTING"):
-    # ─────────── Validate critical environment variables ───────────
+# ─────────── Validate critical environment variables ───────────
+def validate_env() -> None:
+    """
+    Проверяет обязательные переменные окружения.
+    Вызывается при старте процесса (lifespan веба, запуск бота),
+    а не при импорте config — импорт остаётся дешёвым для тестов и утилит.
+    В режиме TESTING проверка пропускается.
+    """
+    if os.getenv("TESTING"):
+        return
     required_vars = {
         "BOT_TOKEN": os.getenv("BOT_TOKEN"),
         "IO_API_KEY": os.getenv("IO_API_KEY"),
@@ -26,6 +38,7 @@ if not os.getenv("TESTING"):
         )
         sys.exit(1)
 
+
 # ───────────  Telegram & AI ───────────
 BOT_TOKEN         = os.getenv("BOT_TOKEN")
 IO_API_KEY        = os.getenv("IO_API_KEY")
@@ -54,6 +67,10 @@ FREE_DAILY_LIMIT   = int(os.getenv("FREE_DAILY_LIMIT", 5))
 FREE_CHAT_LIMIT    = int(os.getenv("FREE_CHAT_LIMIT", 5))
 PREMIUM_CHAT_LIMIT = int(os.getenv("PREMIUM_CHAT_LIMIT", 60))
 
+# сколько дней usage_daily хранится посуточно (старше — в usage_monthly);
+# в БД попадает при миграции: python migrations/apply.py migrations/001_usage_daily.sql
+USAGE_DAILY_HORIZON_DAYS = int(os.getenv("USAGE_DAILY_HORIZON_DAYS", 90))
+
 # максимальное (не сбрасывающееся) число обращений гостя к ИИ
 GUEST_TOTAL_LIMIT  = int(os.getenv("GUEST_TOTAL_LIMIT", 3))
 
@@ -66,6 +83,51 @@ MODELS = {
     "vision": "meta-llama/Llama-3.2-90B-Vision-Instruct",
 }
 
+# ───────────  Маршрутизация между моделями ───────────
+# запасные модели по тарифу: {тариф: {модель: [запасные по порядку]}};
+# действуют, только если метод AIService принимает model_key — иначе вызов
+# идёт лишь в основную модель (web/routes.py, _accepts_model_key)
+MODEL_FALLBACKS = {
+    "free":    {},
+    "premium": {"smart": ["fast"]},
+}
+# hedging: параллельный запрос к запасной модели, если основная отвечает дольше порога
+MODEL_HEDGE_ENABLED   = os.getenv("MODEL_HEDGE_ENABLED", "0") == "1"
+# фиксированный порог, сек; 0 — брать скользящий p95 основной модели
+MODEL_HEDGE_AFTER_SEC = float(os.getenv("MODEL_HEDGE_AFTER_SEC", 0))
+# circuit breaker: доля ошибок в окне, после которой модель выводится из ротации
+MODEL_BREAKER_ERROR_RATE   = float(os.getenv("MODEL_BREAKER_ERROR_RATE", 0.5))
+MODEL_BREAKER_COOLDOWN_SEC = int(os.getenv("MODEL_BREAKER_COOLDOWN_SEC", 30))
+
+# ───────────  Кэш анализа изображений ───────────
+# выключен по умолчанию: ответ из кэша нужно записать в историю чата, а это
+# умеет только AIService с методом record_exchange(user_id, prompt, answer).
+# Без него кэш обходится даже при IMAGE_CACHE_ENABLED=1 (в лог — предупреждение,
+# счётчик image_cache.bypass_no_record)
+IMAGE_CACHE_ENABLED      = os.getenv("IMAGE_CACHE_ENABLED", "0") == "1"
+# каталог дискового уровня; пусто — только память
+IMAGE_CACHE_DIR          = os.getenv("IMAGE_CACHE_DIR", "")
+IMAGE_CACHE_MEMORY_ITEMS = int(os.getenv("IMAGE_CACHE_MEMORY_ITEMS", 256))
+IMAGE_CACHE_DISK_MB      = int(os.getenv("IMAGE_CACHE_DISK_MB", 512))
+IMAGE_CACHE_TTL_HOURS    = float(os.getenv("IMAGE_CACHE_TTL_HOURS", 168))
+
+# ───────────  Индекс поиска по истории (web/search_index.py) ───────────
+# без него /api/search не находит новые сообщения; достаточно одной реплики
+SEARCH_INDEX_ENABLED      = os.getenv("SEARCH_INDEX_ENABLED", "1") == "1"
+# как часто дописывать новые сообщения в индекс, сек
+SEARCH_INDEX_INTERVAL_SEC = float(os.getenv("SEARCH_INDEX_INTERVAL_SEC", 5))
+SEARCH_INDEX_BATCH_SIZE   = int(os.getenv("SEARCH_INDEX_BATCH_SIZE", 500))
+
+# ───────────  Архивация и чистка (web/archive.py) ───────────
+# включайте на одной реплике: задача не координируется между процессами
+ARCHIVE_ENABLED        = os.getenv("ARCHIVE_ENABLED", "0") == "1"
+# чаты без активности дольше стольких дней уходят в chat_archive
+ARCHIVE_AFTER_DAYS     = int(os.getenv("ARCHIVE_AFTER_DAYS", 90))
+ARCHIVE_BATCH_SIZE     = int(os.getenv("ARCHIVE_BATCH_SIZE", 200))
+ARCHIVE_INTERVAL_MIN   = int(os.getenv("ARCHIVE_INTERVAL_MIN", 60))
+# гостевые сессии старше этого удаляются, даже если лимит не исчерпан
+GUEST_SESSION_TTL_DAYS = int(os.getenv("GUEST_SESSION_TTL_DAYS", 30))
+
 # ───────────  Database ───────────
 DB_HOST     = os.getenv("DB_HOST")
 DB_PORT     = os.getenv("DB_PORT")
@@ -87,6 +149,45 @@ GOOGLE_CLIENT_ID     = os.getenv("GOOGLE_CLIENT_ID")
 GOOGLE_CLIENT_SECRET = os.getenv("GOOGLE_CLIENT_SECRET")
 # тот же URI, что в Google Console в Authorized redirect URIs
 GOOGLE_REDIRECT_URI  = os.getenv("GOOGLE_REDIRECT_URI")
-load_dotenv()
+
+# ───────────  Лимит частоты для входа/регистрации ───────────
+RATE_LIMIT_ENABLED     = os.getenv("RATE_LIMIT_ENABLED", "1") == "1"
+# redis://... — общие счётчики для всех реплик; пусто — в памяти процесса
+RATE_LIMIT_REDIS_URL   = os.getenv("RATE_LIMIT_REDIS_URL", "")
+# сколько своих reverse-proxy (nginx, ngrok) стоит перед приложением: IP клиента
+# берётся из X-Forwarded-For на столько позиций справа; 0 — заголовок игнорируется
+RATE_LIMIT_TRUST_PROXY = int(os.getenv("RATE_LIMIT_TRUST_PROXY", 0))
+# попыток с одного IP (окна — в web/ratelimit.py); за школьным NAT весь класс — один IP
+RATE_LIMIT_IP_REGISTER    = int(os.getenv("RATE_LIMIT_IP_REGISTER", 5))      # за 10 мин
+RATE_LIMIT_IP_CONFIRM     = int(os.getenv("RATE_LIMIT_IP_CONFIRM", 10))      # за 10 мин
+RATE_LIMIT_IP_LOGIN       = int(os.getenv("RATE_LIMIT_IP_LOGIN", 30))        # за 1 мин, e-mail и Google
+RATE_LIMIT_IP_GUEST       = int(os.getenv("RATE_LIMIT_IP_GUEST", 60))        # за 1 час
+# попыток на один e-mail
+RATE_LIMIT_EMAIL_REGISTER = int(os.getenv("RATE_LIMIT_EMAIL_REGISTER", 3))   # за 1 час, каждое — письмо
+RATE_LIMIT_EMAIL_CONFIRM  = int(os.getenv("RATE_LIMIT_EMAIL_CONFIRM", 5))    # за 15 мин
+# неудачных входов на пару (e-mail, IP) за 5 мин; удачные не считаются
+RATE_LIMIT_LOGIN_FAILURES = int(os.getenv("RATE_LIMIT_LOGIN_FAILURES", 5))
+
+# ───────────  Метрики ───────────
+# токен для GET /api/metrics (заголовок X-Metrics-Token); пусто — эндпоинт выключен
+METRICS_TOKEN = os.getenv("METRICS_TOKEN", "")
+
+# ───────────  Профилирование (web/profiling.py) ───────────
+# выключено — middleware не подключается, накладные расходы около нуля
+PROFILE_ENABLED       = os.getenv("PROFILE_ENABLED", "0") == "1"
+# доля запросов к /api/*, профилируемых случайно; 0 — только по заголовку
+PROFILE_SAMPLE_RATE   = float(os.getenv("PROFILE_SAMPLE_RATE", 0))
+# профиль конкретного запроса: заголовок X-Profile: <PROFILE_TOKEN>
+PROFILE_TOKEN         = os.getenv("PROFILE_TOKEN", "")
+PROFILE_DIR           = os.getenv("PROFILE_DIR", "profiles")
+# запросы дольше порога пишутся с разбивкой по этапам
+PROFILE_SLOW_MS       = int(os.getenv("PROFILE_SLOW_MS", 2000))
+# то же для вызовов модели (/api/chat/message, /api/chat/image): ответ LLM — секунды
+PROFILE_SLOW_MODEL_MS = int(os.getenv("PROFILE_SLOW_MODEL_MS", 60000))
+# сколько файлов (профили и slow-*.json) держать в PROFILE_DIR; старые удаляются
+PROFILE_MAX_FILES     = int(os.getenv("PROFILE_MAX_FILES", 500))
+# порог блокировки event loop, мс; 0 — детектор выключен
+LOOP_BLOCK_MS         = int(os.getenv("LOOP_BLOCK_MS", 0))
+
 # ───────────  Окружение ───────────
 ENV = os.getenv("ENV", "dev")
\ No newline at end of file
@@ -0,0 +1,225 @@
+-- migrations/001_usage_daily.sql
+-- Компактный счётчик использования: (user_id, day, model_key) → cnt
+--
+-- Горячие запросы (check_and_increment_usage, get_today_usage,
+-- get_today_total_usage, reset_today_usage) всегда фильтруют по user_id и day,
+-- поэтому они целиком обслуживаются кластерным первичным ключом (index-only),
+-- независимо от объёма истории. Старые дни сворачиваются в помесячные агрегаты
+-- (usage_monthly), а помесячные партиции usage_daily удаляются целиком.
+--
+-- MySQL 8.0+. У партиционированных таблиц InnoDB не бывает внешних ключей,
+-- поэтому связь с users — только логическая.
+--
+-- Применять через migrations/apply.py: он передаёт USAGE_DAILY_HORIZON_DAYS
+-- (config) в @usage_horizon_days — горизонт посуточного хранения.
+-- Без переменной — 90 дней. Повторный запуск обновляет значение.
+--
+-- Переход со старой таблицы usage(user_id, date, model_key, count):
+-- миграция копирует её в usage_daily (usage_daily_backfill) и сразу
+-- сворачивает дни старше горизонта. Пока старый db-слой ещё пишет в usage,
+-- счётчики за сегодня расходятся — после выкатки нового db-слоя ещё раз:
+--   CALL usage_daily_backfill(CURDATE());
+-- (повтор безопасен: берётся максимум из двух счётчиков, а не сумма).
+-- Таблицу usage удалять после этого шага.
+
+-- ─────────── Таблицы ───────────
+CREATE TABLE IF NOT EXISTS usage_daily (
+    user_id   INT          NOT NULL,
+    day       DATE         NOT NULL,
+    model_key VARCHAR(16)  NOT NULL,
+    cnt       INT UNSIGNED NOT NULL DEFAULT 0,
+    PRIMARY KEY (user_id, day, model_key)
+) ENGINE = InnoDB
+PARTITION BY RANGE COLUMNS (day) (
+    PARTITION pmax VALUES LESS THAN (MAXVALUE)
+);
+
+CREATE TABLE IF NOT EXISTS usage_monthly (
+    user_id   INT          NOT NULL,
+    month     DATE         NOT NULL,  -- первое число месяца
+    model_key VARCHAR(16)  NOT NULL,
+    cnt       INT UNSIGNED NOT NULL DEFAULT 0,
+    PRIMARY KEY (user_id, month, model_key)
+) ENGINE = InnoDB;
+
+-- одна строка: горизонт для ежедневного события (см. usage_rollup(NULL))
+CREATE TABLE IF NOT EXISTS usage_settings (
+    id            TINYINT  NOT NULL PRIMARY KEY DEFAULT 1,
+    horizon_days  INT      NOT NULL,
+    backfilled_at DATETIME NULL  -- когда скопирована старая таблица usage
+) ENGINE = InnoDB;
+
+INSERT INTO usage_settings (id, horizon_days)
+VALUES (1, COALESCE(@usage_horizon_days, 90))
+ON DUPLICATE KEY UPDATE horizon_days = VALUES(horizon_days);
+
+
+-- ─────────── Запросы для db-слоя ───────────
+-- check_and_increment_usage: атомарный upsert-инкремент
+--   INSERT INTO usage_daily (user_id, day, model_key, cnt)
+--   VALUES (:user_id, :day, :model_key, 1)
+--   ON DUPLICATE KEY UPDATE cnt = cnt + 1;
+--
+-- get_today_usage:
+--   SELECT cnt FROM usage_daily
+--   WHERE user_id = :user_id AND day = :day AND model_key = :model_key;
+--
+-- get_today_total_usage (и разбивка по моделям для профиля одним запросом):
+--   SELECT model_key, cnt FROM usage_daily
+--   WHERE user_id = :user_id AND day = :day;
+--
+-- reset_today_usage:
+--   DELETE FROM usage_daily WHERE user_id = :user_id AND day = :day;
+
+
+-- ─────────── Партиции: создать партицию на месяц вперёд ───────────
+DROP PROCEDURE IF EXISTS usage_daily_add_partition;
+DELIMITER //
+CREATE PROCEDURE usage_daily_add_partition(IN for_day DATE)
+BEGIN
+    DECLARE p_name VARCHAR(16);
+    DECLARE p_bound DATE;
+
+    SET p_name  = DATE_FORMAT(for_day, 'p%Y%m');
+    SET p_bound = DATE_ADD(DATE_FORMAT(for_day, '%Y-%m-01'), INTERVAL 1 MONTH);
+
+    IF NOT EXISTS (
+        SELECT 1 FROM information_schema.partitions
+        WHERE table_schema = DATABASE()
+          AND table_name = 'usage_daily'
+          AND partition_name = p_name
+    ) THEN
+        SET @ddl = CONCAT(
+            'ALTER TABLE usage_daily REORGANIZE PARTITION pmax INTO (',
+            'PARTITION ', p_name, ' VALUES LESS THAN (''', p_bound, '''), ',
+            'PARTITION pmax VALUES LESS THAN (MAXVALUE))'
+        );
+        PREPARE stmt FROM @ddl;
+        EXECUTE stmt;
+        DEALLOCATE PREPARE stmt;
+    END IF;
+END //
+DELIMITER ;
+
+
+-- ─────────── Свёртка: дни старше горизонта → usage_monthly ───────────
+-- horizon_days — сколько последних дней хранить посуточно; NULL — из usage_settings.
+-- Каждый день сворачивается отдельной транзакцией: агрегат в usage_monthly
+-- и удаление его строк из usage_daily фиксируются вместе, поэтому сбой
+-- между ними не приводит к двойному счёту при следующем запуске.
+-- Одновременные запуски исключены GET_LOCK.
+DROP PROCEDURE IF EXISTS usage_rollup;
+DELIMITER //
+CREATE PROCEDURE usage_rollup(IN horizon_days INT)
+BEGIN
+    DECLARE cutoff DATE;
+    DECLARE d DATE;
+    DECLARE done INT DEFAULT 0;
+    DECLARE p_name VARCHAR(64);
+    DECLARE p_cur CURSOR FOR
+        SELECT partition_name FROM information_schema.partitions
+        WHERE table_schema = DATABASE()
+          AND table_name = 'usage_daily'
+          AND partition_name <> 'pmax'
+          AND DATE_ADD(
+                  STR_TO_DATE(CONCAT(SUBSTRING(partition_name, 2), '01'), '%Y%m%d'),
+                  INTERVAL 1 MONTH
+              ) <= cutoff;
+    DECLARE CONTINUE HANDLER FOR NOT FOUND SET done = 1;
+    DECLARE EXIT HANDLER FOR SQLEXCEPTION
+    BEGIN
+        ROLLBACK;
+        DO RELEASE_LOCK('usage_rollup');
+        RESIGNAL;
+    END;
+
+    IF GET_LOCK('usage_rollup', 0) = 1 THEN
+        IF horizon_days IS NULL THEN
+            SELECT s.horizon_days INTO horizon_days FROM usage_settings s WHERE s.id = 1;
+        END IF;
+        SET cutoff = DATE_SUB(CURDATE(), INTERVAL COALESCE(horizon_days, 90) DAY);
+
+        -- 1) по одному дню: агрегат и удаление строк — одной транзакцией
+        SELECT MIN(day) INTO d FROM usage_daily WHERE day < cutoff;
+        WHILE d IS NOT NULL DO
+            START TRANSACTION;
+            INSERT INTO usage_monthly (user_id, month, model_key, cnt)
+            SELECT user_id, DATE_FORMAT(day, '%Y-%m-01'), model_key, SUM(cnt)
+            FROM usage_daily
+            WHERE day = d
+            GROUP BY user_id, DATE_FORMAT(day, '%Y-%m-01'), model_key
+            ON DUPLICATE KEY UPDATE cnt = usage_monthly.cnt + VALUES(cnt);
+            DELETE FROM usage_daily WHERE day = d;
+            COMMIT;
+            SELECT MIN(day) INTO d FROM usage_daily WHERE day < cutoff;
+        END WHILE;
+
+        -- 2) сбрасываем партиции, целиком лежащие до cutoff (они уже пусты)
+        OPEN p_cur;
+        drop_loop: LOOP
+            FETCH p_cur INTO p_name;
+            IF done THEN
+                LEAVE drop_loop;
+            END IF;
+            SET @ddl = CONCAT('ALTER TABLE usage_daily DROP PARTITION ', p_name);
+            PREPARE stmt FROM @ddl;
+            EXECUTE stmt;
+            DEALLOCATE PREPARE stmt;
+        END LOOP;
+        CLOSE p_cur;
+
+        -- 3) заранее готовим партиции текущего и следующего месяца
+        CALL usage_daily_add_partition(CURDATE());
+        CALL usage_daily_add_partition(DATE_ADD(CURDATE(), INTERVAL 1 MONTH));
+
+        DO RELEASE_LOCK('usage_rollup');
+    END IF;
+END //
+DELIMITER ;
+
+
+-- ─────────── Перенос из старой таблицы usage ───────────
+-- from_day — копировать дни начиная с него; NULL — всю историю, но только
+-- один раз (usage_settings.backfilled_at): дни старше горизонта после
+-- копирования сворачиваются, и повторная полная копия посчитала бы их дважды.
+-- Счётчик дня — GREATEST(новый, старый): повтор за сегодня не удваивает
+-- обращения, уже засчитанные новым db-слоем.
+DROP PROCEDURE IF EXISTS usage_daily_backfill;
+DELIMITER //
+CREATE PROCEDURE usage_daily_backfill(IN from_day DATE)
+BEGIN
+    IF EXISTS (
+        SELECT 1 FROM information_schema.tables
+        WHERE table_schema = DATABASE() AND table_name = 'usage'
+    ) AND (
+        from_day IS NOT NULL
+        OR (SELECT backfilled_at FROM usage_settings WHERE id = 1) IS NULL
+    ) THEN
+        START TRANSACTION;
+        INSERT INTO usage_daily (user_id, day, model_key, cnt)
+        SELECT u.user_id, u.`date`, u.model_key, SUM(u.`count`)
+        FROM `usage` u
+        WHERE from_day IS NULL OR u.`date` >= from_day
+        GROUP BY u.user_id, u.`date`, u.model_key
+        ON DUPLICATE KEY UPDATE cnt = GREATEST(usage_daily.cnt, VALUES(cnt));
+        UPDATE usage_settings SET backfilled_at = NOW() WHERE id = 1;
+        COMMIT;
+    END IF;
+END //
+DELIMITER ;
+
+
+-- ─────────── Ежедневный запуск (нужен event_scheduler=ON) ───────────
+-- Горизонт — из usage_settings (USAGE_DAILY_HORIZON_DAYS при миграции).
+CALL usage_daily_add_partition(CURDATE());
+CALL usage_daily_add_partition(DATE_ADD(CURDATE(), INTERVAL 1 MONTH));
+
+-- перенос истории и свёртка старых дней — сразу, не дожидаясь события
+CALL usage_daily_backfill(NULL);
+CALL usage_rollup(NULL);
+
+DROP EVENT IF EXISTS ev_usage_rollup;
+CREATE EVENT ev_usage_rollup
+    ON SCHEDULE EVERY 1 DAY
+    STARTS (CURRENT_DATE + INTERVAL 1 DAY + INTERVAL 10 MINUTE)
+    DO CALL usage_rollup(NULL);
@@ -0,0 +1,80 @@
+-- migrations/002_message_terms.sql
+-- Поиск по истории чатов пользователя (GET /api/search): инвертированный
+-- индекс слов, разбитый по пользователю.
+--
+-- Таблицы chats(id, user_id, title, ...) и messages(id, chat_id, role,
+-- content, timestamp, ...) — схема db-слоя. Слова режет web.search.index_terms
+-- (нижний регистр, \w+ длиной от MIN_TERM_LEN); индекс дополняет фоновая
+-- задача web/search_index.py по возрастанию messages.id.
+--
+-- Почему не FULLTEXT: InnoDB FULLTEXT-индекс не бывает составным с user_id,
+-- MATCH ... AGAINST сначала ищет слово по всей таблице messages (у всех
+-- пользователей) и только потом JOIN отсекает чужие строки — цена растёт с
+-- общим объёмом таблицы. Здесь первичный ключ начинается с user_id: запрос
+-- читает только постинги этого пользователя для слов запроса, и его цена
+-- зависит от частоты слов в его истории, а не от размера таблицы
+-- (bench/search.py).
+
+CREATE TABLE IF NOT EXISTS message_terms (
+    user_id    INT         NOT NULL,
+    term       VARCHAR(64) CHARACTER SET utf8mb4 COLLATE utf8mb4_bin NOT NULL,  -- порядок по кодам: префикс = диапазон
+    message_id INT         NOT NULL,
+    chat_id    INT         NOT NULL,
+    tf         SMALLINT    NOT NULL,  -- сколько раз слово встречается в сообщении
+    PRIMARY KEY (user_id, term, message_id),
+    INDEX ix_message_terms_chat (chat_id),
+    CONSTRAINT fk_message_terms_chat FOREIGN KEY (chat_id) REFERENCES chats (id) ON DELETE CASCADE
+) ENGINE = InnoDB;
+
+-- до какого messages.id индекс построен (одна строка)
+CREATE TABLE IF NOT EXISTS search_index_state (
+    id                 TINYINT NOT NULL PRIMARY KEY,
+    last_message_id    INT     NOT NULL
+) ENGINE = InnoDB;
+INSERT IGNORE INTO search_index_state (id, last_message_id) VALUES (1, 0);
+
+
+-- ─────────── Запросы для db-слоя ───────────
+-- get_search_watermark():
+--   SELECT last_message_id FROM search_index_state WHERE id = 1;
+--
+-- get_unindexed_messages(after_id, limit) — пачка для индексатора:
+--   SELECT m.id, m.chat_id, c.user_id, m.content
+--   FROM messages m JOIN chats c ON c.id = m.chat_id
+--   WHERE m.id > :after_id
+--   ORDER BY m.id
+--   LIMIT :limit;
+--
+-- add_message_terms(rows, last_message_id) — одной транзакцией; INSERT IGNORE
+--   делает повтор пачки (сбой, вторая реплика) безопасным:
+--   INSERT IGNORE INTO message_terms (user_id, term, message_id, chat_id, tf) VALUES ...;
+--   UPDATE search_index_state SET last_message_id = GREATEST(last_message_id, :last_message_id)
+--   WHERE id = 1;
+--
+-- search_user_messages(user_id, terms, prefix_range, limit, offset):
+--   :t0..:tN — слова запроса (точное совпадение), :lo/:hi — диапазон для
+--   последнего слова, набираемого по префиксу (web.search.prefix_range).
+--   Релевантность — число совпавших слов запроса, при равенстве — частота.
+--
+--   SELECT p.message_id AS id, p.chat_id, c.title AS chat_title,
+--          m.role, m.content, m.timestamp, p.score
+--   FROM (
+--     SELECT message_id, chat_id,
+--            COUNT(DISTINCT qi) + SUM(LEAST(tf, 5)) / 100 AS score
+--     FROM (
+--       SELECT 0 AS qi, message_id, chat_id, tf FROM message_terms
+--       WHERE user_id = :user_id AND term = :t0
+--       UNION ALL ...
+--       UNION ALL
+--       SELECT :n AS qi, message_id, chat_id, tf FROM message_terms
+--       WHERE user_id = :user_id AND term >= :lo AND term < :hi
+--     ) hits
+--     GROUP BY message_id, chat_id
+--     ORDER BY score DESC, message_id DESC
+--     LIMIT :limit OFFSET :offset
+--   ) p
+--   JOIN chats c ON c.id = p.chat_id
+--   LEFT JOIN messages m ON m.id = p.message_id
+--   ORDER BY p.score DESC, p.message_id DESC;
+--   У архивных чатов (migrations/004) строки messages нет — role/content/
+--   timestamp приходят NULL, web.search берёт их из chat_archive.
@@ -0,0 +1,14 @@
+-- migrations/003_messages_chat_id_keyset.sql
+-- Пачечное чтение сообщений чата для выгрузки (GET /api/export).
+--
+-- Keyset-пагинация по (chat_id, id): каждая пачка — короткий диапазонный
+-- скан индекса, без OFFSET и без загрузки всей истории в память.
+
+CREATE INDEX ix_messages_chat_id_id ON messages (chat_id, id);
+
+
+-- ─────────── Запрос для db.get_messages_batch ───────────
+--   SELECT * FROM messages
+--   WHERE chat_id = :chat_id AND id > :after_id
+--   ORDER BY id
+--   LIMIT :limit;
@@ -0,0 +1,79 @@
+-- migrations/004_chat_archive.sql
+-- Холодное хранение неактивных чатов (web/archive.py).
+--
+-- Сообщения чата, неактивного ARCHIVE_AFTER_DAYS дней, сжимаются одним
+-- zlib-блобом в chat_archive и удаляются из messages. Строка в chats
+-- остаётся (список чатов не меняется) и помечается archived_at.
+-- При открытии чата сообщения возвращаются в messages, а last_interaction_at
+-- обновляется — просмотренный чат не уходит в архив на следующем прогоне.
+-- Выгрузка (/api/export) читает архивные чаты прямо из блоба, не возвращая их.
+-- Постинги поиска (message_terms, migrations/002) при архивации остаются:
+-- архивные сообщения находятся, текст для фрагмента берётся из блоба.
+
+ALTER TABLE chats
+    ADD COLUMN archived_at DATETIME NULL,
+    ADD INDEX ix_chats_archive_scan (archived_at, last_interaction_at);
+
+CREATE TABLE IF NOT EXISTS chat_archive (
+    chat_id       INT         NOT NULL PRIMARY KEY,
+    user_id       INT         NOT NULL,
+    message_count INT         NOT NULL,
+    payload       LONGBLOB    NOT NULL,  -- zlib(JSON {"v": 1, "messages": [...]})
+    archived_at   DATETIME    NOT NULL,
+    INDEX ix_chat_archive_user (user_id)
+) ENGINE = InnoDB ROW_FORMAT = DYNAMIC;
+
+
+-- ─────────── Запросы для db-слоя ───────────
+-- get_cold_chats(before, limit):
+--   SELECT id FROM chats
+--   WHERE archived_at IS NULL AND last_interaction_at < :before
+--   ORDER BY last_interaction_at LIMIT :limit;
+--
+-- get_chat_messages(chat_id):
+--   SELECT * FROM messages WHERE chat_id = :chat_id ORDER BY id;
+--
+-- archive_chat(chat_id, before, max_message_id, payload, message_count) -> bool
+--   Одной транзакцией. Между чтением сообщений и этой транзакцией в чат
+--   могли написать, поэтому холодность перепроверяется под блокировкой
+--   строки чата, а удаляются только сообщения с id <= :max_message_id
+--   (последнее упакованное; 0 — чат был пуст):
+--   SELECT id FROM chats
+--   WHERE id = :chat_id AND archived_at IS NULL AND last_interaction_at < :before
+--   FOR UPDATE;
+--     -- нет строки → ROLLBACK, вернуть False (чат ожил или уже в архиве)
+--   SELECT 1 FROM messages WHERE chat_id = :chat_id AND id > :max_message_id LIMIT 1;
+--     -- есть строка → ROLLBACK, вернуть False (новое сообщение, а
+--     -- last_interaction_at ещё не обновлён)
+--   INSERT INTO chat_archive (chat_id, user_id, message_count, payload, archived_at)
+--   SELECT id, user_id, :message_count, :payload, NOW() FROM chats WHERE id = :chat_id;
+--   DELETE FROM messages WHERE chat_id = :chat_id AND id <= :max_message_id;
+--   UPDATE chats SET archived_at = NOW() WHERE id = :chat_id;
+--   COMMIT, вернуть True.
+--   Даже если сообщение вставят после проверки, DELETE его не заденет: оно
+--   останется в messages, а восстановление вернёт архив рядом с ним.
+--
+-- load_archived_chat(chat_id):
+--   SELECT payload FROM chat_archive WHERE chat_id = :chat_id;
+--
+-- restore_chat_messages(chat_id, messages) — одной транзакцией; сначала
+--   SELECT chat_id FROM chat_archive WHERE chat_id = :chat_id FOR UPDATE,
+--   и если строки уже нет (восстановила другая реплика) — ничего не делать:
+--   INSERT INTO messages (id, chat_id, role, content, timestamp, prompt_tokens, completion_tokens)
+--   VALUES ... (исходные id сохраняют порядок);
+--   DELETE FROM chat_archive WHERE chat_id = :chat_id;
+--   UPDATE chats SET archived_at = NULL, last_interaction_at = NOW() WHERE id = :chat_id;
+--
+-- purge_expired_confirmation_codes(limit):
+--   DELETE FROM email_confirmation_codes WHERE expires_at < NOW() LIMIT :limit;
+--   DELETE FROM google_email_confirmations WHERE expires_at < NOW() LIMIT :limit;
+--
+-- purge_exhausted_guest_sessions(max_requests, before, limit):
+--   DELETE FROM guest_sessions
+--   WHERE request_count >= :max_requests OR created_at < :before
+--   LIMIT :limit;
+--
+-- get_table_stats(tables):
+--   SELECT table_name, table_rows, data_length + index_length AS bytes
+--   FROM information_schema.tables
+--   WHERE table_schema = DATABASE() AND table_name IN :tables;
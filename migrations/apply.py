@@ -0,0 +1,69 @@
+"""
+migrations/apply.py — применяет SQL-миграции к БД из config.
+
+Файлы выполняются клиентом mysql (он понимает DELIMITER в процедурах)
+по одному, в указанном порядке. Перед каждым файлом в сессии задаются
+переменные из config, которые читают миграции:
+ - @usage_horizon_days ← USAGE_DAILY_HORIZON_DAYS (migrations/001).
+Поэтому для смены горизонта достаточно поменять переменную окружения
+и повторно применить 001 — она идемпотентна.
+
+Миграции 003/004 меняют схему ALTER TABLE и повторно не применяются —
+передавайте только новые файлы.
+
+Пример:
+    python migrations/apply.py migrations/001_usage_daily.sql
+"""
+
+import argparse
+import os
+import subprocess
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from config import (  # noqa: E402
+    DB_HOST,
+    DB_NAME,
+    DB_PASSWORD,
+    DB_PORT,
+    DB_USER,
+    USAGE_DAILY_HORIZON_DAYS,
+)
+
+
+def session_vars() -> dict[str, int]:
+    """Переменные сессии, которые миграции берут из config."""
+    return {"usage_horizon_days": USAGE_DAILY_HORIZON_DAYS}
+
+
+def apply(path: Path) -> None:
+    init = "; ".join(f"SET @{name} = {int(value)}" for name, value in session_vars().items())
+    command = [
+        "mysql",
+        f"--host={DB_HOST}",
+        f"--port={int(DB_PORT or 3306)}",
+        f"--user={DB_USER}",
+        "--default-character-set=utf8mb4",
+        f"--init-command={init}",
+        DB_NAME,
+    ]
+    # пароль — через окружение, чтобы не светить его в списке процессов
+    env = {**os.environ, "MYSQL_PWD": DB_PASSWORD}
+    with path.open("rb") as sql:
+        subprocess.run(command, stdin=sql, env=env, check=True)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("files", nargs="+", type=Path, help="файлы миграций по порядку")
+    args = parser.parse_args()
+
+    for path in args.files:
+        print(f"applying {path} ({', '.join(f'@{k}={v}' for k, v in session_vars().items())})")
+        apply(path)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,124 @@
+"""
+Окружение для тестов веб-слоя.
+
+config.py в репозитории нет (он создаётся из config.example.py), а db и bot
+живут в другом пакете — поэтому здесь подставляются config.example.py
+и in-memory заглушки db / bot.utils / bot.ai_service. Тесты проверяют
+именно web.app: маршруты, middleware, отмену и т. п.
+"""
+
+import asyncio
+import importlib.util
+import os
+import sys
+import types
+from enum import Enum
+from pathlib import Path
+
+import pytest
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+os.environ.setdefault("TESTING", "1")
+os.environ.setdefault("JWT_SECRET_KEY", "test-secret")
+
+
+def _install_config() -> None:
+    try:
+        import config  # noqa: F401
+    except ImportError:
+        spec = importlib.util.spec_from_file_location("config", ROOT / "config.example.py")
+        module = importlib.util.module_from_spec(spec)
+        sys.modules["config"] = module
+        spec.loader.exec_module(module)
+
+
+class SubscriptionStatus(Enum):
+    FREE = "free"
+    PREMIUM = "premium"
+
+
+class Obj:
+    def __init__(self, **kw):
+        self.__dict__.update(kw)
+
+
+class FakeAIService:
+    """Модель с настраиваемой задержкой; помнит, отменяли ли вызов."""
+
+    def __init__(self):
+        self.delay = 0.0
+        self.calls = 0
+        self.cancelled = 0
+
+    async def chat_complete(self, user_id, message, **kwargs):
+        self.calls += 1
+        try:
+            await asyncio.sleep(self.delay)
+        except asyncio.CancelledError:
+            self.cancelled += 1
+            raise
+        return f"answer to {message}"
+
+    async def analyze_image_bytes(self, user_id, image_bytes, prompt, **kwargs):
+        self.calls += 1
+        return f"image of {len(image_bytes)} bytes"
+
+
+def _install_fakes() -> None:
+    user = Obj(
+        id=1,
+        email="user@example.com",
+        default_model_key="fast",
+        subscription_status=SubscriptionStatus.PREMIUM,
+        subscription_expires_at=None,
+    )
+    chat = Obj(id=1, model_key="fast", title=None, archived_at=None)
+
+    def query(result=None):
+        async def _fn(*_args, **_kwargs):
+            return result
+        return _fn
+
+    db = types.ModuleType("db")
+    db.SubscriptionStatus = SubscriptionStatus
+    db.get_or_create_user = query(user)
+    db.get_user_by_email = query(user)
+    db.get_active_chat = query(chat)
+    db.create_chat = query(chat)
+    db.get_user_chats = query([chat])
+    db.get_user_message_count = query(0)
+    db.get_today_usage = query(0)
+    db.get_today_total_usage = query(0)
+    db.__getattr__ = lambda name: query(None)
+
+    class LimitExceededError(Exception):
+        pass
+
+    bot = types.ModuleType("bot")
+    bot_utils = types.ModuleType("bot.utils")
+    bot_utils.LimitExceededError = LimitExceededError
+    bot_utils.check_and_increment_usage = query(None)
+    bot_ai = types.ModuleType("bot.ai_service")
+    bot_ai.AIService = FakeAIService
+    sys.modules.update({"db": db, "bot": bot, "bot.utils": bot_utils, "bot.ai_service": bot_ai})
+
+
+_install_config()
+_install_fakes()
+
+
+@pytest.fixture
+def ai_service():
+    from web import routes
+
+    service = routes.get_ai_service()
+    service.delay, service.calls, service.cancelled = 0.0, 0, 0
+    return service
+
+
+@pytest.fixture
+def auth_header():
+    from web.auth import create_access_token
+
+    return {"Authorization": f"Bearer {create_access_token(sub='user@example.com')}"}
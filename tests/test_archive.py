@@ -0,0 +1,99 @@
+"""Архивные чаты: восстановление при открытии, выгрузка из блоба."""
+
+import asyncio
+import json
+import os
+import sys
+from datetime import datetime
+
+from fastapi.testclient import TestClient
+
+from web import archive
+from web.app import app
+from web.archive import ensure_chat_hot, pack_messages
+from conftest import Obj
+
+
+def test_concurrent_restore_runs_once_and_frees_lock(monkeypatch):
+    db = sys.modules["db"]
+    payload = pack_messages([])
+    restored = []
+
+    async def load_archived_chat(chat_id):
+        await asyncio.sleep(0.01)
+        return payload if not restored else None
+
+    async def restore_chat_messages(chat_id, messages):
+        await asyncio.sleep(0.01)
+        restored.append(chat_id)
+
+    monkeypatch.setattr(db, "load_archived_chat", load_archived_chat, raising=False)
+    monkeypatch.setattr(db, "restore_chat_messages", restore_chat_messages, raising=False)
+
+    async def main():
+        # у каждого запроса свой объект чата из БД, все с archived_at
+        chats = [Obj(id=7, archived_at="2026-01-01") for _ in range(5)]
+        await asyncio.gather(*(ensure_chat_hot(chat) for chat in chats))
+        return chats
+
+    chats = asyncio.run(main())
+    assert restored == [7]
+    assert all(chat.archived_at is None for chat in chats)
+    assert archive._restore_locks == {}
+
+
+def _archived_db(monkeypatch):
+    """Чат 7 в архиве с двумя сообщениями; возвращает список восстановлений."""
+    db = sys.modules["db"]
+    payload = pack_messages([
+        Obj(id=i, role=Obj(value=role), content=text, timestamp=datetime(2026, 1, 1, 12, i),
+            prompt_tokens=0, completion_tokens=0)
+        for i, role, text in ((1, "user", "вопрос"), (2, "bot", "ответ"))
+    ])
+    chat = Obj(id=7, model_key="fast", title="Старый", archived_at=datetime(2026, 1, 2))
+    restored = []
+
+    async def load_archived_chat(chat_id):
+        return payload
+
+    async def restore_chat_messages(chat_id, messages):
+        restored.append(chat_id)
+
+    async def get_user_chats(user_id):
+        return [chat]
+
+    async def get_active_chat(user_id):
+        return chat
+
+    for name, fn in (("load_archived_chat", load_archived_chat),
+                     ("restore_chat_messages", restore_chat_messages),
+                     ("get_user_chats", get_user_chats),
+                     ("get_active_chat", get_active_chat)):
+        monkeypatch.setattr(db, name, fn, raising=False)
+    return restored
+
+
+def test_export_reads_archive_without_restoring(monkeypatch, auth_header):
+    restored = _archived_db(monkeypatch)
+    with TestClient(app) as client:
+        response = client.get("/api/export", params={"after_chat_id": 7, "after_message_id": 1}, headers=auth_header)
+
+    assert response.status_code == 200
+    lines = [json.loads(line) for line in response.text.splitlines()]
+    assert [line["type"] for line in lines] == ["chat", "message"]
+    assert lines[1]["id"] == 2 and lines[1]["content"] == "ответ" and lines[1]["chat_id"] == 7
+    assert restored == []
+
+
+def test_image_upload_restores_archived_chat(monkeypatch, ai_service, auth_header):
+    restored = _archived_db(monkeypatch)
+    with TestClient(app) as client:
+        response = client.post(
+            "/api/chat/image",
+            headers=auth_header,
+            params={"chat_id": "7"},
+            files={"file": ("shot.png", os.urandom(64), "image/png")},
+        )
+
+    assert response.status_code == 200
+    assert restored == [7]
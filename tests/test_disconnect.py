@@ -0,0 +1,76 @@
+"""Отмена вызова модели при отключении клиента — через всё приложение web.app."""
+
+import asyncio
+import json
+import time
+
+from web import metrics
+from web.app import app
+
+
+async def _post_and_disconnect(path: str, body: dict, headers: dict, disconnect_after: float):
+    """POST по голому ASGI; через disconnect_after сек клиент «закрывает вкладку»."""
+    raw = json.dumps(body).encode()
+    scope = {
+        "type": "http",
+        "asgi": {"version": "3.0"},
+        "http_version": "1.1",
+        "method": "POST",
+        "scheme": "http",
+        "path": path,
+        "raw_path": path.encode(),
+        "query_string": b"",
+        "root_path": "",
+        "headers": [(b"content-type", b"application/json"), (b"content-length", str(len(raw)).encode())]
+        + [(k.lower().encode(), v.encode()) for k, v in headers.items()],
+        "client": ("127.0.0.1", 50000),
+        "server": ("testserver", 80),
+    }
+    start = time.monotonic()
+    sent_body = False
+
+    async def receive():
+        nonlocal sent_body
+        if not sent_body:
+            sent_body = True
+            return {"type": "http.request", "body": raw, "more_body": False}
+        # как у uvicorn: после отключения receive отвечает сразу, до него — ждёт
+        left = disconnect_after - (time.monotonic() - start)
+        if left > 0:
+            await asyncio.sleep(left)
+        return {"type": "http.disconnect"}
+
+    status = None
+
+    async def send(message):
+        nonlocal status
+        if message["type"] == "http.response.start":
+            status = message["status"]
+
+    await app(scope, receive, send)
+    return status, time.monotonic() - start
+
+
+def test_client_disconnect_cancels_upstream_call(ai_service, auth_header):
+    ai_service.delay = 3.0
+    before = metrics.snapshot().get("chat.client_disconnected", 0)
+
+    status, elapsed = asyncio.run(
+        _post_and_disconnect("/api/chat/message", {"chat_id": 1, "message": "long"}, auth_header, 0.6)
+    )
+
+    assert status == 499
+    assert elapsed < 2.0
+    assert ai_service.cancelled == 1
+    assert metrics.snapshot().get("chat.client_disconnected", 0) == before + 1
+
+
+def test_connected_client_gets_answer(ai_service, auth_header):
+    ai_service.delay = 0.1
+
+    status, _ = asyncio.run(
+        _post_and_disconnect("/api/chat/message", {"chat_id": 1, "message": "short"}, auth_header, 5.0)
+    )
+
+    assert status == 200
+    assert ai_service.cancelled == 0
@@ -0,0 +1,125 @@
+"""SingleFlight: склейка дублей, повтор по Idempotency-Key, отмена, вытеснение."""
+
+import asyncio
+
+import pytest
+from fastapi.testclient import TestClient
+
+from web import routes
+from web.app import app
+from web.idempotency import SingleFlight, payload_hash
+
+
+class Model:
+    def __init__(self, delay: float = 0.05):
+        self.delay = delay
+        self.calls = 0
+        self.cancelled = 0
+
+    async def __call__(self):
+        self.calls += 1
+        try:
+            await asyncio.sleep(self.delay)
+        except asyncio.CancelledError:
+            self.cancelled += 1
+            raise
+        return f"answer {self.calls}"
+
+
+def test_payload_hash_separates_parts():
+    assert payload_hash("ab", "c") != payload_hash("a", "bc")
+    assert payload_hash(None) != payload_hash("")
+
+
+def test_concurrent_duplicates_share_one_call():
+    flight, model = SingleFlight(), Model()
+
+    async def main():
+        # разные Idempotency-Key у двойного клика не мешают склейке
+        return await asyncio.gather(
+            flight.do("k", model, replay_key=("k", "a")),
+            flight.do("k", model, replay_key=("k", "b")),
+        )
+
+    assert asyncio.run(main()) == ["answer 1", "answer 1"]
+    assert model.calls == 1
+    assert flight.stats() == {"inflight": 0, "stored": 2}
+
+
+def test_replay_by_key_and_fresh_call_without_it():
+    flight, model = SingleFlight(), Model(delay=0)
+
+    async def main():
+        first = await flight.do("k", model, replay_key=("k", "a"))
+        replayed = await flight.do("k", model, replay_key=("k", "a"))
+        fresh = await flight.do("k", model)
+        return first, replayed, fresh
+
+    assert asyncio.run(main()) == ("answer 1", "answer 1", "answer 2")
+
+
+def test_errors_reach_all_waiters_and_are_not_stored():
+    flight = SingleFlight()
+    calls = 0
+
+    async def failing():
+        nonlocal calls
+        calls += 1
+        await asyncio.sleep(0.01)
+        raise RuntimeError("upstream 503")
+
+    async def main():
+        results = await asyncio.gather(
+            flight.do("k", failing, replay_key="r"),
+            flight.do("k", failing, replay_key="r"),
+            return_exceptions=True,
+        )
+        with pytest.raises(RuntimeError):
+            await flight.do("k", failing, replay_key="r")
+        return results
+
+    results = asyncio.run(main())
+    assert all(isinstance(r, RuntimeError) for r in results)
+    assert calls == 2
+
+
+def test_upstream_cancelled_only_when_last_waiter_leaves():
+    flight, model = SingleFlight(), Model(delay=0.2)
+
+    async def main():
+        first = asyncio.ensure_future(flight.do("k", model))
+        second = asyncio.ensure_future(flight.do("k", model))
+        await asyncio.sleep(0.02)
+        first.cancel()
+        await asyncio.sleep(0.02)
+        assert model.cancelled == 0  # второй ещё ждёт ответа
+        second.cancel()
+        await asyncio.gather(first, second, return_exceptions=True)
+        await asyncio.sleep(0)
+
+    asyncio.run(main())
+    assert model.cancelled == 1
+    assert flight.stats()["inflight"] == 0
+
+
+def test_store_evicts_expired_then_oldest(monkeypatch):
+    flight = SingleFlight(ttl=10, max_entries=2)
+    now = [0.0]
+    monkeypatch.setattr("web.idempotency.time.monotonic", lambda: now[0])
+    flight._store("a", 1)
+    flight._store("b", 2)
+    flight._store("c", 3)
+    assert list(flight._done) == ["b", "c"]
+    now[0] = 11
+    assert flight._get_done("b") == (False, None)
+    flight._store("d", 4)
+    assert list(flight._done) == ["d"]
+
+
+def test_non_ascii_metrics_token_is_404(monkeypatch):
+    monkeypatch.setattr(routes, "METRICS_TOKEN", "secret")
+    with TestClient(app) as client:
+        response = client.get("/api/metrics", headers={"X-Metrics-Token": "тайна".encode()})
+        ok = client.get("/api/metrics", headers={"X-Metrics-Token": "secret"})
+    assert response.status_code == 404
+    assert ok.status_code == 200
@@ -0,0 +1,67 @@
+"""Ответ из кэша картинок: либо пишется в историю, либо кэш обходится."""
+
+import os
+
+from fastapi.testclient import TestClient
+
+import pytest
+
+from web import metrics, routes
+from web.app import app
+
+
+@pytest.fixture(autouse=True)
+def cache_enabled(monkeypatch):
+    monkeypatch.setattr(routes, "IMAGE_CACHE_ENABLED", True)
+
+
+def _upload(client: TestClient, headers: dict, image: bytes):
+    return client.post(
+        "/api/chat/image",
+        headers=headers,
+        params={"chat_id": "1"},
+        files={"file": ("shot.png", image, "image/png")},
+    )
+
+
+def test_cache_bypassed_without_record_exchange(ai_service, auth_header):
+    image = os.urandom(64)
+    before = metrics.snapshot().get("image_cache.bypass_no_record", 0)
+    with TestClient(app) as client:
+        for _ in range(2):
+            assert _upload(client, auth_header, image).status_code == 200
+    # без record_exchange ответ из кэша не попал бы в историю — оба раза модель
+    assert ai_service.calls == 2
+    assert metrics.snapshot()["image_cache.bypass_no_record"] == before + 2
+
+
+def test_cache_hit_is_recorded(ai_service, auth_header):
+    recorded = []
+
+    async def record_exchange(user_id, prompt, answer):
+        recorded.append(answer)
+
+    ai_service.record_exchange = record_exchange
+    try:
+        image = os.urandom(64)
+        with TestClient(app) as client:
+            first = _upload(client, auth_header, image).json()
+            second = _upload(client, auth_header, image).json()
+    finally:
+        del ai_service.record_exchange
+    assert ai_service.calls == 1
+    assert second["answer"] == first["answer"]
+    assert recorded == [first["answer"]]
+
+
+def test_cache_off_by_default(monkeypatch, ai_service, auth_header):
+    monkeypatch.setattr(routes, "IMAGE_CACHE_ENABLED", False)
+    ai_service.record_exchange = lambda *args: None
+    try:
+        image = os.urandom(64)
+        with TestClient(app) as client:
+            for _ in range(2):
+                assert _upload(client, auth_header, image).status_code == 200
+    finally:
+        del ai_service.record_exchange
+    assert ai_service.calls == 2
@@ -0,0 +1,33 @@
+"""Холодный старт: import web.app не тянет ORM, OAuth, хэширование паролей и SMTP."""
+
+import json
+import os
+import subprocess
+import sys
+
+from conftest import ROOT
+
+HEAVY = ("db", "sqlalchemy", "google.auth", "passlib", "smtplib")
+
+# отдельный процесс: в этом sys.modules уже лежат заглушки из conftest
+SCRIPT = f"""
+import importlib.util, json, sys
+sys.path.insert(0, {str(ROOT)!r})
+spec = importlib.util.spec_from_file_location("config", {str(ROOT / "config.example.py")!r})
+config = importlib.util.module_from_spec(spec)
+sys.modules["config"] = config
+spec.loader.exec_module(config)
+
+import web.app
+
+print(json.dumps([name for name in {HEAVY!r} if name in sys.modules]))
+"""
+
+
+def test_import_web_app_skips_heavy_modules():
+    env = {**os.environ, "TESTING": "1", "JWT_SECRET_KEY": "test-secret"}
+    proc = subprocess.run(
+        [sys.executable, "-c", SCRIPT], cwd=ROOT, env=env, capture_output=True, text=True, timeout=60
+    )
+    assert proc.returncode == 0, proc.stderr
+    assert json.loads(proc.stdout.splitlines()[-1]) == []
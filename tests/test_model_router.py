@@ -0,0 +1,103 @@
+"""Circuit breaker и учёт ответившей модели в web.model_router."""
+
+import asyncio
+
+from web import model_router as router_module
+from web.model_router import MIN_SAMPLES, ModelRouter, ModelStats
+
+
+def _trip(st: ModelStats) -> None:
+    for _ in range(MIN_SAMPLES):
+        st.record(1.0, ok=False)
+    assert st.opened_at is not None
+
+
+def test_late_success_does_not_close_breaker():
+    st = ModelStats()
+    _trip(st)
+    # ответ запроса, начатого до размыкания
+    st.record(5.0, ok=True)
+    assert st.state() == "open"
+
+
+def test_probe_success_closes_breaker(monkeypatch):
+    monkeypatch.setattr(router_module, "MODEL_BREAKER_COOLDOWN_SEC", 0)
+    st = ModelStats()
+    _trip(st)
+    assert st.available()
+    st.probe_in_flight = True
+    assert not st.available()
+    st.record(1.0, ok=True, probe=True)
+    assert st.state() == "closed"
+    # окно очищено: одна ошибка после восстановления не размыкает снова
+    st.record(1.0, ok=False)
+    assert st.state() == "closed"
+
+
+def test_fallback_reports_serving_model():
+    router = ModelRouter({"premium": {"smart": ["fast"]}})
+
+    async def call(mk: str) -> str:
+        if mk == "smart":
+            raise RuntimeError("upstream 503")
+        return f"answer from {mk}"
+
+    answer, served_by = asyncio.run(router.call("smart", "premium", call))
+    assert (answer, served_by) == ("answer from fast", "fast")
+
+
+def test_programming_error_is_not_a_model_failure():
+    router = ModelRouter({"premium": {"smart": ["fast"]}})
+    calls = []
+
+    async def call(mk: str) -> str:
+        calls.append(mk)
+        raise TypeError("chat_complete() got an unexpected keyword argument 'model_key'")
+
+    for _ in range(MIN_SAMPLES * 2):
+        try:
+            asyncio.run(router.call("smart", "premium", call))
+        except TypeError:
+            pass
+    # баг вызова не переключает на запасную и не размыкает breaker
+    assert set(calls) == {"smart"}
+    assert router.stats["smart"].state() == "closed"
+    assert not router.stats["smart"].calls
+
+
+def test_smart_outage_without_override_support_keeps_fast_up():
+    """AIService без model_key: fallback выключен, и отказы smart не задевают fast."""
+    from web import routes
+    from conftest import Obj, SubscriptionStatus
+
+    class BaselineAIService:
+        def __init__(self):
+            self.models = []
+
+        async def chat_complete(self, user_id, message):
+            self.models.append(message)
+            if message == "smart":
+                raise RuntimeError("upstream 503")
+            return "ok"
+
+    router = ModelRouter({"premium": {"smart": ["fast"]}})
+    service = BaselineAIService()
+    premium = Obj(subscription_status=SubscriptionStatus.PREMIUM)
+    free = Obj(subscription_status=SubscriptionStatus.FREE)
+
+    async def main():
+        for _ in range(MIN_SAMPLES + 2):
+            try:
+                await routes._call_model(premium, "smart", service.chat_complete, 1, "smart")
+            except RuntimeError:
+                pass
+        return await routes._call_model(free, "fast", service.chat_complete, 1, "fast")
+
+    original = routes.model_router
+    routes.model_router = router
+    try:
+        assert asyncio.run(main()) == ("ok", "fast")
+    finally:
+        routes.model_router = original
+    assert router.stats["smart"].state() == "open"
+    assert "fast" not in router.stats or router.stats["fast"].state() == "closed"
@@ -0,0 +1,55 @@
+"""Профилирование запроса по заголовку X-Profile поверх web.app."""
+
+import os
+
+from fastapi.testclient import TestClient
+
+from web import profiling
+from web.app import app
+
+
+def test_profile_header_writes_profile(monkeypatch, tmp_path, ai_service, auth_header):
+    monkeypatch.setattr(profiling, "PROFILE_TOKEN", "secret")
+    monkeypatch.setattr(profiling, "PROFILE_DIR", str(tmp_path))
+    monkeypatch.setattr(profiling, "PROFILE_SLOW_MODEL_MS", 0)  # заодно — запись медленного запроса
+
+    with TestClient(profiling.ProfilingMiddleware(app)) as client:
+        response = client.post(
+            "/api/chat/message",
+            headers={**auth_header, "X-Profile": "secret"},
+            json={"chat_id": 1, "message": "hi"},
+        )
+    assert response.status_code == 200
+    name = response.headers["X-Profile-File"]
+    assert (tmp_path / name).is_file()
+    assert name.endswith((".speedscope.json", ".sync-approx.prof"))
+    assert not profiling._profile_active
+    slow = [p for p in tmp_path.iterdir() if p.name.startswith("slow-")]
+    assert len(slow) == 1 and b'"status":200' in slow[0].read_bytes()
+
+
+def test_non_ascii_profile_header_is_not_a_server_error(monkeypatch):
+    monkeypatch.setattr(profiling, "PROFILE_TOKEN", "secret")
+    with TestClient(profiling.ProfilingMiddleware(app)) as client:
+        response = client.get("/api/chats", headers={"X-Profile": "тайна".encode()})
+    assert response.status_code != 500
+    assert "X-Profile-File" not in response.headers
+
+
+def test_slow_threshold_is_higher_for_model_routes(monkeypatch):
+    monkeypatch.setattr(profiling, "PROFILE_SLOW_MS", 2000)
+    monkeypatch.setattr(profiling, "PROFILE_SLOW_MODEL_MS", 60000)
+    assert profiling._slow_threshold_ms("/api/chat/message") == 60000
+    assert profiling._slow_threshold_ms("/api/chats") == 2000
+
+
+def test_file_cap_removes_oldest(tmp_path):
+    old = tmp_path / "slow-old.json"
+    old.write_text("{}")
+    os.utime(old, (0, 0))
+    cap = profiling._FileCap(max_files=2)
+    paths = [tmp_path / f"slow-{i}.json" for i in range(3)]
+    for path in paths:
+        path.write_text("{}")
+        cap.add(path)
+    assert sorted(p.name for p in tmp_path.iterdir()) == ["slow-1.json", "slow-2.json"]
@@ -0,0 +1,112 @@
+"""Token bucket, middleware 429 и лимит входа в web.ratelimit."""
+
+import asyncio
+
+from fastapi.testclient import TestClient
+from starlette.requests import Request
+
+from web import ratelimit
+from web.app import app
+from web.ratelimit import MemoryBackend, RateLimiter, Rule
+
+
+def test_bucket_refills_over_time():
+    backend = MemoryBackend()
+    rule = Rule(2, 10)  # 0.2 токена в секунду
+    assert backend.take("k", rule, 0.0) == 0
+    assert backend.take("k", rule, 0.0) == 0
+    assert backend.take("k", rule, 0.0) == 5.0
+    assert backend.take("k", rule, 2.5) == 2.5
+    assert backend.take("k", rule, 5.0) == 0
+
+
+def test_peek_does_not_spend():
+    backend = MemoryBackend()
+    rule = Rule(1, 60)
+    for _ in range(3):
+        assert backend.take("k", rule, 0.0, spend=False) == 0
+    assert backend.take("k", rule, 0.0) == 0
+    assert backend.take("k", rule, 0.0, spend=False) > 0
+
+
+def test_retry_after_rounds_up_to_whole_seconds():
+    assert ratelimit._too_many(0.01) == {"Retry-After": "1"}
+    assert ratelimit._too_many(2.2) == {"Retry-After": "3"}
+    assert ratelimit._too_many(3.0) == {"Retry-After": "3"}
+
+
+def test_lru_evicts_least_recently_used():
+    backend = MemoryBackend(max_keys=2)
+    rule = Rule(1, 3600)
+    backend.take("a", rule, 0.0)
+    backend.take("b", rule, 0.0)
+    backend.take("a", rule, 1.0)  # a свежее b
+    backend.take("c", rule, 2.0)
+    assert list(backend._buckets) == ["a", "c"]
+
+
+def test_redis_failure_falls_back_to_memory():
+    class BrokenRedis:
+        async def take(self, *args):
+            raise ConnectionError("redis down")
+
+    limiter = RateLimiter()
+    limiter.redis = BrokenRedis()
+    rule = Rule(1, 3600)
+    assert asyncio.run(limiter.check("k", rule)) == 0
+    assert asyncio.run(limiter.check("k", rule)) > 0
+
+
+def _request(xff: str | None, peer: str = "10.0.0.1") -> Request:
+    headers = [(b"x-forwarded-for", xff.encode())] if xff is not None else []
+    return Request({"type": "http", "headers": headers, "client": (peer, 1234)})
+
+
+def test_client_ip_takes_trusted_hop_from_the_right(monkeypatch):
+    monkeypatch.setattr(ratelimit, "RATE_LIMIT_TRUST_PROXY", 1)
+    # левое значение подставил клиент, правое дописал наш прокси
+    assert ratelimit.client_ip(_request("6.6.6.6, 1.2.3.4")) == "1.2.3.4"
+    monkeypatch.setattr(ratelimit, "RATE_LIMIT_TRUST_PROXY", 2)
+    assert ratelimit.client_ip(_request("6.6.6.6, 1.2.3.4, 172.16.0.2")) == "1.2.3.4"
+    # цепочка короче заявленной — заголовку не верим
+    assert ratelimit.client_ip(_request("1.2.3.4")) == "10.0.0.1"
+    monkeypatch.setattr(ratelimit, "RATE_LIMIT_TRUST_PROXY", 0)
+    assert ratelimit.client_ip(_request("6.6.6.6")) == "10.0.0.1"
+
+
+def test_middleware_429_carries_cors_headers(monkeypatch):
+    monkeypatch.setitem(ratelimit.RATE_LIMIT_RULES, "/api/login/guest", Rule(1, 3600))
+    monkeypatch.setattr(ratelimit, "limiter", RateLimiter())
+    headers = {"Origin": "http://localhost:3000"}
+    with TestClient(app) as client:
+        client.post("/api/login/guest", headers=headers)
+        response = client.post("/api/login/guest", headers=headers)
+    assert response.status_code == 429
+    assert response.headers["Retry-After"] == "3600"
+    assert response.headers["Access-Control-Allow-Origin"] == "http://localhost:3000"
+    assert "Retry-After" in response.headers["Access-Control-Expose-Headers"]
+
+
+def test_failed_logins_do_not_lock_out_the_owner(monkeypatch):
+    async def authenticate_user(email, password):
+        return password == "right"
+
+    from web import routes
+
+    monkeypatch.setattr(routes, "authenticate_user", authenticate_user)
+    monkeypatch.setattr(ratelimit, "limiter", RateLimiter())
+    monkeypatch.setattr(ratelimit, "RATE_LIMIT_TRUST_PROXY", 1)
+    monkeypatch.setitem(ratelimit.RATE_LIMIT_RULES, "/api/login/email", Rule(1000, 60))
+
+    def login(password: str, ip: str):
+        return client.post(
+            "/api/login/email",
+            data={"username": "victim@example.com", "password": password},
+            headers={"X-Forwarded-For": ip},
+        )
+
+    with TestClient(app) as client:
+        codes = [login("wrong", "6.6.6.6").status_code for _ in range(ratelimit.LOGIN_FAILURE_RULE.capacity + 1)]
+        owner = login("right", "1.2.3.4")
+    assert codes[-1] == 429 and set(codes[:-1]) == {401}
+    assert owner.status_code == 200
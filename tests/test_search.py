@@ -0,0 +1,109 @@
+"""Поиск по истории: слова, индексатор и /api/search поверх web.app."""
+
+import asyncio
+import sys
+from datetime import datetime
+
+from fastapi.testclient import TestClient
+
+from conftest import Obj
+from web import search_index
+from web.app import app
+from web.archive import pack_messages
+from web.search import index_terms, parse_terms, prefix_range
+
+
+def test_index_terms_lowercases_counts_and_drops_short_words():
+    assert index_terms("Интеграл и ИНТЕГРАЛ, по x^2 — integral!") == {"интеграл": 2, "integral": 1}
+
+
+def test_query_terms_match_indexed_terms():
+    assert parse_terms("Интеграл интеграл от производной") == ["интеграл", "производной"]
+
+
+def test_prefix_range_covers_words_with_prefix():
+    lo, hi = prefix_range("инт")
+    assert all(lo <= w < hi for w in ("инт", "интеграл", "интёрн"))
+    assert not any(lo <= w < hi for w in ("ин", "инф", "иню"))
+
+
+def test_index_pending_writes_postings_and_advances_watermark(monkeypatch):
+    db = sys.modules["db"]
+    batches = [
+        [Obj(id=1, chat_id=10, user_id=7, content="матрица матрица вектор"), Obj(id=2, chat_id=10, user_id=7, content=None)],
+        [],
+    ]
+    written = []
+
+    async def get_search_watermark():
+        return 0
+
+    async def get_unindexed_messages(after_id, limit):
+        return batches.pop(0)
+
+    async def add_message_terms(postings, last_message_id):
+        written.append((sorted(postings), last_message_id))
+
+    monkeypatch.setattr(search_index, "SEARCH_INDEX_BATCH_SIZE", 2)
+    for name, fn in (("get_search_watermark", get_search_watermark),
+                     ("get_unindexed_messages", get_unindexed_messages),
+                     ("add_message_terms", add_message_terms)):
+        monkeypatch.setattr(db, name, fn, raising=False)
+
+    assert asyncio.run(search_index.index_pending()) == 2
+    assert written == [([(7, "вектор", 1, 10, 1), (7, "матрица", 1, 10, 2)], 2)]
+
+
+def test_search_endpoint_queries_the_index(monkeypatch, auth_header):
+    db = sys.modules["db"]
+    calls = []
+
+    async def search_user_messages(**kwargs):
+        calls.append(kwargs)
+        return [
+            Obj(id=5, chat_id=1, chat_title="Алгебра", role="bot", timestamp=datetime(2026, 1, 1),
+                score=2.02, content="Определитель матрицы равен нулю")
+        ]
+
+    monkeypatch.setattr(db, "search_user_messages", search_user_messages, raising=False)
+    with TestClient(app) as client:
+        response = client.get("/api/search", params={"q": "матрицы опред"}, headers=auth_header)
+
+    assert response.status_code == 200
+    assert calls == [{
+        "user_id": 1, "terms": ["матрицы"], "prefix_range": prefix_range("опред"), "limit": 21, "offset": 0,
+    }]
+    item = response.json()["items"][0]
+    assert item["message_id"] == 5 and item["snippet"]["highlights"]
+
+
+def test_search_reads_archived_messages_from_blob(monkeypatch, auth_header):
+    db = sys.modules["db"]
+    payload = pack_messages([
+        Obj(id=5, role=Obj(value="bot"), content="Определитель матрицы равен нулю",
+            timestamp=datetime(2026, 1, 1), prompt_tokens=0, completion_tokens=0)
+    ])
+    loads = []
+
+    async def search_user_messages(**kwargs):
+        # чат в архиве: строки messages нет, постинги остались
+        return [
+            Obj(id=i, chat_id=3, chat_title="Алгебра", role=None, timestamp=None, score=1.0, content=None)
+            for i in (5, 6)
+        ]
+
+    async def load_archived_chat(chat_id):
+        loads.append(chat_id)
+        return payload
+
+    monkeypatch.setattr(db, "search_user_messages", search_user_messages, raising=False)
+    monkeypatch.setattr(db, "load_archived_chat", load_archived_chat, raising=False)
+    with TestClient(app) as client:
+        response = client.get("/api/search", params={"q": "матрицы"}, headers=auth_header)
+
+    assert response.status_code == 200
+    items = response.json()["items"]
+    # 6 нет в блобе — пропущено; блоб читается один раз на чат
+    assert [(i["message_id"], i["role"]) for i in items] == [(5, "bot")]
+    assert items[0]["snippet"]["highlights"]
+    assert loads == [3]
@@ -0,0 +1,68 @@
+"""WebSocket-канал чата поверх web.app."""
+
+import time
+
+from fastapi.testclient import TestClient
+
+from web import metrics
+from web.app import app
+from web.auth import create_access_token
+
+
+def _disconnect(ws) -> None:
+    # TestClient отменяет приложение сразу после disconnect; даём сессии
+    # закрыться самой, иначе отмена прилетает посреди её уборки
+    ws.close()
+    time.sleep(0.1)
+
+
+def _receive_until(ws, kind: str) -> dict:
+    while True:
+        message = ws.receive_json()
+        if message["type"] == kind:
+            return message
+
+
+def test_ws_message_goes_through_router_and_bills_serving_model(monkeypatch, ai_service):
+    import sys
+
+    billed = []
+
+    async def check_and_increment_usage(user_id, model_key, subscription_status):
+        billed.append(model_key)
+
+    monkeypatch.setattr(sys.modules["bot.utils"], "check_and_increment_usage", check_and_increment_usage)
+    served_before = metrics.snapshot().get("router.served.fast", 0)
+
+    token = create_access_token(sub="user@example.com")
+    with TestClient(app) as client, client.websocket_connect(f"/api/chat/ws?token={token}") as ws:
+        assert ws.receive_json()["type"] == "ready"
+        ws.send_json({"type": "message", "chat_id": 1, "message": "hi"})
+        done = _receive_until(ws, "done")
+        _disconnect(ws)
+
+    assert done == {"type": "done", "chat_id": 1, "answer": "answer to hi"}
+    assert metrics.snapshot()["router.served.fast"] == served_before + 1
+    assert billed == ["fast"]
+
+
+def test_ws_reasserts_active_chat_on_every_message(monkeypatch, ai_service):
+    import sys
+
+    activated = []
+
+    async def set_active_chat(user_id, chat_id, **kwargs):
+        activated.append(chat_id)
+
+    monkeypatch.setattr(sys.modules["db"], "set_active_chat", set_active_chat, raising=False)
+
+    token = create_access_token(sub="user@example.com")
+    with TestClient(app) as client, client.websocket_connect(f"/api/chat/ws?token={token}") as ws:
+        assert ws.receive_json()["chat_id"] == 1
+        for text in ("one", "two"):
+            ws.send_json({"type": "message", "chat_id": 1, "message": text})
+            _receive_until(ws, "done")
+        _disconnect(ws)
+
+    # чат 1 уже активен в сессии, но в БД его могли сменить из другой вкладки
+    assert activated == [1, 1]
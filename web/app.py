@@ -1,14 +1,26 @@
 # web/app.py
+import asyncio
+from contextlib import asynccontextmanager, suppress
 from pathlib import Path
 
-import uvicorn
 from fastapi import FastAPI, Request
 from fastapi.responses import HTMLResponse
 from fastapi.staticfiles import StaticFiles
 from fastapi.templating import Jinja2Templates
 from starlette.middleware.cors import CORSMiddleware
+from starlette.middleware.gzip import GZipMiddleware
 from starlette.middleware import Middleware
-from config import ALLOWED_ORIGINS
+from starlette.datastructures import MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+from config import (
+    ALLOWED_ORIGINS,
+    ARCHIVE_ENABLED,
+    LOOP_BLOCK_MS,
+    PROFILE_ENABLED,
+    SEARCH_INDEX_ENABLED,
+    validate_env,
+)
+from web.ratelimit import RateLimitMiddleware
 import logging
 
 # Скрываем отладочные сообщения multipart
@@ -28,15 +40,58 @@ middleware = [
         allow_credentials=use_credentials,
         allow_methods=["*"],
         allow_headers=["*"],
-        expose_headers=["*"],
-    )
+        # "*" не действует для запросов с credentials — Retry-After перечисляем явно
+        expose_headers=["*", "Retry-After"],
+    ),
+    # внутри CORS: ответ 429 получает Access-Control-Allow-Origin
+    Middleware(RateLimitMiddleware),  # type: ignore[arg-type]
+    # длинные истории чатов (до 240 сообщений) хорошо сжимаются
+    Middleware(GZipMiddleware, minimum_size=1024),  # type: ignore[arg-type]
 ]
 
+# ───── Lifespan: проверка окружения и внешние клиенты ─────
+@asynccontextmanager
+async def lifespan(_app: FastAPI):
+    # проверяем .env при старте сервера, а не при импорте config
+    validate_env()
+    # AIService (и его HTTP-клиент) поднимаем здесь, а не при импорте роутов
+    from web.routes import get_ai_service, close_ai_service
+    get_ai_service()
+    # фоновая архивация холодных чатов и чистка устаревших записей
+    archive_task = None
+    if ARCHIVE_ENABLED:
+        from web.archive import archive_loop
+        archive_task = asyncio.create_task(archive_loop())
+    # пополнение индекса поиска новыми сообщениями
+    index_task = None
+    if SEARCH_INDEX_ENABLED:
+        from web.search_index import index_loop
+        index_task = asyncio.create_task(index_loop())
+    # сторожевой поток: логирует стек, если event loop завис дольше порога
+    loop_detector = None
+    if LOOP_BLOCK_MS > 0:
+        from web.profiling import LoopBlockDetector
+        loop_detector = LoopBlockDetector(LOOP_BLOCK_MS)
+        loop_detector.start(asyncio.get_running_loop())
+    try:
+        yield
+    finally:
+        if loop_detector is not None:
+            loop_detector.stop()
+        for task in (archive_task, index_task):
+            if task is not None:
+                task.cancel()
+                with suppress(asyncio.CancelledError):
+                    await task
+        await close_ai_service()
+
+
 app = FastAPI(
     title="Luch Neuro Web",
     version="0.1.0",
     description="Веб-клиент Luch Neuro (тот же API, что и Telegram-бот)",
     middleware=middleware,
+    lifespan=lifespan,
 )
 
 # ───── Статика ─────
@@ -47,19 +102,45 @@ app.mount(
 )
 
 # ───── Cache-Control для статики ─────
-@app.middleware("http")
-async def add_cache_headers(request: Request, call_next):
-    response = await call_next(request)
-    if request.url.path.startswith("/static/"):
-        response.headers["Cache-Control"] = "public, max-age=86400, immutable"
-    return response
+# Чистый ASGI, а не @app.middleware("http"): BaseHTTPMiddleware подменяет канал
+# receive, и хэндлеры перестают видеть http.disconnect — отмена вызова модели
+# при закрытой вкладке (web/cancellation.py) не срабатывала бы.
+class StaticCacheMiddleware:
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http" or not scope["path"].startswith("/static/"):
+            return await self.app(scope, receive, send)
+
+        async def send_with_cache(message: Message) -> None:
+            if message["type"] == "http.response.start":
+                MutableHeaders(scope=message)["Cache-Control"] = "public, max-age=86400, immutable"
+            await send(message)
+
+        await self.app(scope, receive, send_with_cache)
+
+
+app.add_middleware(StaticCacheMiddleware)  # type: ignore[arg-type]
+
+# ───── Профилирование по требованию (выключено — не подключается) ─────
+# снаружи всех остальных слоёв — время запроса целиком, включая CORS и лимитер
+if PROFILE_ENABLED:
+    from web.profiling import ProfilingMiddleware
+    app.add_middleware(ProfilingMiddleware)  # type: ignore[arg-type]
 
 # ───── Шаблоны ─────
 templates = Jinja2Templates(directory=BASE_DIR / "templates")
 
 # ───── Подключаем API-роуты ─────
 from web.routes import router as api_router  # noqa: E402
+from web.ws import router as ws_router  # noqa: E402
+from web.search import router as search_router  # noqa: E402
+from web.export import router as export_router  # noqa: E402
 app.include_router(api_router)
+app.include_router(ws_router)
+app.include_router(search_router)
+app.include_router(export_router)
 
 # ───── SPA: отдаём index.html на все пути ─────
 @app.get(
@@ -85,6 +166,8 @@ async def spa(request: Request, _full_path: str):
     )
 
 if __name__ == "__main__":
+    import uvicorn
+
     uvicorn.run(
         "web.app:app",
         host="127.0.0.1",
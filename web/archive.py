@@ -0,0 +1,178 @@
+# web/archive.py
+"""
+Архивация холодных чатов и чистка устаревших записей.
+
+Фоновая задача (запускается в lifespan при ARCHIVE_ENABLED) раз в
+ARCHIVE_INTERVAL_MIN минут:
+ - переносит сообщения чатов, неактивных ARCHIVE_AFTER_DAYS дней,
+   в chat_archive одним zlib-блобом на чат (migrations/004_chat_archive.sql);
+ - пачками удаляет просроченные коды подтверждения и исчерпанные/старые
+   гостевые сессии;
+ - пишет в лог размер горячих таблиц и время пробного запроса до и после.
+Архивный чат возвращается в messages прозрачно — при первом открытии
+(и считается активным: снова в архив — через ARCHIVE_AFTER_DAYS). Выгрузка
+и поиск читают архив из блоба, не возвращая чат.
+
+Задача не координируется между репликами: включайте её на одной.
+"""
+
+import asyncio
+import json
+import logging
+import time
+import zlib
+from datetime import datetime, timedelta, timezone
+
+from config import (
+    ARCHIVE_AFTER_DAYS,
+    ARCHIVE_BATCH_SIZE,
+    ARCHIVE_INTERVAL_MIN,
+    GUEST_SESSION_TTL_DAYS,
+    GUEST_TOTAL_LIMIT,
+)
+from web import metrics
+from web.lazy import lazy_module
+from web.responses import dumps
+
+logger = logging.getLogger(__name__)
+db = lazy_module("db")
+
+HOT_TABLES = ("messages", "chats", "guest_sessions", "email_confirmation_codes")
+ARCHIVE_FORMAT_VERSION = 1
+
+
+# ─────────── Сжатие ───────────
+def pack_messages(messages) -> bytes:
+    rows = [
+        {
+            "id": m.id,
+            "role": m.role.value,
+            "content": m.content,
+            "timestamp": m.timestamp,
+            "prompt_tokens": m.prompt_tokens,
+            "completion_tokens": m.completion_tokens,
+        }
+        for m in messages
+    ]
+    return zlib.compress(dumps({"v": ARCHIVE_FORMAT_VERSION, "messages": rows}), 6)
+
+
+def unpack_messages(payload: bytes) -> list[dict]:
+    data = json.loads(zlib.decompress(payload))
+    if data.get("v") != ARCHIVE_FORMAT_VERSION:
+        raise ValueError(f"Unknown chat archive version: {data.get('v')}")
+    for row in data["messages"]:
+        row["timestamp"] = datetime.fromisoformat(row["timestamp"])
+    return data["messages"]
+
+
+# ─────────── Восстановление ───────────
+# chat_id → [lock, сколько корутин его держат или ждут]; запись живёт, пока счётчик > 0
+_restore_locks: dict[int, list] = {}
+
+
+async def ensure_chat_hot(chat) -> None:
+    """Если чат в архиве — возвращает его сообщения в messages."""
+    if getattr(chat, "archived_at", None) is None:
+        return
+    # два одновременных открытия одного чата восстанавливают его один раз
+    entry = _restore_locks.setdefault(chat.id, [asyncio.Lock(), 0])
+    entry[1] += 1
+    try:
+        async with entry[0]:
+            payload = await db.load_archived_chat(chat.id)
+            if payload is None:
+                chat.archived_at = None
+                return
+            messages = unpack_messages(payload)
+            await db.restore_chat_messages(chat.id, messages)
+            chat.archived_at = None
+    finally:
+        entry[1] -= 1
+        if entry[1] == 0:
+            del _restore_locks[chat.id]
+    metrics.incr("archive.chats_restored")
+    logger.info("Chat %s restored from archive (%d messages)", chat.id, len(messages))
+
+
+# ─────────── Фоновая задача ───────────
+async def _report(label: str) -> None:
+    stats = await db.get_table_stats(HOT_TABLES)
+    start = time.perf_counter()
+    await db.get_active_chat(0)  # пробный горячий запрос (по индексу, пустой результат)
+    probe_ms = (time.perf_counter() - start) * 1000
+    logger.info(
+        "Hot tables %s: %s; probe query %.1f ms",
+        label,
+        ", ".join(f"{name}={s['rows']} rows/{s['bytes'] // 1024} KiB" for name, s in stats.items()),
+        probe_ms,
+    )
+
+
+async def archive_cold_chats() -> int:
+    before = datetime.now(timezone.utc) - timedelta(days=ARCHIVE_AFTER_DAYS)
+    archived = 0
+    while True:
+        chat_ids = await db.get_cold_chats(before=before, limit=ARCHIVE_BATCH_SIZE)
+        for chat_id in chat_ids:
+            messages = await db.get_chat_messages(chat_id)
+            payload = pack_messages(messages)
+            # удаляются только упакованные сообщения; если чат ожил, пока мы
+            # читали, archive_chat ничего не меняет и возвращает False
+            done = await db.archive_chat(
+                chat_id,
+                before=before,
+                max_message_id=messages[-1].id if messages else 0,
+                payload=payload,
+                message_count=len(messages),
+            )
+            if not done:
+                metrics.incr("archive.chats_skipped_active")
+                continue
+            archived += 1
+            metrics.incr("archive.bytes_compressed", len(payload))
+        if len(chat_ids) < ARCHIVE_BATCH_SIZE:
+            return archived
+        await asyncio.sleep(0)  # не монополизируем event loop между пачками
+
+
+async def _purge_in_batches(fn, **kwargs) -> int:
+    total = 0
+    while True:
+        n = await fn(limit=ARCHIVE_BATCH_SIZE, **kwargs)
+        total += n
+        if n < ARCHIVE_BATCH_SIZE:
+            return total
+        await asyncio.sleep(0)
+
+
+async def run_once() -> None:
+    started = time.perf_counter()
+    await _report("before")
+    chats = await archive_cold_chats()
+    codes = await _purge_in_batches(db.purge_expired_confirmation_codes)
+    guests = await _purge_in_batches(
+        db.purge_exhausted_guest_sessions,
+        max_requests=GUEST_TOTAL_LIMIT,
+        before=datetime.now(timezone.utc) - timedelta(days=GUEST_SESSION_TTL_DAYS),
+    )
+    await _report("after")
+
+    metrics.incr("archive.chats_archived", chats)
+    metrics.incr("archive.codes_purged", codes)
+    metrics.incr("archive.guest_sessions_purged", guests)
+    logger.info(
+        "Archive run: %d chats archived, %d codes and %d guest sessions purged in %.1fs",
+        chats, codes, guests, time.perf_counter() - started,
+    )
+
+
+async def archive_loop() -> None:
+    while True:
+        try:
+            await run_once()
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error("Archive run failed: %s", e)
+        await asyncio.sleep(ARCHIVE_INTERVAL_MIN * 60)
@@ -6,22 +6,19 @@
  - гостевой доступ с ограничением запросов
  - вход через Google (OIDC)
 Зависимости: passlib[bcrypt], python-jose[cryptography], google-auth
+
+Тяжёлые зависимости (google-auth, passlib/bcrypt, jose, SMTP) импортируются
+лениво — при первом использовании, чтобы не замедлять холодный старт.
 """
 
 import secrets
 import string
 from datetime import datetime, timedelta, timezone
+from functools import lru_cache
 from typing import Optional
 import logging
 import asyncio
-from google.oauth2 import id_token
-from google.auth.transport import requests as google_requests
-from google.auth.exceptions import GoogleAuthError
-from jose import jwt, JWTError
-from passlib.context import CryptContext
-
-# Для отправки писем
-from web.mail_sender import send_email
+
 from config import (
     JWT_SECRET_KEY,       # теперь используем как SECRET_KEY для JWT
     EMAIL_FROM,           # e-mail отправителя
@@ -30,19 +27,11 @@ from config import (
     GOOGLE_CLIENT_ID,     # client ID для проверки audience
 )
 
-# DB-слой
-from db import (
-    create_user,
-    verify_user_password,
-    create_confirmation_code,
-    verify_confirmation_code,
-    is_email_confirmed,
-    create_guest_session,
-    get_guest_session,
-    increment_guest_request,
-    get_user_by_google_id,
-    create_google_account,
-)
+from web.lazy import lazy_module
+from web.profiling import stage
+
+# DB-слой (импортируется при первом обращении)
+db = lazy_module("db")
 
 # ─────────── Настройки JWT ───────────
 SECRET_KEY = JWT_SECRET_KEY
@@ -50,7 +39,11 @@ ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 60
 
 # ─────────── Контекст для хэшей паролей ───────────
-_pwd_ctx = CryptContext(schemes=["bcrypt"], deprecated="auto")
+@lru_cache(maxsize=1)
+def _pwd_ctx():
+    """CryptContext создаётся при первом хэшировании (импорт bcrypt небыстрый)."""
+    from passlib.context import CryptContext
+    return CryptContext(schemes=["bcrypt"], deprecated="auto")
 
 
 # ─────────── Утилиты ───────────
@@ -69,13 +62,14 @@ async def register_user(email: str, password: str) -> None:
     генерируем 6-значный код, сохраняем его и отправляем письмо.
     """
     # 1) Создаём пользователя (password_hash сохраняется)
-    pwd_hash = _pwd_ctx.hash(password)
-    await create_user(email=email, password_hash=pwd_hash)
+    with stage("bcrypt"):
+        pwd_hash = _pwd_ctx().hash(password)
+    await db.create_user(email=email, password_hash=pwd_hash)
 
     # 2) Генерируем и сохраняем код подтверждения
     code = _generate_confirmation_code()
     expires_at = _now_utc() + timedelta(minutes=CONFIRM_CODE_EXP_MIN)
-    await create_confirmation_code(user_email=email, code=code, expires_at=expires_at)
+    await db.create_confirmation_code(user_email=email, code=code, expires_at=expires_at)
 
     # 3) Отправляем код на почту
     subject = "Ваш код подтверждения Luch Neuro"
@@ -86,6 +80,7 @@ async def register_user(email: str, password: str) -> None:
         "Если вы не запрашивали регистрацию — просто проигнорируйте это письмо."
     )
     # Асинхронная отправка письма в отдельном потоке, чтобы не блокировать event-loop
+    from web.mail_sender import send_email
     await asyncio.to_thread(
         send_email,
         subject,
@@ -97,14 +92,14 @@ async def register_user(email: str, password: str) -> None:
 
 
 async def confirm_user_email(email: str, code: str) -> bool:
-    return await verify_confirmation_code(user_email=email, code=code)
+    return await db.verify_confirmation_code(user_email=email, code=code)
 
 async def is_user_email_confirmed(email: str) -> bool:
     """
     Возвращает True, если для этого email уже есть запись
     EmailConfirmationCode.confirmed == True.
     """
-    return await is_email_confirmed(user_email=email)
+    return await db.is_email_confirmed(user_email=email)
 
 
 # ─────────── Аутентификация email+пароль ───────────
@@ -114,7 +109,8 @@ async def authenticate_user(email: str, password: str) -> bool:
     2) Проверяем, что email уже подтверждён (есть confirmed=True).
     """
     # 1) проверяем пароль
-    ok = await verify_user_password(email=email, plain_password=password)
+    with stage("bcrypt"):
+        ok = await db.verify_user_password(email=email, plain_password=password)
     if not ok:
         return False
 
@@ -131,6 +127,10 @@ async def authenticate_google(id_token_str: str) -> Optional[str]:
     Декодируем и проверяем id_token от Google.
     Возвращаем email пользователя и привязываем к нашей БД.
     """
+    from google.oauth2 import id_token
+    from google.auth.transport import requests as google_requests
+    from google.auth.exceptions import GoogleAuthError
+
     try:
         info = id_token.verify_oauth2_token(
             id_token_str,
@@ -148,11 +148,11 @@ async def authenticate_google(id_token_str: str) -> Optional[str]:
         return None
 
     # 1) пытаемся найти существующего пользователя по google_id
-    user = await get_user_by_google_id(google_id)
+    user = await db.get_user_by_google_id(google_id)
     if user is None:
         # 2) или создаём нового пользователя и привязываем к нему Google-аккаунт
-        user = await create_user(email=email, password_hash=None)
-        await create_google_account(
+        user = await db.create_user(email=email, password_hash=None)
+        await db.create_google_account(
             user_id=user.id,
             google_id=google_id,
             email=email,
@@ -168,7 +168,7 @@ async def create_guest_token() -> str:
     Генерим уникальный токен для гостя, сохраняем сессию и возвращаем JWT.
     """
     token = secrets.token_urlsafe(32)
-    await create_guest_session(session_token=token)
+    await db.create_guest_session(session_token=token)
     # JWT с подом = токен гостя
     return create_access_token(sub=token, expires_minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
 
@@ -177,11 +177,11 @@ async def verify_guest_token(sub: str) -> bool:
     """
     Проверяем, что сессия гостя существует и не исчерпала лимит.
     """
-    gs = await get_guest_session(session_token=sub)
+    gs = await db.get_guest_session(session_token=sub)
     if not gs:
         return False
     # инкрементируем счётчик; если >3 — блокируем
-    cnt = await increment_guest_request(session_token=sub)
+    cnt = await db.increment_guest_request(session_token=sub)
     return cnt <= 3
 
 
@@ -190,6 +190,8 @@ def create_access_token(sub: str, expires_minutes: Optional[int] = None) -> str:
     """
     Генерирует JWT с полем 'sub' (email или guest-token) и временем жизни.
     """
+    from jose import jwt
+
     exp = _now_utc() + timedelta(minutes=expires_minutes or ACCESS_TOKEN_EXPIRE_MINUTES)
     payload = {"sub": sub, "exp": exp}
     return jwt.encode(payload, SECRET_KEY, algorithm=ALGORITHM)
@@ -199,6 +201,8 @@ async def decode_token(token: str) -> Optional[str]:
     """
     Декодирует JWT, возвращает поле 'sub' (string) или None при ошибке.
     """
+    from jose import jwt, JWTError
+
     try:
         data = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
         return data.get("sub")
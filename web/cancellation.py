@@ -0,0 +1,70 @@
+# web/cancellation.py
+"""
+Отмена вызова модели, когда HTTP-клиент закрыл соединение.
+
+run_until_disconnect() выполняет корутину и параллельно проверяет
+request.is_disconnected(). Если клиент ушёл, задача отменяется: CancelledError
+доходит до AIService и обрывает его HTTP-запрос к провайдеру. Лимит при этом
+не списывается — _apply_usage_limit вызывается только после ответа модели.
+
+Работает, только если между сервером и хэндлером нет BaseHTTPMiddleware
+(@app.middleware("http")): она забирает http.disconnect из канала receive.
+Все middleware приложения — чистый ASGI; tests/test_disconnect.py это проверяет.
+"""
+
+import asyncio
+import logging
+from typing import Any, Awaitable
+
+from fastapi import HTTPException
+from starlette.requests import Request
+
+from web import metrics
+
+logger = logging.getLogger(__name__)
+
+# nginx-совместимый код «клиент закрыл запрос» (ответ всё равно никто не прочтёт)
+HTTP_499_CLIENT_CLOSED_REQUEST = 499
+DISCONNECT_POLL_INTERVAL = 0.5  # сек
+
+
+def estimate_tokens(text: str | None) -> int:
+    """Грубая оценка числа токенов промпта (≈4 символа на токен)."""
+    return len(text) // 4 if isinstance(text, str) else 0
+
+
+async def run_until_disconnect(
+    request: Request,
+    awaitable: Awaitable[Any],
+    *,
+    prompt_tokens: int = 0,
+) -> Any:
+    """
+    Возвращает результат awaitable или, если клиент отключился раньше,
+    отменяет его и поднимает HTTPException(499).
+    prompt_tokens — оценка сэкономленных токенов для метрик.
+    """
+    task = asyncio.ensure_future(awaitable)
+    try:
+        while True:
+            done, _ = await asyncio.wait({task}, timeout=DISCONNECT_POLL_INTERVAL)
+            if done:
+                return task.result()
+            if await request.is_disconnected():
+                break
+    except asyncio.CancelledError:
+        task.cancel()
+        raise
+
+    task.cancel()
+    try:
+        await task
+    except asyncio.CancelledError:
+        pass
+    except Exception as e:
+        # задача успела упасть сама — клиенту всё равно уже не ответить
+        logger.debug("Task failed after client disconnect: %s", e)
+    metrics.incr("chat.client_disconnected")
+    metrics.incr("chat.saved_prompt_tokens_est", prompt_tokens)
+    logger.info("Client disconnected from %s, upstream call cancelled", request.url.path)
+    raise HTTPException(status_code=HTTP_499_CLIENT_CLOSED_REQUEST, detail="Client Closed Request")
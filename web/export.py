@@ -0,0 +1,152 @@
+# web/export.py
+"""
+Полная выгрузка истории чатов: GET /api/export?format=ndjson|zip
+
+Сообщения читаются из БД пачками фиксированного размера (keyset по id)
+и сразу уходят клиенту через StreamingResponse — память не зависит от
+объёма истории. Выгрузку можно продолжить с места обрыва:
+after_chat_id / after_message_id — последний полученный чат/сообщение.
+
+ - ndjson: строка {"type": "chat", ...} перед сообщениями каждого чата,
+   затем по строке {"type": "message", ...} на сообщение;
+ - zip: по Markdown-файлу на чат (chat-<id>.md).
+
+Архивные чаты (web/archive.py) читаются прямо из сжатого блоба и в
+messages не возвращаются — выгрузка не отменяет архивацию.
+"""
+
+import zipfile
+from typing import AsyncIterator, Literal
+
+from fastapi import APIRouter, Depends, Query
+from fastapi.responses import StreamingResponse
+
+from web.archive import unpack_messages
+from web.responses import dumps, row_to_dict
+from web.routes import db, require_email_user
+
+router = APIRouter(prefix="/api", tags=["export"])
+
+BATCH_SIZE = 500
+
+
+class _ChunkSink:
+    """Поток без seek/tell для zipfile: копит записанное до очередного drain()."""
+
+    def __init__(self):
+        self._chunks: list[bytes] = []
+
+    def write(self, data) -> int:
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self) -> None:
+        pass
+
+    def drain(self) -> bytes:
+        data = b"".join(self._chunks)
+        self._chunks.clear()
+        return data
+
+
+# ─────────── Чтение из БД ───────────
+async def _iter_chats(user_id: int, after_chat_id: int):
+    """Чаты пользователя по возрастанию id, начиная с after_chat_id (включительно)."""
+    chats = await db.get_user_chats(user_id)
+    for chat in sorted(chats, key=lambda c: c.id):
+        if chat.id >= after_chat_id:
+            yield chat
+
+
+async def _iter_messages(chat, after_message_id: int):
+    """Сообщения чата (dict для выгрузки) от старых к новым."""
+    if getattr(chat, "archived_at", None) is not None:
+        payload = await db.load_archived_chat(chat.id)
+        if payload is not None:
+            # архив целиком — один блоб, он уже в памяти; в messages не возвращаем
+            for row in unpack_messages(payload):
+                if row["id"] > after_message_id:
+                    yield {"type": "message", "chat_id": chat.id, **row}
+            return
+        # блоба нет — чат успели восстановить, сообщения снова в messages
+
+    last_id = after_message_id
+    while True:
+        batch = await db.get_messages_batch(chat.id, after_id=last_id, limit=BATCH_SIZE)
+        for m in batch:
+            yield _message_dict(m)
+        if len(batch) < BATCH_SIZE:
+            return
+        last_id = batch[-1].id
+
+
+def _message_dict(m) -> dict:
+    return {
+        "type": "message",
+        "id": m.id,
+        "chat_id": m.chat_id,
+        "role": m.role.value,
+        "content": m.content,
+        "timestamp": m.timestamp,
+        "prompt_tokens": m.prompt_tokens,
+        "completion_tokens": m.completion_tokens,
+    }
+
+
+# ─────────── Форматы ───────────
+async def _ndjson(user_id: int, after_chat_id: int, after_message_id: int) -> AsyncIterator[bytes]:
+    async for chat in _iter_chats(user_id, after_chat_id):
+        yield dumps({"type": "chat", **row_to_dict(chat)}) + b"\n"
+        start = after_message_id if chat.id == after_chat_id else 0
+        lines: list[bytes] = []
+        async for m in _iter_messages(chat, start):
+            lines.append(dumps(m) + b"\n")
+            if len(lines) >= BATCH_SIZE:
+                yield b"".join(lines)
+                lines.clear()
+        if lines:
+            yield b"".join(lines)
+
+
+async def _zip_markdown(user_id: int, after_chat_id: int, after_message_id: int) -> AsyncIterator[bytes]:
+    sink = _ChunkSink()
+    with zipfile.ZipFile(sink, mode="w", compression=zipfile.ZIP_DEFLATED) as zf:
+        async for chat in _iter_chats(user_id, after_chat_id):
+            start = after_message_id if chat.id == after_chat_id else 0
+            title = chat.title or f"Чат {chat.id}"
+            # force_zip64: размер файла заранее неизвестен
+            with zf.open(f"chat-{chat.id}.md", mode="w", force_zip64=True) as f:
+                f.write(f"# {title}\n\n".encode("utf-8"))
+                n = 0
+                async for m in _iter_messages(chat, start):
+                    f.write(
+                        f"### {m['role']} · {m['timestamp']:%Y-%m-%d %H:%M}\n\n{m['content']}\n\n".encode("utf-8")
+                    )
+                    n += 1
+                    if n % BATCH_SIZE == 0:
+                        yield sink.drain()
+            yield sink.drain()
+    # центральный каталог ZIP пишется при закрытии архива
+    yield sink.drain()
+
+
+# ─────────── Endpoint ───────────
+@router.get("/export", summary="Выгрузка всей истории чатов (потоково)")
+async def api_export(
+    format: Literal["ndjson", "zip"] = Query("ndjson"),
+    after_chat_id: int = Query(0, ge=0, description="продолжить с этого чата"),
+    after_message_id: int = Query(0, ge=0, description="последнее полученное сообщение в after_chat_id"),
+    subject: str = Depends(require_email_user),
+):
+    user = await db.get_or_create_user(email=subject)
+    if format == "zip":
+        body = _zip_markdown(int(user.id), after_chat_id, after_message_id)
+        media_type, filename = "application/zip", "luch-neuro-export.zip"
+    else:
+        body = _ndjson(int(user.id), after_chat_id, after_message_id)
+        media_type, filename = "application/x-ndjson", "luch-neuro-export.ndjson"
+    return StreamingResponse(
+        body,
+        media_type=media_type,
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'},
+    )
@@ -0,0 +1,132 @@
+# web/idempotency.py
+"""
+Idempotency-Key и single-flight для отправки сообщений в чат.
+
+Одновременные дубли (двойной клик, повтор запроса) ждут один и тот же вызов
+модели, а не запускают второй: ключ склейки — содержимое запроса, без
+Idempotency-Key. Сам Idempotency-Key — ключ хранилища готовых ответов:
+повтор с тем же ключом ещё ttl секунд получает результат из памяти.
+"""
+
+import asyncio
+import hashlib
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Hashable
+
+from web import metrics
+
+
+def payload_hash(*parts: str | bytes | None) -> str:
+    """Короткий хэш содержимого запроса (текст, промпт, байты картинки)."""
+    h = hashlib.sha256()
+    for part in parts:
+        if part is None:
+            part = b"\x00"
+        elif isinstance(part, str):
+            part = part.encode("utf-8")
+        h.update(len(part).to_bytes(8, "big"))
+        h.update(part)
+    return h.hexdigest()
+
+
+class SingleFlight:
+    """
+    Склеивает одновременные вызовы с одинаковым ключом и (по запросу)
+    кэширует результат на ttl секунд. Память ограничена max_entries.
+    """
+
+    def __init__(self, ttl: float = 300, max_entries: int = 1024):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._inflight: dict[Hashable, asyncio.Task] = {}
+        self._waiters: dict[Hashable, int] = {}
+        self._done: OrderedDict[Hashable, tuple[float, Any]] = OrderedDict()
+
+    def _get_done(self, key: Hashable) -> tuple[bool, Any]:
+        item = self._done.get(key)
+        if item is None:
+            return False, None
+        expires_at, result = item
+        if expires_at < time.monotonic():
+            del self._done[key]
+            return False, None
+        return True, result
+
+    def _store(self, key: Hashable, result: Any) -> None:
+        now = time.monotonic()
+        self._done[key] = (now + self.ttl, result)
+        self._done.move_to_end(key)
+        # сначала выкидываем протухшие, затем самые старые сверх лимита
+        while self._done:
+            oldest_key, (expires_at, _) = next(iter(self._done.items()))
+            if expires_at >= now and len(self._done) <= self.max_entries:
+                break
+            del self._done[oldest_key]
+
+    async def do(
+        self,
+        key: Hashable,
+        fn: Callable[[], Awaitable[Any]],
+        *,
+        replay_key: Hashable | None = None,
+    ) -> Any:
+        """
+        Выполняет fn() один раз на key (склейка одновременных дублей).
+        replay_key — ключ для повторной выдачи готового результата (строится
+        из Idempotency-Key клиента); None — результат не сохраняется.
+        Исключения не кэшируются, но получают все одновременные ожидающие.
+        """
+        if replay_key is not None:
+            found, result = self._get_done(replay_key)
+            if found:
+                metrics.incr("idempotency.replayed")
+                return result
+
+        task = self._inflight.get(key)
+        if task is not None:
+            metrics.incr("idempotency.coalesced")
+        else:
+            task = asyncio.ensure_future(fn())
+            self._inflight[key] = task
+            task.add_done_callback(lambda t: self._finish(key, t))
+        if replay_key is not None:
+            # у склеенных запросов могут быть разные ключи — сохраняем под каждым
+            task.add_done_callback(lambda t: self._remember(replay_key, t))
+        return await self._wait(key, task)
+
+    async def _wait(self, key: Hashable, task: asyncio.Task) -> Any:
+        """
+        Ждёт общую задачу. Если отменили последнего ожидающего (клиент ушёл),
+        отменяется и сама задача — вызов модели больше никому не нужен.
+        """
+        self._waiters[key] = self._waiters.get(key, 0) + 1
+        try:
+            return await asyncio.shield(task)
+        except asyncio.CancelledError:
+            if self._waiters.get(key) == 1 and not task.done():
+                task.cancel()
+                metrics.incr("chat.upstream_cancelled")
+            raise
+        finally:
+            left = self._waiters.get(key, 1) - 1
+            if left > 0:
+                self._waiters[key] = left
+            else:
+                self._waiters.pop(key, None)
+
+    def _finish(self, key: Hashable, task: asyncio.Task) -> None:
+        # вызывается по завершении задачи, даже если её инициатор уже ушёл
+        if self._inflight.get(key) is task:
+            del self._inflight[key]
+
+    def _remember(self, replay_key: Hashable, task: asyncio.Task) -> None:
+        if not task.cancelled() and task.exception() is None:
+            self._store(replay_key, task.result())
+
+    def stats(self) -> dict[str, int]:
+        return {"inflight": len(self._inflight), "stored": len(self._done)}
+
+
+# общий экземпляр для /api/chat/message и /api/chat/image
+chat_flight = SingleFlight()
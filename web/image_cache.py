@@ -0,0 +1,178 @@
+# web/image_cache.py
+"""
+Контентно-адресуемый кэш ответов vision-модели для /api/chat/image.
+
+Ключ — sha256 от (id пользователя, sha256 байтов изображения): повторная
+загрузка того же скриншота тем же пользователем не уходит в vision-API,
+а ответ одного пользователя никогда не отдаётся другому.
+Кэшируется только ответ на промпт по умолчанию — на свой вопрос пользователь
+ждёт свежий ответ.
+
+Два уровня:
+ - память: LRU на IMAGE_CACHE_MEMORY_ITEMS записей;
+ - диск (если задан IMAGE_CACHE_DIR): файл на запись, общий объём
+   ограничен IMAGE_CACHE_DISK_MB, вытесняются давно не читанные.
+Записи старше IMAGE_CACHE_TTL_HOURS считаются промахом.
+
+Включается IMAGE_CACHE_ENABLED и работает, только если у AIService есть
+record_exchange: историю чата при промахе пишет сам AIService, а ответ из
+кэша иначе не попал бы в историю (см. chat_image в web/routes.py).
+"""
+
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import time
+from collections import OrderedDict
+from pathlib import Path
+
+from config import (
+    IMAGE_CACHE_DIR,
+    IMAGE_CACHE_DISK_MB,
+    IMAGE_CACHE_MEMORY_ITEMS,
+    IMAGE_CACHE_TTL_HOURS,
+)
+from web import metrics
+
+logger = logging.getLogger(__name__)
+
+
+def content_hash(image_bytes: bytes) -> str:
+    return hashlib.sha256(image_bytes).hexdigest()
+
+
+def image_key(user_id: int, image_hash: str) -> str:
+    """Ключ записи: хэш картинки в пространстве конкретного пользователя."""
+    return hashlib.sha256(f"{user_id}:{image_hash}".encode("ascii")).hexdigest()
+
+
+class _DiskTier:
+    """Файлы <dir>/<ab>/<key>.json; индекс размеров держим в памяти."""
+
+    def __init__(self, root: Path, max_bytes: int):
+        self.root = root
+        self.max_bytes = max_bytes
+        self._sizes: OrderedDict[str, int] = OrderedDict()  # key → size, от давних к свежим
+        self._total = 0
+        self._loaded = False
+
+    def _path(self, key: str) -> Path:
+        return self.root / key[:2] / f"{key}.json"
+
+    def _load_index(self) -> None:
+        # восстанавливаем индекс после рестарта, порядок — по времени доступа
+        self.root.mkdir(parents=True, exist_ok=True)
+        entries = []
+        for path in self.root.glob("*/*.json"):
+            try:
+                st = path.stat()
+            except OSError:
+                continue
+            entries.append((st.st_mtime, path.stem, st.st_size))
+        for _, key, size in sorted(entries):
+            self._sizes[key] = size
+            self._total += size
+        self._loaded = True
+
+    def get(self, key: str, max_age: float) -> tuple[float, str] | None:
+        """(время записи, ответ) или None. mtime файла — время последнего доступа."""
+        if not self._loaded:
+            self._load_index()
+        if key not in self._sizes:
+            return None
+        path = self._path(key)
+        try:
+            entry = json.loads(path.read_text("utf-8"))
+            stored_at, answer = float(entry["stored_at"]), entry["answer"]
+            if time.time() - stored_at > max_age:
+                self._remove(key)
+                return None
+            os.utime(path)  # свежий доступ — дальше от вытеснения
+        except (OSError, ValueError, KeyError, TypeError):
+            self._remove(key)
+            return None
+        self._sizes.move_to_end(key)
+        return stored_at, answer
+
+    def put(self, key: str, stored_at: float, answer: str) -> None:
+        if not self._loaded:
+            self._load_index()
+        path = self._path(key)
+        data = json.dumps({"stored_at": stored_at, "answer": answer}, ensure_ascii=False).encode("utf-8")
+        path.parent.mkdir(exist_ok=True)
+        tmp = path.with_suffix(".tmp")
+        tmp.write_bytes(data)
+        os.replace(tmp, path)
+        self._total += len(data) - self._sizes.pop(key, 0)
+        self._sizes[key] = len(data)
+        while self._total > self.max_bytes and self._sizes:
+            self._remove(next(iter(self._sizes)))
+
+    def _remove(self, key: str) -> None:
+        self._total -= self._sizes.pop(key, 0)
+        try:
+            self._path(key).unlink()
+        except OSError:
+            pass
+
+
+class ImageAnalysisCache:
+    def __init__(
+        self,
+        memory_items: int = IMAGE_CACHE_MEMORY_ITEMS,
+        disk_dir: str = IMAGE_CACHE_DIR,
+        disk_mb: int = IMAGE_CACHE_DISK_MB,
+        ttl_hours: float = IMAGE_CACHE_TTL_HOURS,
+    ):
+        self.memory_items = memory_items
+        self.max_age = ttl_hours * 3600
+        self._memory: OrderedDict[str, tuple[float, str]] = OrderedDict()
+        self._disk = _DiskTier(Path(disk_dir), disk_mb * 1024 * 1024) if disk_dir else None
+        self._disk_lock = asyncio.Lock()
+
+    async def get(self, key: str) -> str | None:
+        item = self._memory.get(key)
+        if item is not None:
+            stored_at, answer = item
+            if time.time() - stored_at <= self.max_age:
+                self._memory.move_to_end(key)
+                metrics.incr("image_cache.hit_memory")
+                return answer
+            del self._memory[key]
+
+        if self._disk is not None:
+            try:
+                async with self._disk_lock:
+                    entry = await asyncio.to_thread(self._disk.get, key, self.max_age)
+            except OSError as e:
+                logger.warning("Image cache disk read failed: %s", e)
+                entry = None
+            if entry is not None:
+                stored_at, answer = entry
+                self._put_memory(key, answer, stored_at)
+                metrics.incr("image_cache.hit_disk")
+                return answer
+
+        metrics.incr("image_cache.miss")
+        return None
+
+    async def put(self, key: str, answer: str) -> None:
+        stored_at = time.time()
+        self._put_memory(key, answer, stored_at)
+        if self._disk is not None:
+            try:
+                async with self._disk_lock:
+                    await asyncio.to_thread(self._disk.put, key, stored_at, answer)
+            except OSError as e:
+                logger.warning("Image cache disk write failed: %s", e)
+
+    def _put_memory(self, key: str, answer: str, stored_at: float) -> None:
+        self._memory[key] = (stored_at, answer)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.memory_items:
+            self._memory.popitem(last=False)
+
+
+image_cache = ImageAnalysisCache()
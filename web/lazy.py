@@ -0,0 +1,36 @@
+# web/lazy.py
+"""
+Отложенный импорт тяжёлых модулей (db → SQLAlchemy и драйвер БД, bot.utils).
+
+    db = lazy_module("db")
+    user = await db.get_or_create_user(email=subject)
+
+Модуль импортируется при первом обращении к атрибуту, а не при импорте
+web.app, — холодный старт не платит за ORM, пока не пришёл первый запрос.
+"""
+
+import importlib
+from types import ModuleType
+
+
+class _LazyModule:
+    __slots__ = ("_name", "_module")
+
+    def __init__(self, name: str):
+        self._name = name
+        self._module: ModuleType | None = None
+
+    def __getattr__(self, attr: str):
+        # вызывается только для атрибутов, которых нет у самого прокси
+        module = self._module
+        if module is None:
+            module = self._module = importlib.import_module(self._name)
+        return getattr(module, attr)
+
+    def __repr__(self) -> str:
+        state = "loaded" if self._module is not None else "not loaded"
+        return f"<lazy module {self._name!r} ({state})>"
+
+
+def lazy_module(name: str) -> _LazyModule:
+    return _LazyModule(name)
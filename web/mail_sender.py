@@ -3,12 +3,8 @@ mail_sender.py — отправка обычных писем + коды под
 """
 
 import logging
-import smtplib
 import secrets
 from datetime import datetime, timedelta, timezone
-from email.mime.multipart import MIMEMultipart
-from email.mime.text import MIMEText
-from smtplib import SMTPException
 
 from config import (
     EMAIL_FROM,
@@ -37,7 +33,13 @@ def send_email(
 ) -> None:
     """
     Отправляет простое текстовое письмо через SMTP.
+    smtplib/MIME импортируются здесь, чтобы не грузить их при старте приложения.
     """
+    import smtplib
+    from email.mime.multipart import MIMEMultipart
+    from email.mime.text import MIMEText
+    from smtplib import SMTPException
+
     msg = MIMEMultipart()
     msg["From"] = from_email
     msg["To"] = to_email
@@ -0,0 +1,18 @@
+# web/metrics.py
+"""
+Простые in-process счётчики для эксплуатационных метрик
+(склеенные дубли запросов, отменённые вызовы модели и т.п.).
+Отдаются через GET /api/metrics.
+"""
+
+from collections import Counter
+
+_counters: Counter = Counter()
+
+
+def incr(name: str, value: int = 1) -> None:
+    _counters[name] += value
+
+
+def snapshot() -> dict[str, int]:
+    return dict(_counters)
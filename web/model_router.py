@@ -0,0 +1,219 @@
+# web/model_router.py
+"""
+Маршрутизация вызовов между моделями (ключи MODELS из config).
+
+Для каждой модели ведётся скользящая статистика задержек и ошибок.
+ - hedging: если основная модель не ответила за порог (p95 или
+   MODEL_HEDGE_AFTER_SEC), параллельно запускается разрешённая запасная;
+   побеждает первый успешный ответ, второй вызов отменяется;
+ - fallback: при ошибке основной модели пробуем следующую разрешённую;
+ - circuit breaker: модель с высокой долей ошибок на время выводится
+   из ротации; после cooldown пропускается один пробный запрос, и только
+   его успех снова включает модель (поздние ответы запросов, начатых до
+   размыкания, состояние не меняют).
+call() возвращает (ответ, ключ ответившей модели) — лимиты и метрики
+считаются по модели, которая фактически ответила.
+Какие запасные модели доступны, задаётся по тарифу в MODEL_FALLBACKS.
+Отказом модели считаются только ошибки провайдера и транспорта: ошибки
+нашего кода (PROGRAMMING_ERRORS) статистику не портят, на запасную модель
+не переключают и пробрасываются сразу.
+"""
+
+import asyncio
+import logging
+import time
+from collections import deque
+from typing import Any, Awaitable, Callable
+
+from config import (
+    MODEL_BREAKER_COOLDOWN_SEC,
+    MODEL_BREAKER_ERROR_RATE,
+    MODEL_FALLBACKS,
+    MODEL_HEDGE_AFTER_SEC,
+    MODEL_HEDGE_ENABLED,
+)
+from web import metrics
+
+logger = logging.getLogger(__name__)
+
+WINDOW_SIZE = 50          # последних вызовов в статистике модели
+MIN_SAMPLES = 10          # меньше — не судим о доле ошибок и p95
+HEDGE_MIN_SEC = 2.0       # не хеджируем раньше (короткие ответы и так быстрые)
+HEDGE_MAX_SEC = 60.0      # и не позже
+
+# баг вызова (неверная сигнатура, опечатка в атрибуте), а не отказ модели
+PROGRAMMING_ERRORS = (TypeError, AttributeError, NameError, ImportError, AssertionError, NotImplementedError)
+
+
+class ModelUnavailableError(RuntimeError):
+    """Ни одна из разрешённых моделей сейчас недоступна."""
+
+
+class ModelStats:
+    """Скользящее окно задержек/ошибок и состояние circuit breaker одной модели."""
+
+    def __init__(self):
+        self.calls: deque[tuple[float, bool]] = deque(maxlen=WINDOW_SIZE)
+        self.opened_at: float | None = None
+        self.probe_in_flight = False
+
+    def record(self, latency: float, ok: bool, probe: bool = False) -> None:
+        self.calls.append((latency, ok))
+        if probe:
+            self.probe_in_flight = False
+            if ok:
+                # модель снова в ротации; старое окно с ошибками сразу бы её разомкнуло
+                logger.info("Model circuit closed after successful probe")
+                self.opened_at = None
+                self.calls.clear()
+            else:
+                self.opened_at = time.monotonic()
+        elif self.opened_at is None and not ok and self._should_open():
+            metrics.incr("router.breaker_opened")
+            self.opened_at = time.monotonic()
+        # остальное — ответы запросов, начатых до размыкания: состояние не трогают
+
+    def _should_open(self) -> bool:
+        return len(self.calls) >= MIN_SAMPLES and self.error_rate() >= MODEL_BREAKER_ERROR_RATE
+
+    def error_rate(self) -> float:
+        if not self.calls:
+            return 0.0
+        return sum(1 for _, ok in self.calls if not ok) / len(self.calls)
+
+    def p95(self) -> float | None:
+        latencies = sorted(lat for lat, ok in self.calls if ok)
+        if len(latencies) < MIN_SAMPLES:
+            return None
+        return latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))]
+
+    def available(self) -> bool:
+        """Закрыт — да; открыт — нет; после cooldown — пропускаем одну пробу."""
+        if self.opened_at is None:
+            return True
+        if time.monotonic() - self.opened_at < MODEL_BREAKER_COOLDOWN_SEC:
+            return False
+        return not self.probe_in_flight
+
+    def state(self) -> str:
+        if self.opened_at is None:
+            return "closed"
+        if time.monotonic() - self.opened_at < MODEL_BREAKER_COOLDOWN_SEC:
+            return "open"
+        return "half-open"
+
+
+class ModelRouter:
+    def __init__(self, fallbacks: dict[str, dict[str, list[str]]] | None = None):
+        self.fallbacks = MODEL_FALLBACKS if fallbacks is None else fallbacks
+        self.stats: dict[str, ModelStats] = {}
+
+    def _stats(self, model_key: str) -> ModelStats:
+        if model_key not in self.stats:
+            self.stats[model_key] = ModelStats()
+        return self.stats[model_key]
+
+    def candidates(self, model_key: str, plan: str) -> list[str]:
+        return [model_key] + list(self.fallbacks.get(plan, {}).get(model_key, []))
+
+    def hedge_delay(self, model_key: str) -> float | None:
+        if not MODEL_HEDGE_ENABLED:
+            return None
+        if MODEL_HEDGE_AFTER_SEC > 0:
+            return MODEL_HEDGE_AFTER_SEC
+        p95 = self._stats(model_key).p95()
+        if p95 is None:
+            return None
+        return min(max(p95, HEDGE_MIN_SEC), HEDGE_MAX_SEC)
+
+    async def _timed(self, model_key: str, call: Callable[[str], Awaitable[Any]], probe: bool) -> Any:
+        st = self._stats(model_key)
+        start = time.monotonic()
+        try:
+            result = await call(model_key)
+        except (asyncio.CancelledError, *PROGRAMMING_ERRORS):
+            if probe:
+                st.probe_in_flight = False
+            raise
+        except Exception:
+            st.record(time.monotonic() - start, ok=False, probe=probe)
+            raise
+        st.record(time.monotonic() - start, ok=True, probe=probe)
+        return result
+
+    async def call(
+        self,
+        model_key: str,
+        plan: str,
+        call: Callable[[str], Awaitable[Any]],
+        fallback: bool = True,
+    ) -> tuple[Any, str]:
+        """
+        Выполняет call(model_key) с учётом hedging/fallback/circuit breaker.
+        call получает ключ модели, которой нужно ответить.
+        fallback=False — только основная модель (вызов не умеет выбирать модель).
+        Возвращает (результат, ключ модели, которая его дала).
+        Если все модели недоступны или упали — пробрасывает последнюю ошибку
+        (или ModelUnavailableError, если ни одна не была вызвана).
+        """
+        candidates = self.candidates(model_key, plan) if fallback else [model_key]
+        queue = [mk for mk in candidates if self._stats(mk).available()]
+        if not queue:
+            metrics.incr("router.shed")
+            raise ModelUnavailableError(f"Модель {model_key} временно недоступна")
+        if queue[0] != model_key:
+            metrics.incr("router.fallback")
+
+        running: dict[asyncio.Task, str] = {}
+        last_error: Exception | None = None
+
+        def start_next() -> None:
+            mk = queue.pop(0)
+            st = self._stats(mk)
+            probe = st.opened_at is not None
+            if probe:
+                st.probe_in_flight = True  # half-open: это единственная проба
+            running[asyncio.ensure_future(self._timed(mk, call, probe))] = mk
+
+        start_next()
+        try:
+            while running:
+                # хеджируем только пока работает единственный вызов
+                timeout = self.hedge_delay(next(iter(running.values()))) if len(running) == 1 and queue else None
+                done, _ = await asyncio.wait(running, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+                if not done:
+                    metrics.incr("router.hedged")
+                    start_next()
+                    continue
+                for task in done:
+                    mk = running.pop(task)
+                    if task.exception() is None:
+                        if mk != model_key:
+                            metrics.incr("router.served_by_fallback")
+                        metrics.incr(f"router.served.{mk}")
+                        return task.result(), mk
+                    last_error = task.exception()
+                    if isinstance(last_error, PROGRAMMING_ERRORS):
+                        raise last_error
+                    logger.warning("Model %s failed: %s", mk, last_error)
+                if not running and queue:
+                    metrics.incr("router.fallback")
+                    start_next()
+        finally:
+            for task in running:
+                task.cancel()
+        raise last_error
+
+    def snapshot(self) -> dict[str, dict]:
+        return {
+            mk: {
+                "state": st.state(),
+                "error_rate": round(st.error_rate(), 3),
+                "p95_sec": st.p95(),
+                "samples": len(st.calls),
+            }
+            for mk, st in self.stats.items()
+        }
+
+
+model_router = ModelRouter()
@@ -0,0 +1,317 @@
+# web/profiling.py
+"""
+Профилирование запросов по требованию (PROFILE_ENABLED).
+
+ - Профиль запроса: по заголовку X-Profile: <PROFILE_TOKEN> или случайно
+   с долей PROFILE_SAMPLE_RATE для /api/*. Профилировщик — pyinstrument
+   (понимает async, пишет *.speedscope.json — флеймграф на speedscope.app).
+   Без него — cProfile, но это приблизительный профиль: cProfile видит поток
+   целиком, а не запрос, — в него попадают корутины соседних запросов, а
+   время ожидания await не отделяется от работы. Такие файлы называются
+   *.sync-approx.prof (смотреть через snakeviz), при первом профиле в лог
+   пишется предупреждение. Одновременно профилируется не больше одного
+   запроса. Имя файла — в X-Profile-File.
+ - Медленные запросы (дольше PROFILE_SLOW_MS; для вызовов модели, которые
+   и так идут десятки секунд, — PROFILE_SLOW_MODEL_MS): в лог и в
+   slow-*.json пишется разбивка по этапам, размеченным stage("...").
+ - В PROFILE_DIR хранится не больше PROFILE_MAX_FILES файлов: при записи
+   нового удаляются самые старые.
+ - Детектор блокировок event loop (LOOP_BLOCK_MS): сторожевой поток
+   логирует стек, на котором loop завис дольше порога.
+
+Выключенное профилирование не подключает middleware, а stage() стоит
+одного чтения contextvar. Middleware — чистый ASGI (как остальные в
+web/app.py), чтобы не ломать отмену по http.disconnect.
+"""
+
+import asyncio
+import contextvars
+import logging
+import random
+import secrets
+import sys
+import threading
+import time
+import traceback
+from collections import deque
+from datetime import datetime
+from pathlib import Path
+
+from fastapi import Request
+from starlette.datastructures import MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from config import (
+    PROFILE_DIR,
+    PROFILE_MAX_FILES,
+    PROFILE_SAMPLE_RATE,
+    PROFILE_SLOW_MODEL_MS,
+    PROFILE_SLOW_MS,
+    PROFILE_TOKEN,
+)
+from web import metrics
+from web.responses import dumps
+
+logger = logging.getLogger(__name__)
+
+# маршруты с вызовом модели: обычная задержка — секунды и десятки секунд
+MODEL_PATHS = frozenset({"/api/chat/message", "/api/chat/image"})
+
+# этапы текущего запроса: [(имя, мс), ...]; None — запрос не измеряется
+_stages: contextvars.ContextVar[list | None] = contextvars.ContextVar("profile_stages", default=None)
+
+
+class stage:
+    """Разметка этапа запроса: `with stage("model"): answer = await ...`."""
+
+    __slots__ = ("name", "_stages", "_start")
+
+    def __init__(self, name: str):
+        self.name = name
+
+    def __enter__(self):
+        self._stages = _stages.get()
+        if self._stages is not None:
+            self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc) -> None:
+        if self._stages is not None:
+            self._stages.append((self.name, (time.perf_counter() - self._start) * 1000))
+
+
+# ─────────── Профилировщик ───────────
+_cprofile_warned = False
+
+
+class _Profile:
+    """pyinstrument (async-aware), если установлен, иначе cProfile (приблизительно)."""
+
+    def __init__(self):
+        global _cprofile_warned
+        try:
+            from pyinstrument import Profiler  # необязательная зависимость
+        except ImportError:
+            import cProfile
+
+            if not _cprofile_warned:
+                _cprofile_warned = True
+                logger.warning(
+                    "pyinstrument is not installed: falling back to cProfile, "
+                    "profiles are thread-wide and approximate for async code (*.sync-approx.prof)"
+                )
+            self.kind = "cprofile"
+            self._profiler = cProfile.Profile()
+        else:
+            self.kind = "pyinstrument"
+            self._profiler = Profiler(interval=0.001, async_mode="enabled")
+
+    def start(self) -> None:
+        if self.kind == "pyinstrument":
+            self._profiler.start()
+        else:
+            self._profiler.enable()
+
+    def stop(self) -> None:
+        if self.kind == "pyinstrument":
+            self._profiler.stop()
+        else:
+            self._profiler.disable()
+
+    def write(self, base: Path) -> Path:
+        if self.kind == "pyinstrument":
+            from pyinstrument.renderers import SpeedscopeRenderer
+
+            path = base.with_name(base.name + ".speedscope.json")
+            path.write_text(self._profiler.output(renderer=SpeedscopeRenderer()), "utf-8")
+        else:
+            path = base.with_name(base.name + ".sync-approx.prof")
+            self._profiler.dump_stats(path)
+        return path
+
+
+_profile_active = False
+
+
+def _wants_profile(request: Request) -> bool:
+    header = request.headers.get("x-profile")
+    if header is not None:
+        # байты: compare_digest не принимает не-ASCII str (TypeError → 500 на любом пути)
+        return bool(PROFILE_TOKEN) and secrets.compare_digest(header.encode(), PROFILE_TOKEN.encode())
+    return (
+        PROFILE_SAMPLE_RATE > 0
+        and request.url.path.startswith("/api/")
+        and random.random() < PROFILE_SAMPLE_RATE
+    )
+
+
+def _file_base(request: Request, prefix: str) -> Path:
+    slug = request.url.path.strip("/").replace("/", "_") or "root"
+    stamp = datetime.now().strftime("%Y%m%d-%H%M%S-%f")
+    return Path(PROFILE_DIR) / f"{prefix}-{stamp}-{slug}"
+
+
+def _slow_threshold_ms(path: str) -> float:
+    return PROFILE_SLOW_MODEL_MS if path in MODEL_PATHS else PROFILE_SLOW_MS
+
+
+class _FileCap:
+    """Не больше max_files файлов в каталоге профилей; вытесняются самые старые."""
+
+    def __init__(self, max_files: int):
+        self.max_files = max_files
+        self._dir: Path | None = None
+        self._files: deque[Path] = deque()
+        self._lock = threading.Lock()  # запись идёт из asyncio.to_thread
+
+    def add(self, path: Path) -> None:
+        with self._lock:
+            if self._dir != path.parent:
+                # файлы прошлых запусков — тоже в счёт лимита
+                existing = [p for p in path.parent.iterdir() if p.is_file() and p != path]
+                self._files = deque(sorted(existing, key=lambda p: p.stat().st_mtime))
+                self._dir = path.parent
+            self._files.append(path)
+            while len(self._files) > self.max_files:
+                self._files.popleft().unlink(missing_ok=True)
+
+
+_file_cap = _FileCap(PROFILE_MAX_FILES)
+
+
+def _write_slow(base: Path, record: dict) -> None:
+    base.parent.mkdir(parents=True, exist_ok=True)
+    path = base.with_name(base.name + ".json")
+    path.write_bytes(dumps(record))
+    _file_cap.add(path)
+
+
+def _write_profile(profile: _Profile, base: Path) -> Path:
+    base.parent.mkdir(parents=True, exist_ok=True)
+    path = profile.write(base)
+    _file_cap.add(path)
+    return path
+
+
+# ─────────── Middleware ───────────
+class ProfilingMiddleware:
+    """
+    Чистый ASGI: профилировщик останавливается на http.response.start —
+    к этому моменту хэндлер отработал, а заголовок X-Profile-File ещё
+    можно добавить. Тело потоковых ответов в профиль не попадает.
+    """
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        global _profile_active
+
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        request = Request(scope)
+        profile = None
+        if not _profile_active and _wants_profile(request):
+            profile = _Profile()
+            _profile_active = True
+            profile.start()
+
+        status_code = 500
+
+        def stop_profile() -> _Profile | None:
+            global _profile_active
+            nonlocal profile
+            captured, profile = profile, None
+            if captured is not None:
+                captured.stop()
+                _profile_active = False
+            return captured
+
+        async def send_profiled(message: Message) -> None:
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+                captured = stop_profile()
+                if captured is not None:
+                    try:
+                        path = await asyncio.to_thread(_write_profile, captured, _file_base(request, "profile"))
+                        MutableHeaders(scope=message)["X-Profile-File"] = path.name
+                        metrics.incr("profile.captured")
+                    except OSError as e:
+                        logger.warning("Profile write failed: %s", e)
+            await send(message)
+
+        stages: list = []
+        token = _stages.set(stages)
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_profiled)
+        finally:
+            elapsed_ms = (time.perf_counter() - start) * 1000
+            _stages.reset(token)
+            stop_profile()  # ответ так и не начался (исключение, отмена)
+
+        if elapsed_ms >= _slow_threshold_ms(scope["path"]):
+            metrics.incr("profile.slow_requests")
+            breakdown = ", ".join(f"{name}={ms:.0f}ms" for name, ms in stages) or "no stages"
+            logger.warning(
+                "Slow request %s %s: %.0f ms (%s)", request.method, request.url.path, elapsed_ms, breakdown
+            )
+            record = {
+                "method": request.method,
+                "path": request.url.path,
+                "status": status_code,
+                "elapsed_ms": round(elapsed_ms, 1),
+                "stages": [{"name": name, "ms": round(ms, 1)} for name, ms in stages],
+            }
+            try:
+                await asyncio.to_thread(_write_slow, _file_base(request, "slow"), record)
+            except OSError as e:
+                logger.warning("Slow request record write failed: %s", e)
+
+
+# ─────────── Детектор блокировок event loop ───────────
+class LoopBlockDetector:
+    """
+    Loop раз в interval обновляет метку времени; сторожевой поток, заметив,
+    что метка не обновлялась дольше порога, логирует стек потока loop.
+    """
+
+    def __init__(self, threshold_ms: int):
+        self.threshold = threshold_ms / 1000
+        self.interval = max(0.01, self.threshold / 4)
+        self._last = time.monotonic()
+        self._stop = threading.Event()
+        self._loop: asyncio.AbstractEventLoop | None = None
+        self._loop_thread_id = 0
+        self._handle: asyncio.TimerHandle | None = None
+
+    def start(self, loop: asyncio.AbstractEventLoop) -> None:
+        self._loop = loop
+        self._loop_thread_id = threading.get_ident()
+        self._tick()
+        threading.Thread(target=self._watch, name="loop-block-detector", daemon=True).start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._handle is not None:
+            self._handle.cancel()
+
+    def _tick(self) -> None:
+        self._last = time.monotonic()
+        if not self._stop.is_set():
+            self._handle = self._loop.call_later(self.interval, self._tick)
+
+    def _watch(self) -> None:
+        reported = None  # одна запись на одну блокировку
+        while not self._stop.wait(self.interval):
+            last = self._last
+            lag = time.monotonic() - last - self.interval
+            if lag < self.threshold or reported == last:
+                continue
+            reported = last
+            frame = sys._current_frames().get(self._loop_thread_id)
+            stack = "".join(traceback.format_stack(frame)) if frame is not None else "<no frame>"
+            metrics.incr("profile.loop_blocked")
+            logger.warning("Event loop blocked for %.0f ms at:\n%s", lag * 1000, stack)
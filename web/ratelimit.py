@@ -0,0 +1,238 @@
+# web/ratelimit.py
+"""
+Token-bucket ограничение частоты для эндпоинтов аутентификации.
+
+Каждый вызов /api/register, /api/confirm, /api/login/* стоит bcrypt,
+SMTP-сессию или новую гостевую сессию в БД, поэтому:
+ - middleware ограничивает их по IP клиента (RATE_LIMIT_RULES);
+ - хэндлеры дополнительно ограничивают попытки на один e-mail (EMAIL_RULES);
+ - вход по паролю: считаются только неудачные попытки и на пару (e-mail, IP) —
+   чужие неверные пароли не блокируют вход владельцу аккаунта.
+Размеры корзин задаются в config (RATE_LIMIT_IP_*, RATE_LIMIT_EMAIL_*).
+
+Корзины хранятся в памяти процесса (O(1) на проверку, LRU-вытеснение)
+или, если задан RATE_LIMIT_REDIS_URL, в Redis — общие для всех реплик.
+При превышении отдаётся 429 с корректным Retry-After.
+
+RateLimitMiddleware — чистый ASGI (не BaseHTTPMiddleware): не копирует
+канал receive, поэтому не мешает отслеживать отключение клиента, а прочие
+запросы проходят за одно сравнение метода и поиск пути в dict. Подключается
+внутри CORSMiddleware, чтобы 429 нёс CORS-заголовки и SPA видела Retry-After.
+"""
+
+import logging
+import math
+import time
+from collections import OrderedDict
+from typing import NamedTuple
+
+from fastapi import HTTPException, Request, status
+from fastapi.responses import JSONResponse
+from starlette.types import ASGIApp, Receive, Scope, Send
+
+from config import (
+    RATE_LIMIT_EMAIL_CONFIRM,
+    RATE_LIMIT_EMAIL_REGISTER,
+    RATE_LIMIT_ENABLED,
+    RATE_LIMIT_IP_CONFIRM,
+    RATE_LIMIT_IP_GUEST,
+    RATE_LIMIT_IP_LOGIN,
+    RATE_LIMIT_IP_REGISTER,
+    RATE_LIMIT_LOGIN_FAILURES,
+    RATE_LIMIT_REDIS_URL,
+    RATE_LIMIT_TRUST_PROXY,
+)
+from web import metrics
+
+logger = logging.getLogger(__name__)
+
+
+class Rule(NamedTuple):
+    capacity: int        # максимальный «залп» запросов
+    per_seconds: float   # за сколько секунд корзина наполняется целиком
+
+    @property
+    def rate(self) -> float:
+        return self.capacity / self.per_seconds
+
+
+# ─────────── Правила ───────────
+# по IP клиента (путь → правило)
+RATE_LIMIT_RULES: dict[str, Rule] = {
+    "/api/register":     Rule(RATE_LIMIT_IP_REGISTER, 600),
+    "/api/confirm":      Rule(RATE_LIMIT_IP_CONFIRM, 600),
+    "/api/login/email":  Rule(RATE_LIMIT_IP_LOGIN, 60),
+    "/api/login/google": Rule(RATE_LIMIT_IP_LOGIN, 60),
+    "/api/login/guest":  Rule(RATE_LIMIT_IP_GUEST, 3600),
+}
+# по e-mail из тела запроса (имя правила → правило)
+EMAIL_RULES: dict[str, Rule] = {
+    "register": Rule(RATE_LIMIT_EMAIL_REGISTER, 3600),   # каждое — письмо через SMTP
+    "confirm":  Rule(RATE_LIMIT_EMAIL_CONFIRM, 900),     # перебор 6-значного кода
+}
+# неудачные входы по паролю на пару (e-mail, IP): перебор, bcrypt на каждую попытку
+LOGIN_FAILURE_RULE = Rule(RATE_LIMIT_LOGIN_FAILURES, 300)
+
+
+# ─────────── Хранилища ───────────
+class MemoryBackend:
+    """Корзины в памяти процесса; при переполнении вытесняются самые давние."""
+
+    def __init__(self, max_keys: int = 100_000):
+        self.max_keys = max_keys
+        self._buckets: OrderedDict[str, list[float]] = OrderedDict()
+
+    def take(self, key: str, rule: Rule, now: float, spend: bool = True) -> float:
+        """
+        Списывает токен (spend=False — только проверяет). Возвращает 0,
+        если можно, иначе — сколько секунд ждать.
+        """
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            if spend:
+                if len(self._buckets) >= self.max_keys:
+                    self._buckets.popitem(last=False)
+                self._buckets[key] = [rule.capacity - 1.0, now]
+            return 0.0
+
+        self._buckets.move_to_end(key)
+        tokens = min(rule.capacity, bucket[0] + (now - bucket[1]) * rule.rate)
+        bucket[1] = now
+        if tokens >= 1.0:
+            bucket[0] = tokens - 1.0 if spend else tokens
+            return 0.0
+        bucket[0] = tokens
+        return (1.0 - tokens) / rule.rate
+
+
+_REDIS_TAKE = """
+local rate = tonumber(ARGV[1])
+local capacity = tonumber(ARGV[2])
+local now = tonumber(ARGV[3])
+local spend = tonumber(ARGV[4])
+local state = redis.call('HMGET', KEYS[1], 't', 'ts')
+local tokens = tonumber(state[1]) or capacity
+local ts = tonumber(state[2]) or now
+tokens = math.min(capacity, tokens + math.max(0, now - ts) * rate)
+local wait = 0
+if tokens >= 1 then
+    tokens = tokens - spend
+else
+    wait = (1 - tokens) / rate
+end
+redis.call('HSET', KEYS[1], 't', tokens, 'ts', now)
+redis.call('PEXPIRE', KEYS[1], math.ceil(capacity / rate * 1000))
+return tostring(wait)
+"""
+
+
+class RedisBackend:
+    """Общие для всех реплик корзины в Redis (атомарно, одним Lua-скриптом)."""
+
+    def __init__(self, url: str):
+        import redis.asyncio as redis  # необязательная зависимость
+
+        self._redis = redis.from_url(url)
+        self._script = self._redis.register_script(_REDIS_TAKE)
+
+    async def take(self, key: str, rule: Rule, now: float, spend: bool = True) -> float:
+        wait = await self._script(keys=[f"rl:{key}"], args=[rule.rate, rule.capacity, now, int(spend)])
+        return float(wait)
+
+
+class RateLimiter:
+    def __init__(self, redis_url: str = ""):
+        self.memory = MemoryBackend()
+        self.redis = RedisBackend(redis_url) if redis_url else None
+
+    async def check(self, key: str, rule: Rule, spend: bool = True) -> float:
+        """0 — запрос разрешён, иначе Retry-After в секундах. spend=False — не списывать."""
+        now = time.time()
+        if self.redis is not None:
+            try:
+                return await self.redis.take(key, rule, now, spend)
+            except Exception as e:
+                # Redis недоступен — не роняем вход, считаем локально
+                logger.warning("Rate limit backend error, using memory: %s", e)
+        return self.memory.take(key, rule, now, spend)
+
+
+limiter = RateLimiter(RATE_LIMIT_REDIS_URL)
+
+
+# ─────────── Утилиты ───────────
+def client_ip(request: Request) -> str:
+    # каждый прокси дописывает адрес справа; всё левее наших прокси задаёт клиент
+    if RATE_LIMIT_TRUST_PROXY > 0:
+        forwarded = [part.strip() for part in request.headers.get("x-forwarded-for", "").split(",")]
+        if len(forwarded) >= RATE_LIMIT_TRUST_PROXY and forwarded[-RATE_LIMIT_TRUST_PROXY]:
+            return forwarded[-RATE_LIMIT_TRUST_PROXY]
+    return request.client.host if request.client else "unknown"
+
+
+def _too_many(retry_after: float) -> dict[str, str]:
+    return {"Retry-After": str(max(1, math.ceil(retry_after)))}
+
+
+class RateLimitMiddleware:
+    """Лимит по IP для POST на пути из RATE_LIMIT_RULES; остальные пропускаются без затрат."""
+
+    def __init__(self, app: ASGIApp, enabled: bool = RATE_LIMIT_ENABLED):
+        self.app = app
+        self.enabled = enabled
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if not self.enabled or scope["type"] != "http" or scope["method"] != "POST":
+            return await self.app(scope, receive, send)
+        path = scope["path"]
+        rule = RATE_LIMIT_RULES.get(path)
+        if rule is None:
+            return await self.app(scope, receive, send)
+
+        retry_after = await limiter.check(f"ip:{path}:{client_ip(Request(scope))}", rule)
+        if retry_after > 0:
+            metrics.incr("ratelimit.ip_rejected")
+            response = JSONResponse(
+                status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+                content={"detail": "Слишком много попыток. Попробуйте позже."},
+                headers=_too_many(retry_after),
+            )
+            return await response(scope, receive, send)
+        await self.app(scope, receive, send)
+
+
+def _email_rejected(retry_after: float) -> HTTPException:
+    metrics.incr("ratelimit.email_rejected")
+    return HTTPException(
+        status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+        detail="Слишком много попыток для этого e-mail. Попробуйте позже.",
+        headers=_too_many(retry_after),
+    )
+
+
+async def enforce_email_limit(rule_name: str, email: str) -> None:
+    """Лимит попыток на один e-mail; HTTP 429 с Retry-After при превышении."""
+    if not RATE_LIMIT_ENABLED:
+        return
+    retry_after = await limiter.check(f"email:{rule_name}:{email.strip().lower()}", EMAIL_RULES[rule_name])
+    if retry_after > 0:
+        raise _email_rejected(retry_after)
+
+
+def _login_key(request: Request, email: str) -> str:
+    return f"login:{email.strip().lower()}:{client_ip(request)}"
+
+
+async def enforce_login_limit(request: Request, email: str) -> None:
+    """До проверки пароля: 429, если с этого IP для e-mail исчерпаны неудачные попытки."""
+    if not RATE_LIMIT_ENABLED:
+        return
+    retry_after = await limiter.check(_login_key(request, email), LOGIN_FAILURE_RULE, spend=False)
+    if retry_after > 0:
+        raise _email_rejected(retry_after)
+
+
+async def record_login_failure(request: Request, email: str) -> None:
+    """Неверный пароль списывает токен из корзины пары (e-mail, IP)."""
+    if RATE_LIMIT_ENABLED:
+        await limiter.check(_login_key(request, email), LOGIN_FAILURE_RULE)
@@ -0,0 +1,78 @@
+# web/responses.py
+"""
+Быстрая сериализация ответов API.
+
+FastJSONResponse кодирует данные через orjson (если установлен, иначе stdlib json)
+и возвращается из эндпоинта напрямую — FastAPI в этом случае не прогоняет
+результат повторно через response_model и jsonable_encoder.
+"""
+
+import json
+from datetime import date, datetime
+from decimal import Decimal
+from enum import Enum
+from typing import Any, Iterable
+
+from starlette.responses import JSONResponse
+
+try:
+    import orjson
+except ImportError:  # orjson — необязательная зависимость
+    orjson = None
+
+
+# ─────────── ORM → dict ───────────
+def row_to_dict(obj: Any) -> dict:
+    """
+    Загруженные атрибуты ORM-объекта без служебного состояния SQLAlchemy
+    (то же, что отдавал jsonable_encoder, но без обхода через pydantic).
+    Незагруженные связи не трогаем — в async-сессии это вызвало бы запрос к БД.
+    """
+    return {k: v for k, v in vars(obj).items() if not k.startswith("_sa")}
+
+
+def message_rows(messages: Iterable[Any]) -> list[dict]:
+    """Сообщения чата в формате MessageOut (поля уже валидны — они из БД)."""
+    return [
+        {
+            "id": m.id,
+            "role": m.role.value,
+            "content": m.content,
+            "timestamp": m.timestamp,
+            "prompt_tokens": m.prompt_tokens,
+            "completion_tokens": m.completion_tokens,
+        }
+        for m in messages
+    ]
+
+
+def _default(obj: Any) -> Any:
+    if isinstance(obj, Enum):
+        return obj.value
+    if isinstance(obj, (datetime, date)):
+        return obj.isoformat()
+    if isinstance(obj, Decimal):
+        return float(obj)
+    if hasattr(obj, "__dict__"):
+        return row_to_dict(obj)
+    raise TypeError(f"Type is not JSON serializable: {type(obj).__name__}")
+
+
+# ─────────── Кодирование ───────────
+def dumps(content: Any) -> bytes:
+    if orjson is not None:
+        return orjson.dumps(content, default=_default, option=orjson.OPT_NON_STR_KEYS)
+    return json.dumps(
+        content,
+        default=_default,
+        ensure_ascii=False,
+        allow_nan=False,
+        separators=(",", ":"),
+    ).encode("utf-8")
+
+
+class FastJSONResponse(JSONResponse):
+    """JSONResponse без повторной валидации и с orjson-кодированием."""
+
+    def render(self, content: Any) -> bytes:
+        return dumps(content)
@@ -1,24 +1,25 @@
-async def _apply_usage_limit(user):
+async def _apply_usage_limit(user, model_key: str | None = None):
     """
     Helper to apply daily usage limit for a user in API routes.
+    model_key — модель, которая ответила (после fallback); по умолчанию — модель активного чата.
     """
-    chat = await get_active_chat(user.id)
-    mk: str = cast(str, chat.model_key)
-    sub_status: SubscriptionStatus = cast(SubscriptionStatus, user.subscription_status)
+    if model_key is None:
+        chat = await db.get_active_chat(user.id)
+        model_key = cast(str, chat.model_key)
+    mk: str = model_key
+    sub_status: SubscriptionStatus = cast("SubscriptionStatus", user.subscription_status)
     try:
-        await check_and_increment_usage(
+        await bot_utils.check_and_increment_usage(
             user_id=user.id,
             model_key=mk,
             subscription_status=sub_status,
         )
-    except LimitExceededError as le:
+    except bot_utils.LimitExceededError as le:
         raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail=str(le))
 # web/routes.py
-from fastapi import APIRouter, Depends, HTTPException, status, File, UploadFile, Form
+from fastapi import APIRouter, Depends, HTTPException, status, File, UploadFile, Form, Header, Request
 from fastapi.security import OAuth2PasswordBearer, OAuth2PasswordRequestForm
 from pydantic import BaseModel, EmailStr, constr
-from db import get_user_by_email
-from db import update_chat_title
 from web.auth import (
     register_user,
     confirm_user_email,
@@ -29,35 +30,71 @@ from web.auth import (
     create_access_token,
     decode_token,
 )
-from bot.ai_service import AIService
-from bot.utils import check_and_increment_usage, LimitExceededError
-from db import get_user_message_count
-from db import (
-    get_or_create_user,
-    get_user_chats,
-    create_chat,
-    set_active_chat,
-    get_active_chat,
-    delete_chat,
-    finish_chat,
-    get_today_total_usage,
-    get_last_limited_messages,
-    reset_today_usage,
-)
-from db import SubscriptionStatus
-from db import get_guest_session
-from config import GUEST_TOTAL_LIMIT, FREE_DAILY_LIMIT
+from config import GUEST_TOTAL_LIMIT, FREE_DAILY_LIMIT, IMAGE_CACHE_ENABLED, METRICS_TOKEN
 
 from typing import cast
 from typing import List
 from fastapi import Query
 from datetime import datetime
-from db import get_today_usage
-
+from typing import TYPE_CHECKING
+from web.responses import FastJSONResponse, message_rows, row_to_dict
+from web.idempotency import chat_flight, payload_hash
+from web.cancellation import estimate_tokens, run_until_disconnect
+from web.model_router import ModelUnavailableError, model_router
+from web.ratelimit import enforce_email_limit, enforce_login_limit, record_login_failure
+from web.image_cache import content_hash, image_cache, image_key
+from web.archive import ensure_chat_hot
+from web.profiling import stage
+from web import metrics
+from web.lazy import lazy_module
+import inspect
+import logging
+import secrets
+
+if TYPE_CHECKING:
+    from db import SubscriptionStatus
+
+# db (SQLAlchemy) и bot.utils импортируются при первом запросе, не при старте
+db = lazy_module("db")
+bot_utils = lazy_module("bot.utils")
+
+logger = logging.getLogger(__name__)
+
+
+# максимум сообщений от USER в одном чате
+MAX_USER_MESSAGES = 200
 
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/api/login/email")
 router = APIRouter(prefix="/api", tags=["api"])
-ai_service = AIService()
+
+
+# ─────────── AI-сервис ───────────
+_ai_service = None
+
+
+def get_ai_service():
+    """
+    Возвращает общий AIService. Создаётся лениво (обычно в lifespan приложения),
+    чтобы импорт web.routes не тянул bot.ai_service и не открывал соединений.
+    """
+    global _ai_service
+    if _ai_service is None:
+        from bot.ai_service import AIService
+        _ai_service = AIService()
+    return _ai_service
+
+
+async def close_ai_service() -> None:
+    """Закрывает AIService при остановке приложения (если он умеет закрываться)."""
+    global _ai_service
+    if _ai_service is None:
+        return
+    close = getattr(_ai_service, "aclose", None) or getattr(_ai_service, "close", None)
+    _ai_service = None
+    if close is not None:
+        result = close()
+        if hasattr(result, "__await__"):
+            await result
 
 
 # ─────────── Schemas ───────────
@@ -148,16 +185,73 @@ async def require_email_user(sub: str = Depends(get_current_subject)) -> str:
     return sub
 
 
+def _check_chat_message_limit(cur_count: int) -> None:
+    if cur_count >= MAX_USER_MESSAGES:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail=f"Лимит в {MAX_USER_MESSAGES} сообщений от вас в одном чате достигнут. Пожалуйста, создайте новый чат."
+        )
+
+
+def _plan(user) -> str:
+    """Тариф пользователя — ключ в MODEL_FALLBACKS."""
+    return "free" if user.subscription_status == db.SubscriptionStatus.FREE else "premium"
+
+
+_no_record_warned = False
+
+
+def _warn_no_record_exchange() -> None:
+    """Один раз на процесс: кэш картинок выключен, пока AIService не умеет record_exchange."""
+    global _no_record_warned
+    if not _no_record_warned:
+        _no_record_warned = True
+        logger.warning("AIService has no record_exchange: image cache bypassed, answers not cached")
+
+
+_model_key_support: dict = {}
+
+
+def _accepts_model_key(method) -> bool:
+    """Умеет ли метод AIService принять model_key (нужно для запасной модели)."""
+    func = getattr(method, "__func__", method)
+    if func not in _model_key_support:
+        params = inspect.signature(method).parameters.values()
+        ok = any(p.name == "model_key" or p.kind is p.VAR_KEYWORD for p in params)
+        if not ok:
+            logger.warning("%s does not accept model_key: model fallback disabled for it", func.__qualname__)
+        _model_key_support[func] = ok
+    return _model_key_support[func]
+
+
+async def _call_model(user, model_key: str, method, *args, primary=None):
+    """
+    Вызов AIService через model_router: основная модель — method(*args)
+    (или primary(), если задан: стрим в WebSocket), запасная —
+    method(*args, model_key=<ключ из MODELS>). Если method не принимает
+    model_key, запасные модели не используются.
+    Возвращает (ответ, ключ ответившей модели).
+    """
+    async def call(mk: str):
+        if mk != model_key:
+            return await method(*args, model_key=mk)
+        return await (primary() if primary is not None else method(*args))
+
+    return await model_router.call(model_key, _plan(user), call, fallback=_accepts_model_key(method))
+
+
 # ─────────── Endpoints ───────────
 
 @router.post("/register", status_code=status.HTTP_201_CREATED)
 async def api_register(body: RegisterIn):
+    await enforce_email_limit("register", str(body.email))
     await register_user(str(body.email), body.password)
     return {"detail": "ok"}
 
 
 @router.post("/confirm")
 async def api_confirm(body: ConfirmIn):
+    await enforce_email_limit("confirm", str(body.email))
     ok = await confirm_user_email(str(body.email), body.code)
     if not ok:
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid code or expired")
@@ -165,8 +259,10 @@ async def api_confirm(body: ConfirmIn):
 
 
 @router.post("/login/email")
-async def api_login_email(form: OAuth2PasswordRequestForm = Depends()):
+async def api_login_email(request: Request, form: OAuth2PasswordRequestForm = Depends()):
+    await enforce_login_limit(request, form.username)
     if not await authenticate_user(form.username, form.password):
+        await record_login_failure(request, form.username)
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="bad credentials or not confirmed"
@@ -192,61 +288,81 @@ async def api_login_guest():
 
 @router.get("/chats")
 async def list_chats(user_email: str = Depends(require_email_user)):
-    user = await get_or_create_user(email=user_email)
-    chats = await get_user_chats(user.id)
-    return chats
+    user = await db.get_or_create_user(email=user_email)
+    chats = await db.get_user_chats(user.id)
+    return FastJSONResponse([row_to_dict(c) for c in chats])
 
 
 @router.post("/chat/message")
 async def chat_text(
+    request: Request,
     data: ChatMsgIn,
     subject: str = Depends(get_current_subject),
+    idempotency_key: str | None = Header(None, alias="Idempotency-Key"),
 ):
-    # Получаем пользователя (может быть как зарегистрированный, так и гостевой)
-    user = await get_or_create_user(email=subject)
-
-    # 1) создать или активировать чат
-    if data.chat_id is None:
-        chat = await create_chat(user.id, user.default_model_key)
-        chat_id = chat.id
-    else:
-        chat_id = data.chat_id
-        await set_active_chat(user.id, chat_id)
-
-    # === НОВАЯ ПРОВЕРКА ЛИМИТА: максимум 200 сообщений от USER в одном чате ===
-    max_user_messages = 200
-    cur_count = await get_user_message_count(chat_id)
-    if cur_count >= max_user_messages:
-        raise HTTPException(
-            status_code=status.HTTP_403_FORBIDDEN,
-            detail=f"Лимит в {max_user_messages} сообщений от вас в одном чате достигнут. Пожалуйста, создайте новый чат."
-        )
-
-    # 2) отправить в AI
-    answer = await ai_service.chat_complete(user.id, data.message)
-
-    # Проверка дневного лимита
-    await _apply_usage_limit(user)
-
-    return {"chat_id": chat_id, "answer": answer}
+    async def _run():
+        # Получаем пользователя (может быть как зарегистрированный, так и гостевой)
+        with stage("db.user"):
+            user = await db.get_or_create_user(email=subject)
+
+        # 1) создать или активировать чат
+        with stage("db.chat"):
+            if data.chat_id is None:
+                chat = await db.create_chat(user.id, user.default_model_key)
+                chat_id = chat.id
+            else:
+                chat_id = data.chat_id
+                await db.set_active_chat(user.id, chat_id)
+                chat = await db.get_active_chat(user.id)
+                # чат мог уйти в архив — возвращаем историю перед ответом модели
+                await ensure_chat_hot(chat)
+
+            # === НОВАЯ ПРОВЕРКА ЛИМИТА: максимум 200 сообщений от USER в одном чате ===
+            cur_count = await db.get_user_message_count(chat_id)
+            _check_chat_message_limit(cur_count)
+
+        # 2) отправить в AI (с hedging/fallback между моделями по тарифу)
+        ai_service = get_ai_service()
+        try:
+            with stage("model"):
+                answer, served_by = await _call_model(
+                    user, cast(str, chat.model_key), ai_service.chat_complete, user.id, data.message
+                )
+        except ModelUnavailableError as e:
+            raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail=str(e))
+
+        # Проверка дневного лимита — по модели, которая ответила
+        with stage("db.usage"):
+            await _apply_usage_limit(user, served_by)
+
+        return {"chat_id": chat_id, "answer": answer}
+
+    # Дубли (двойной клик, повтор) ждут тот же вызов модели, а не платят дважды
+    key = ("text", subject, data.chat_id, payload_hash(data.message))
+    replay_key = (*key, idempotency_key) if idempotency_key else None
+    # клиент закрыл вкладку — отменяем вызов модели, лимит не списывается
+    return await run_until_disconnect(
+        request,
+        chat_flight.do(key, _run, replay_key=replay_key),
+        prompt_tokens=estimate_tokens(data.message),
+    )
 
 
 @router.post("/chat/image")
 async def chat_image(
+    request: Request,
     # chat_id можно передавать как строку: "null" или отсутствует — будет создан новый диалог
     chat_id: str | None = Query(None),
     file: UploadFile = File(...),
     prompt: str | None = Form(None),
     subject: str = Depends(get_current_subject),
+    idempotency_key: str | None = Header(None, alias="Idempotency-Key"),
 ):
     # 1) Доступ только для email-пользователей
     if "@" not in subject:
         raise HTTPException(status_code=403, detail="Only registered users can analyze images")
 
-    # 2) Получаем пользователя
-    user = await get_or_create_user(email=subject)
-
-    # 2.1) Преобразуем параметр chat_id: "null" или "" считаются отсутствием
+    # 2) Преобразуем параметр chat_id: "null" или "" считаются отсутствием
     if chat_id in (None, "", "null"):
         real_chat_id: int | None = None
     else:
@@ -255,15 +371,7 @@ async def chat_image(
         except ValueError:
             raise HTTPException(status_code=422, detail="chat_id должен быть целым числом или null")
 
-    # 2.2) Если chat_id отсутствует, создаем новый чат с моделью vision
-    if real_chat_id is None:
-        chat = await create_chat(user.id, model_key="vision")      # vision – спец-модель для картинок
-        real_chat_id = chat.id
-    else:
-        # Если чат уже существует — принудительно переключаем его модель на vision
-        await set_active_chat(user.id, real_chat_id, model_key="vision")
-
-    # 3) Контроль размера (< 20 MB) и MIME-типа
+    # 3) Контроль размера (< 20 MB) и MIME-типа — до создания чата
     if file.content_type.split("/")[0] != "image":
         raise HTTPException(status_code=415, detail="Only image files are allowed")
     max_size = 20 * 1024 * 1024  # 20 MB
@@ -272,59 +380,109 @@ async def chat_image(
         raise HTTPException(status_code=413, detail="Image is too large (limit 20 MB)")
 
     # 4) Промпт по умолчанию
-    used_prompt = prompt.strip() if prompt and prompt.strip() else (
+    is_default_prompt = not (prompt and prompt.strip())
+    used_prompt = prompt.strip() if not is_default_prompt else (
         "Пожалуйста, проанализируй это изображение и опиши всё, что на нём видно. Отвечай на русском, если тебя не просят ответить на другом языке."
         "Если на нём есть задачи или тесты — также реши их максимально правильно."
     )
 
-    # 5) Анализ изображения (теперь модель гарантированно vision)
-    try:
-        answer = await ai_service.analyze_image_bytes(user.id, image_bytes, used_prompt)
-    except RuntimeError as e:
-        # Здесь ловим случаи, когда внешний API три раза вернул 429/другую ошибку.
-        # Отдаём пользователю явный HTTP 503 (Service Unavailable) с текстом из e.
-        raise HTTPException(
-            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
-            detail=f"Не удалось получить ответ от vision-модели: {e}"
-        )
-
-    # 6) Лимит запросов
-    await _apply_usage_limit(user)
-
-    # 7) Возвращаем и ответ, и id созданного/использованного чата
-    return {"chat_id": real_chat_id, "answer": answer}
+    async def _run():
+        user = await db.get_or_create_user(email=subject)
+
+        # 5) Если chat_id отсутствует, создаем новый чат с моделью vision
+        chat_id_out = real_chat_id
+        if chat_id_out is None:
+            chat = await db.create_chat(user.id, model_key="vision")      # vision – спец-модель для картинок
+            chat_id_out = chat.id
+        else:
+            # Если чат уже существует — принудительно переключаем его модель на vision
+            await db.set_active_chat(user.id, chat_id_out, model_key="vision")
+            # чат мог уйти в архив — возвращаем историю перед ответом модели
+            await ensure_chat_hot(await db.get_active_chat(user.id))
+
+        # 6) Анализ изображения (теперь модель гарантированно vision)
+        ai_service = get_ai_service()
+        # повторная загрузка той же картинки с промптом по умолчанию — ответ из кэша.
+        # Историю чата AIService ведёт сам внутри analyze_image_bytes; ответ из кэша
+        # записываем через record_exchange, а без него кэш обходим — иначе обмен
+        # был бы оплачен лимитом, но не попал бы в историю.
+        record = getattr(ai_service, "record_exchange", None)
+        use_cache = IMAGE_CACHE_ENABLED and is_default_prompt
+        cache_key = image_key(int(user.id), image_hash) if use_cache else None
+        if cache_key and record is None:
+            metrics.incr("image_cache.bypass_no_record")
+            _warn_no_record_exchange()
+            cache_key = None
+        answer = await image_cache.get(cache_key) if cache_key else None
+        served_by = "vision"
+        if answer is not None:
+            with stage("db.history"):
+                await record(user.id, used_prompt, answer)
+        else:
+            try:
+                with stage("model"):
+                    answer, served_by = await _call_model(
+                        user, "vision", ai_service.analyze_image_bytes, user.id, image_bytes, used_prompt
+                    )
+            except RuntimeError as e:
+                # Здесь ловим случаи, когда внешний API три раза вернул 429/другую ошибку.
+                # Отдаём пользователю явный HTTP 503 (Service Unavailable) с текстом из e.
+                raise HTTPException(
+                    status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                    detail=f"Не удалось получить ответ от vision-модели: {e}"
+                )
+            if cache_key:
+                await image_cache.put(cache_key, answer)
+
+        # 7) Лимит запросов — по модели, которая ответила
+        with stage("db.usage"):
+            await _apply_usage_limit(user, served_by)
+
+        # 8) Возвращаем и ответ, и id созданного/использованного чата
+        return {"chat_id": chat_id_out, "answer": answer}
+
+    image_hash = content_hash(image_bytes)
+    key = ("image", subject, real_chat_id, payload_hash(image_hash, used_prompt))
+    replay_key = (*key, idempotency_key) if idempotency_key else None
+    return await run_until_disconnect(
+        request,
+        chat_flight.do(key, _run, replay_key=replay_key),
+        prompt_tokens=estimate_tokens(used_prompt),
+    )
 
 @router.get("/chat/active")
 async def api_active_chat(subject: str = Depends(get_current_subject)):
     if "@" not in subject:
         raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Only registered users can select chats")
-    user = await get_or_create_user(email=subject)
-    chat = await get_active_chat(user.id)
+    user = await db.get_or_create_user(email=subject)
+    chat = await db.get_active_chat(user.id)
     if not chat:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="No active chat")
-    return chat
+    return FastJSONResponse(row_to_dict(chat))
 
 @router.post("/chat/select")
 async def api_select_chat(data: ChatSelectIn, subject: str = Depends(get_current_subject)):
     if "@" not in subject:
         raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Only registered users can select chats")
-    user = await get_or_create_user(email=subject)
-    await set_active_chat(user.id, data.chat_id)
-    chat = await get_active_chat(user.id)
-    return chat
+    user = await db.get_or_create_user(email=subject)
+    await db.set_active_chat(user.id, data.chat_id)
+    chat = await db.get_active_chat(user.id)
+    if chat:
+        await ensure_chat_hot(chat)
+    return FastJSONResponse(row_to_dict(chat) if chat else None)
 
 @router.post("/chat/delete")
 async def api_delete_chat(data: ChatDeleteIn, subject: str = Depends(get_current_subject)):
     if "@" not in subject:
         raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Only registered users can delete chats")
-    await delete_chat(data.chat_id)
+    await db.delete_chat(data.chat_id)
     return {"detail": "chat deleted"}
 
 @router.post("/chat/end")
 async def api_end_chat(data: ChatEndIn, subject: str = Depends(get_current_subject)):
     if "@" not in subject:
         raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Only registered users can end chats")
-    await finish_chat(data.chat_id)
+    await db.finish_chat(data.chat_id)
     return {"detail": "chat ended"}
 
 
@@ -334,26 +492,28 @@ async def api_title_chat(
     email: str = Depends(get_current_subject),
 ):
     # 1) Проверяем, что это пользователь
-    user = await get_user_by_email(email)
+    user = await db.get_user_by_email(email)
     if not user:
         raise HTTPException(403, "Только зарегистрированные могут менять название")
 
     # 2) Проверяем, что чат у него есть
-    chats = await get_user_chats(int(user.id))
+    chats = await db.get_user_chats(int(user.id))
     if data.chat_id not in {c.id for c in chats}:
         raise HTTPException(404, "Чат не найден или нет прав")
 
     # 3) Сохраняем title
-    await update_chat_title(data.chat_id, data.title)
+    await db.update_chat_title(data.chat_id, data.title)
 
     return {"detail": "Название успешно сохранено"}
 
-@router.get("/profile")
-async def api_profile(subject: str = Depends(require_email_user)):
-    user = await get_or_create_user(email=subject)
+async def _build_profile(user, subject: str) -> dict:
+    """
+    Данные профиля (подписка и использование за сегодня).
+    Общая часть для GET /api/profile и push-обновлений по WebSocket.
+    """
     # 1) Если это гостевой аккаунт
     if user.email is None:
-        gs = await get_guest_session(session_token=subject)
+        gs = await db.get_guest_session(session_token=subject)
         return {
             "profile": "guest",
             "used": gs.request_count,
@@ -365,8 +525,8 @@ async def api_profile(subject: str = Depends(require_email_user)):
     today = date.today()
 
     # 2.1) Для Free-подписки — возвращаем общий использованный счётчик
-    if user.subscription_status == SubscriptionStatus.FREE:
-        used_total = await get_today_total_usage(int(user.id), today)
+    if user.subscription_status == db.SubscriptionStatus.FREE:
+        used_total = await db.get_today_total_usage(int(user.id), today)
         return {
             "email": user.email,
             "status": "Бесплатный",
@@ -376,9 +536,9 @@ async def api_profile(subject: str = Depends(require_email_user)):
         }
 
     # 2.2) Для Премиум-подписки — возвращаем разбивку по моделям
-    used_fast  = await get_today_usage(int(user.id), today, model_key="fast")
-    used_smart = await get_today_usage(int(user.id), today, model_key="smart")
-    used_vision= await get_today_usage(int(user.id), today, model_key="vision")
+    used_fast  = await db.get_today_usage(int(user.id), today, model_key="fast")
+    used_smart = await db.get_today_usage(int(user.id), today, model_key="smart")
+    used_vision= await db.get_today_usage(int(user.id), today, model_key="vision")
 
     return {
         "email": user.email,
@@ -391,6 +551,12 @@ async def api_profile(subject: str = Depends(require_email_user)):
         }
     }
 
+
+@router.get("/profile")
+async def api_profile(subject: str = Depends(require_email_user)):
+    user = await db.get_or_create_user(email=subject)
+    return await _build_profile(user, subject)
+
 @router.post("/chat/model")
 async def change_chat_model(
     data: ChangeModelIn,
@@ -401,17 +567,17 @@ async def change_chat_model(
             status_code=status.HTTP_403_FORBIDDEN,
             detail="Only registered users can change chat model"
         )
-    user = await get_or_create_user(email=subject)
+    user = await db.get_or_create_user(email=subject)
 
     # **здесь проверяем подписку**
-    if data.model_key != "fast" and user.subscription_status == SubscriptionStatus.FREE:
+    if data.model_key != "fast" and user.subscription_status == db.SubscriptionStatus.FREE:
         raise HTTPException(
             status_code=status.HTTP_403_FORBIDDEN,
             detail="Model change is not available in free plan"
         )
 
     # теперь меняем
-    await set_active_chat(user.id, data.chat_id, model_key=data.model_key)
+    await db.set_active_chat(user.id, data.chat_id, model_key=data.model_key)
     return {
         "detail": "model changed",
         "chat_id": data.chat_id,
@@ -440,36 +606,45 @@ async def api_get_chat_messages(
         )
 
     # 2) Проверяем, что пользователь владеет этим chat_id
-    user = await get_or_create_user(email=subject)
-    user_chats = await get_user_chats(user.id)
-    if chat_id not in {c.id for c in user_chats}:
+    user = await db.get_or_create_user(email=subject)
+    user_chats = await db.get_user_chats(user.id)
+    chat = next((c for c in user_chats if c.id == chat_id), None)
+    if chat is None:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="Chat not found or no permission",
         )
+    await ensure_chat_hot(chat)
 
     # 3) Получаем из БД список сообщений от старых к новым
-    messages = await get_last_limited_messages(
+    messages = await db.get_last_limited_messages(
         chat_id,
         max_user=max_user,
         max_bot=max_bot
     )
 
-    # 4) Переворачиваем список, чтобы фронтендер не делал .reverse()
-    return [
-        {
-            "id": m.id,
-            "role": m.role.value,
-            "content": m.content,
-            "timestamp": m.timestamp,
-            "prompt_tokens": m.prompt_tokens,
-            "completion_tokens": m.completion_tokens,
-        }
-        for m in reversed(messages)
-    ]
+    # 4) Переворачиваем список, чтобы фронтендер не делал .reverse().
+    #    Отдаём Response напрямую: response_model остаётся только для OpenAPI,
+    #    повторной валидации 240 сообщений через pydantic не происходит.
+    return FastJSONResponse(message_rows(reversed(messages)))
 
 @router.post("/test/reset-usage")
 async def api_reset_usage(email: str = Depends(require_email_user)):
-    user = await get_or_create_user(email=email)
-    await reset_today_usage(user.id)
-    return {"detail": "usage reset"}
\ No newline at end of file
+    user = await db.get_or_create_user(email=email)
+    await db.reset_today_usage(user.id)
+    return {"detail": "usage reset"}
+
+
+@router.get("/metrics", include_in_schema=False)
+async def api_metrics(x_metrics_token: str | None = Header(None)):
+    """Счётчики процесса. Доступно только с X-Metrics-Token == METRICS_TOKEN."""
+    # байты: на не-ASCII str compare_digest бросает TypeError (было бы 500 вместо 404)
+    if not METRICS_TOKEN or not x_metrics_token or not secrets.compare_digest(
+        x_metrics_token.encode(), METRICS_TOKEN.encode()
+    ):
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND)
+    return {
+        "counters": metrics.snapshot(),
+        "chat_flight": chat_flight.stats(),
+        "models": model_router.snapshot(),
+    }
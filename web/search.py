@@ -0,0 +1,168 @@
+# web/search.py
+"""
+Поиск по истории чатов пользователя: GET /api/search?q=...
+
+Результаты ранжированы по релевантности, с фрагментом текста вокруг
+совпадения и постраничной выдачей (limit/offset). Запрос идёт по
+инвертированному индексу message_terms с ключом (user_id, term, message_id)
+(migrations/002_message_terms.sql): читаются только постинги слов запроса
+у этого пользователя, поэтому цена не зависит ни от чужих историй, ни от
+длины своей. Индекс пополняет фоновая задача web/search_index.py.
+Постинги архивных чатов (web/archive.py) сохраняются, текст для фрагмента
+читается из блоба — поиск не возвращает чат в messages.
+"""
+
+import re
+from collections import Counter
+
+from fastapi import APIRouter, Depends, HTTPException, Query, status
+
+from web.archive import unpack_messages
+from web.responses import FastJSONResponse
+from web.routes import db, require_email_user
+
+router = APIRouter(prefix="/api", tags=["search"])
+
+SNIPPET_RADIUS = 80       # символов контекста с каждой стороны
+MAX_TERMS = 8             # слов из запроса, остальные игнорируем
+MIN_TERM_LEN = 3          # короче — не индексируем (предлоги, частицы)
+MAX_TERM_LEN = 64         # = message_terms.term VARCHAR(64)
+MAX_TF = 32767            # = SMALLINT
+
+_TERM_RE = re.compile(r"\w+", re.UNICODE)
+
+
+# ─────────── Слова ───────────
+def _words(text: str):
+    for word in _TERM_RE.findall(text.lower()):
+        if len(word) >= MIN_TERM_LEN:
+            yield word[:MAX_TERM_LEN]
+
+
+def index_terms(content: str) -> dict[str, int]:
+    """Слова сообщения для message_terms: слово → сколько раз встречается."""
+    return {term: min(tf, MAX_TF) for term, tf in Counter(_words(content)).items()}
+
+
+def parse_terms(q: str) -> list[str]:
+    """Слова запроса — так же, как при индексации, без повторов."""
+    terms: list[str] = []
+    for word in _words(q):
+        if word not in terms:
+            terms.append(word)
+    return terms[:MAX_TERMS]
+
+
+def prefix_range(prefix: str) -> tuple[str, str]:
+    """
+    [lo, hi) для term >= lo AND term < hi — все слова с этим префиксом.
+    Последнее слово запроса ищется по префиксу (поиск по мере набора);
+    term в utf8mb4_bin сравнивается по кодам символов, поэтому это
+    диапазонное чтение первичного ключа.
+    """
+    return prefix, prefix[:-1] + chr(ord(prefix[-1]) + 1)
+
+
+# ─────────── Фрагменты ───────────
+def make_snippet(content: str, terms: list[str]) -> dict:
+    """
+    Фрагмент вокруг первого совпадения и позиции совпадений внутри него.
+    Подсветку делает фронтенд по highlights — в тексте нет HTML.
+    """
+    pattern = re.compile(r"\b(?:" + "|".join(map(re.escape, terms)) + ")", re.IGNORECASE)
+    match = pattern.search(content)
+    first = match.start() if match else 0
+    start = max(0, first - SNIPPET_RADIUS)
+    end = min(len(content), first + SNIPPET_RADIUS)
+    # не режем слова посередине
+    if start > 0:
+        space = content.find(" ", start)
+        if 0 <= space < first:
+            start = space + 1
+    if end < len(content):
+        space = content.rfind(" ", first, end)
+        if space > first:
+            end = space
+
+    text = content[start:end]
+    highlights = [[m.start(), m.end()] for m in pattern.finditer(text)]
+
+    return {
+        "text": ("…" if start > 0 else "") + text + ("…" if end < len(content) else ""),
+        "highlights": [[s + (1 if start > 0 else 0), e + (1 if start > 0 else 0)] for s, e in highlights],
+    }
+
+
+# ─────────── Архивные чаты ───────────
+async def _with_content(rows) -> list[dict]:
+    """
+    Строки выдачи как dict; у сообщений архивных чатов content пустой —
+    берём его из блоба (один блоб на чат). Сообщения, которых нет ни там,
+    ни там (удалены между запросами), пропускаем.
+    """
+    archived: dict[int, dict[int, dict]] = {}
+    items = []
+    for r in rows:
+        item = {
+            "id": r.id,
+            "chat_id": r.chat_id,
+            "chat_title": r.chat_title,
+            "role": r.role.value if hasattr(r.role, "value") else r.role,
+            "content": r.content,
+            "timestamp": r.timestamp,
+            "score": float(r.score),
+        }
+        if item["content"] is None:
+            if r.chat_id not in archived:
+                payload = await db.load_archived_chat(r.chat_id)
+                archived[r.chat_id] = {m["id"]: m for m in unpack_messages(payload)} if payload else {}
+            message = archived[r.chat_id].get(r.id)
+            if message is None:
+                continue
+            item.update(role=message["role"], content=message["content"], timestamp=message["timestamp"])
+        items.append(item)
+    return items
+
+
+# ─────────── Endpoint ───────────
+@router.get("/search", summary="Поиск по сообщениям во всех чатах пользователя")
+async def api_search(
+    q: str = Query(..., min_length=1, max_length=200),
+    limit: int = Query(20, ge=1, le=50),
+    offset: int = Query(0, ge=0, le=1000),
+    subject: str = Depends(require_email_user),
+):
+    terms = parse_terms(q)
+    if not terms:
+        raise HTTPException(
+            status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+            detail=f"Запрос должен содержать слово не короче {MIN_TERM_LEN} символов",
+        )
+
+    user = await db.get_or_create_user(email=subject)
+    # берём на одну запись больше, чтобы понять, есть ли следующая страница
+    rows = await db.search_user_messages(
+        user_id=int(user.id),
+        terms=terms[:-1],
+        prefix_range=prefix_range(terms[-1]),
+        limit=limit + 1,
+        offset=offset,
+    )
+    has_more = len(rows) > limit
+    rows = await _with_content(rows[:limit])
+
+    return FastJSONResponse({
+        "items": [
+            {
+                "message_id": r["id"],
+                "chat_id": r["chat_id"],
+                "chat_title": r["chat_title"],
+                "role": r["role"],
+                "timestamp": r["timestamp"],
+                "score": r["score"],
+                "snippet": make_snippet(r["content"], terms),
+            }
+            for r in rows
+        ],
+        "next_offset": offset + limit if has_more else None,
+    })
@@ -0,0 +1,69 @@
+# web/search_index.py
+"""
+Пополнение индекса поиска message_terms (migrations/002_message_terms.sql).
+
+Фоновая задача (запускается в lifespan при SEARCH_INDEX_ENABLED) раз в
+SEARCH_INDEX_INTERVAL_SEC секунд берёт сообщения с id больше отметки
+search_index_state, режет их на слова (web.search.index_terms) и пачкой
+пишет постинги. Первый запуск строит индекс по всей истории теми же
+пачками. Новое сообщение находится поиском через интервал, не сразу.
+
+Повтор пачки безопасен (INSERT IGNORE), но задача не координируется
+между репликами: достаточно включить её на одной.
+"""
+
+import asyncio
+import logging
+import time
+
+from config import SEARCH_INDEX_BATCH_SIZE, SEARCH_INDEX_INTERVAL_SEC
+from web import metrics
+from web.lazy import lazy_module
+from web.search import index_terms
+
+logger = logging.getLogger(__name__)
+
+db = lazy_module("db")
+
+
+def build_postings(messages) -> list[tuple[int, str, int, int, int]]:
+    """(user_id, term, message_id, chat_id, tf) для пачки сообщений."""
+    return [
+        (m.user_id, term, m.id, m.chat_id, tf)
+        for m in messages
+        for term, tf in index_terms(m.content or "").items()
+    ]
+
+
+async def index_pending() -> int:
+    """Индексирует все сообщения после отметки; возвращает их число."""
+    indexed = 0
+    after_id = await db.get_search_watermark()
+    while True:
+        messages = await db.get_unindexed_messages(after_id=after_id, limit=SEARCH_INDEX_BATCH_SIZE)
+        if not messages:
+            return indexed
+        # нарезка слов — CPU; пачка в несколько сотен сообщений — миллисекунды
+        postings = build_postings(messages)
+        after_id = messages[-1].id
+        await db.add_message_terms(postings, last_message_id=after_id)
+        indexed += len(messages)
+        metrics.incr("search_index.messages", len(messages))
+        metrics.incr("search_index.postings", len(postings))
+        if len(messages) < SEARCH_INDEX_BATCH_SIZE:
+            return indexed
+        await asyncio.sleep(0)  # не монополизируем event loop между пачками
+
+
+async def index_loop() -> None:
+    while True:
+        started = time.perf_counter()
+        try:
+            indexed = await index_pending()
+            if indexed:
+                logger.info("Search index: %d messages in %.1fs", indexed, time.perf_counter() - started)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error("Search indexing failed: %s", e)
+        await asyncio.sleep(SEARCH_INDEX_INTERVAL_SEC)
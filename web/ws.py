@@ -0,0 +1,272 @@
+# web/ws.py
+"""
+WebSocket-канал чата: /api/chat/ws?token=<JWT>
+
+Аутентификация и загрузка пользователя выполняются один раз на соединение,
+пользователь кэшируется на время сессии; активный чат в БД утверждается
+на каждое сообщение (его могли сменить в другой вкладке). Ответ модели
+стримится токенами (если AIService умеет стримить), после ответа сервер
+сам пушит обновлённый профиль/лимиты — без отдельного GET /api/profile.
+
+Протокол (JSON-сообщения):
+  клиент → {"type": "message", "chat_id": int | null, "message": str}
+  клиент → {"type": "pong"}
+  сервер → {"type": "ready", "chat_id": int | null}
+  сервер → {"type": "token", "chat_id": int, "data": str}
+  сервер → {"type": "done", "chat_id": int, "answer": str}
+  сервер → {"type": "usage", "profile": {...}}
+  сервер → {"type": "error", "status": int, "detail": str}
+  сервер → {"type": "ping"}
+
+Некорректный JSON — ошибка 400, соединение остаётся открытым;
+бинарный кадр — закрытие с кодом 1003.
+"""
+
+import asyncio
+import json
+import logging
+import time
+from typing import cast
+
+from fastapi import APIRouter, HTTPException, Query, WebSocket, WebSocketDisconnect, status
+
+from web import metrics
+from web.archive import ensure_chat_hot
+from web.auth import decode_token, verify_guest_token
+from web.cancellation import estimate_tokens
+from web.model_router import ModelUnavailableError
+from web.responses import dumps
+from web.routes import (
+    _apply_usage_limit,
+    _build_profile,
+    _call_model,
+    _check_chat_message_limit,
+    db,
+    get_ai_service,
+)
+
+logger = logging.getLogger(__name__)
+
+router = APIRouter(prefix="/api", tags=["ws"])
+
+# ─────────── Настройки канала ───────────
+HEARTBEAT_INTERVAL = 20       # сек между ping от сервера
+HEARTBEAT_TIMEOUT = 60        # сек без входящих сообщений → закрываем
+SEND_QUEUE_SIZE = 256         # исходящие сообщения в очереди на клиента
+SEND_TIMEOUT = 10             # сек ждём место в очереди, иначе клиент «медленный»
+INBOX_SIZE = 4                # запросов к модели в очереди на соединение
+
+# WebSocket close codes
+WS_UNSUPPORTED_DATA = 1003
+WS_POLICY_VIOLATION = 1008
+WS_INTERNAL_ERROR = 1011
+WS_TRY_AGAIN_LATER = 1013
+
+
+class SlowClientError(Exception):
+    """Клиент не успевает читать исходящие сообщения."""
+
+
+class ChatSession:
+    """Состояние одного WebSocket-соединения."""
+
+    def __init__(self, websocket: WebSocket, subject: str, user):
+        self.ws = websocket
+        self.subject = subject
+        self.user = user
+        self.is_guest = "@" not in subject
+        self.chat_id: int | None = None
+        # кэш числа сообщений пользователя по чатам (чтобы не считать в БД каждый раз)
+        self.user_msg_counts: dict[int, int] = {}
+        self.outbox: asyncio.Queue = asyncio.Queue(maxsize=SEND_QUEUE_SIZE)
+        self.inbox: asyncio.Queue = asyncio.Queue(maxsize=INBOX_SIZE)
+        self.last_seen = time.monotonic()
+
+    async def send(self, message: dict) -> None:
+        """
+        Кладёт сообщение в очередь отправки. Если клиент не читает и очередь
+        полна дольше SEND_TIMEOUT — это backpressure: производитель (стрим модели)
+        ждёт, а затем соединение закрывается.
+        """
+        try:
+            await asyncio.wait_for(self.outbox.put(message), SEND_TIMEOUT)
+        except asyncio.TimeoutError:
+            raise SlowClientError from None
+
+    async def send_error(self, status_code: int, detail: str) -> None:
+        await self.send({"type": "error", "status": status_code, "detail": detail})
+
+    # ─────────── Задачи соединения ───────────
+    async def sender(self) -> None:
+        while True:
+            message = await self.outbox.get()
+            await self.ws.send_text(dumps(message).decode("utf-8"))
+
+    async def receiver(self) -> None:
+        while True:
+            frame = await self.ws.receive()
+            if frame["type"] == "websocket.disconnect":
+                raise WebSocketDisconnect(frame.get("code", 1000))
+            self.last_seen = time.monotonic()
+            if frame.get("text") is None:
+                # протокол — только текстовые JSON-кадры
+                await self.ws.close(code=WS_UNSUPPORTED_DATA, reason="text frames only")
+                return
+            try:
+                data = json.loads(frame["text"])
+            except ValueError:
+                # битый кадр не рвёт соединение — клиент получает ошибку и может продолжать
+                await self.send_error(status.HTTP_400_BAD_REQUEST, "invalid JSON")
+                continue
+            kind = data.get("type") if isinstance(data, dict) else None
+            if kind == "pong":
+                continue
+            if kind != "message":
+                await self.send_error(status.HTTP_400_BAD_REQUEST, "unknown message type")
+                continue
+            try:
+                self.inbox.put_nowait(data)
+            except asyncio.QueueFull:
+                await self.send_error(status.HTTP_429_TOO_MANY_REQUESTS, "Слишком много запросов подряд")
+
+    async def heartbeat(self) -> None:
+        while True:
+            await asyncio.sleep(HEARTBEAT_INTERVAL)
+            if time.monotonic() - self.last_seen > HEARTBEAT_TIMEOUT:
+                await self.ws.close(code=WS_POLICY_VIOLATION, reason="heartbeat timeout")
+                return
+            await self.send({"type": "ping"})
+
+    async def worker(self) -> None:
+        while True:
+            data = await self.inbox.get()
+            try:
+                await self.handle_message(data)
+            except HTTPException as e:
+                await self.send_error(e.status_code, str(e.detail))
+            except asyncio.CancelledError:
+                # соединение закрыто посреди ответа — вызов модели отменён вместе с задачей
+                metrics.incr("chat.client_disconnected")
+                metrics.incr("chat.saved_prompt_tokens_est", estimate_tokens(data.get("message")))
+                raise
+            except SlowClientError:
+                raise
+            except Exception as e:
+                logger.error("WebSocket message failed for %s: %s", self.subject, e)
+                await self.send_error(status.HTTP_503_SERVICE_UNAVAILABLE, "Не удалось получить ответ модели")
+
+    # ─────────── Обработка сообщения ───────────
+    async def _resolve_chat(self, chat_id: int | None):
+        # как и в REST: chat_id=None — новый чат
+        if chat_id is None:
+            chat = await db.create_chat(self.user.id, self.user.default_model_key)
+            self.chat_id = chat.id
+            self.user_msg_counts[chat.id] = 0
+            return chat
+        # AIService пишет ответ в активный чат БД, а его могли сменить в другой
+        # вкладке, на другом устройстве или загрузкой картинки — поэтому активный
+        # чат утверждается на каждое сообщение, а не берётся из кэша сессии
+        await db.set_active_chat(self.user.id, chat_id)
+        chat = await db.get_active_chat(self.user.id)
+        if chat:
+            await ensure_chat_hot(chat)
+        self.chat_id = chat_id
+        return chat
+
+    async def handle_message(self, data: dict) -> None:
+        text = data.get("message")
+        if not isinstance(text, str) or not text.strip():
+            raise HTTPException(status.HTTP_422_UNPROCESSABLE_ENTITY, "message must be a non-empty string")
+
+        # гостевой лимит считается на каждый запрос, как и в REST
+        if self.is_guest and not await verify_guest_token(self.subject):
+            raise HTTPException(status.HTTP_403_FORBIDDEN, "Guest limit exceeded")
+
+        chat_id = data.get("chat_id")
+        if chat_id is not None and not isinstance(chat_id, int):
+            raise HTTPException(status.HTTP_422_UNPROCESSABLE_ENTITY, "chat_id должен быть целым числом или null")
+        chat = await self._resolve_chat(chat_id)
+        if chat is None:
+            raise HTTPException(status.HTTP_404_NOT_FOUND, "Chat not found")
+        chat_id = chat.id
+
+        if chat_id not in self.user_msg_counts:
+            self.user_msg_counts[chat_id] = await db.get_user_message_count(chat_id)
+        _check_chat_message_limit(self.user_msg_counts[chat_id])
+
+        # как в REST: через model_router (hedging, fallback, breaker); стримит
+        # только основная модель, ответ запасной приходит целиком в "done"
+        ai_service = get_ai_service()
+        stream = getattr(ai_service, "chat_stream", None)
+
+        async def stream_primary() -> str:
+            parts = []
+            async for token in stream(self.user.id, text):
+                parts.append(token)
+                await self.send({"type": "token", "chat_id": chat_id, "data": token})
+            return "".join(parts)
+
+        try:
+            answer, served_by = await _call_model(
+                self.user,
+                cast(str, chat.model_key),
+                ai_service.chat_complete,
+                self.user.id,
+                text,
+                primary=stream_primary if stream is not None else None,
+            )
+        except ModelUnavailableError as e:
+            raise HTTPException(status.HTTP_503_SERVICE_UNAVAILABLE, str(e))
+        self.user_msg_counts[chat_id] += 1
+
+        await _apply_usage_limit(self.user, served_by)
+        await self.send({"type": "done", "chat_id": chat_id, "answer": answer})
+
+        if not self.is_guest:
+            await self.send({"type": "usage", "profile": await _build_profile(self.user, self.subject)})
+
+
+@router.websocket("/chat/ws")
+async def chat_ws(websocket: WebSocket, token: str = Query(...)):
+    # 1) Аутентификация — один раз на соединение
+    subject = await decode_token(token)
+    if not subject:
+        await websocket.close(code=WS_POLICY_VIOLATION, reason="unauthorized")
+        return
+    await websocket.accept()
+
+    user = await db.get_or_create_user(email=subject)
+    session = ChatSession(websocket, subject, user)
+    if not session.is_guest:
+        active = await db.get_active_chat(user.id)
+        if active:
+            await ensure_chat_hot(active)
+        session.chat_id = active.id if active else None
+    await session.send({"type": "ready", "chat_id": session.chat_id})
+
+    # 2) Приём, обработка, отправка и heartbeat — отдельные задачи
+    tasks = [
+        asyncio.create_task(session.sender()),
+        asyncio.create_task(session.receiver()),
+        asyncio.create_task(session.worker()),
+        asyncio.create_task(session.heartbeat()),
+    ]
+    try:
+        done, _ = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+        for task in done:
+            exc = task.exception()
+            if isinstance(exc, SlowClientError):
+                try:
+                    await websocket.close(code=WS_TRY_AGAIN_LATER, reason="slow consumer")
+                except RuntimeError:
+                    pass  # соединение уже закрыто
+            elif exc is not None and not isinstance(exc, WebSocketDisconnect):
+                logger.error("WebSocket session failed: %s", exc)
+                try:
+                    await websocket.close(code=WS_INTERNAL_ERROR, reason="internal error")
+                except RuntimeError:
+                    pass
+    finally:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)